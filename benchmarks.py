@@ -0,0 +1,278 @@
+"""benchmarks.py"""
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from itertools import product
+import numpy as np
+from cells import ImmuneCell, EMPTY
+from immune_utils import recruit_immune_cells
+from simulation import Simulation, ENGINES
+
+SIZES = (50, 200, 500, 1000, 2000)
+QUICK_SIZES = (50, 200)
+TUMOR_FILLS = (0.01, 0.05, 0.2)
+IMMUNE_DENSITIES = (0.0, 0.01)
+HISTORY_FILE = "benchmarks.jsonl"
+NEAREST_QUERIES = 1000
+
+
+def tumor_radius(size: int, fill: float, dims: int = 2) -> int:
+    """Return the radius of the initial tumor disc (ball if dims is 3) covering about `fill` of the grid."""
+    if dims == 3:
+        return max(1, round(size * (3 * fill / (4 * math.pi)) ** (1 / 3)))
+    return max(1, round(size * math.sqrt(fill / math.pi)))
+
+
+def build_simulation(engine: str, size: int, fill: float, immune: float, seed: int = 0) -> Simulation:
+    """
+    Build the state a benchmark case starts from.
+
+    A circular (spherical on the 3D engine) tumor covers a fraction `fill` of the grid
+    and immune cells occupy a fraction `immune` of the grid at random empty sites.
+    """
+    dims = 3 if engine == "vectorized3d" else 2
+    simulation = Simulation(size, initial_tumor_radius=tumor_radius(size, fill, dims), parameters={},
+                            engine=engine, seed=seed)
+    grid = simulation.grid
+    count = int(immune * size ** dims)
+    if hasattr(grid, "sample_empty_positions"):
+        positions = grid.sample_empty_positions(count)
+    else:
+        empty = np.flatnonzero(grid.codes.ravel() == EMPTY)
+        sites = simulation.rng.generator.choice(empty, min(count, len(empty)), replace=False)
+        positions = [tuple(position) for position in np.transpose(np.unravel_index(sites, grid.codes.shape)).tolist()]
+    for position in positions:
+        grid.add_cell(ImmuneCell(position, cell_type=simulation.rng.randrange(2), rng=simulation.rng))
+    return simulation
+
+
+def _nearest_queries(simulation: Simulation):
+    grid = simulation.grid
+    positions = simulation.rng.generator.integers(0, (grid.rows, grid.cols), size=(NEAREST_QUERIES, 2)).tolist()
+    return lambda: [grid.nearest_tumor_distance(tuple(position)) for position in positions]
+
+
+def _recruitment(simulation: Simulation):
+    grid = simulation.grid
+    kills = max(10, grid.rows * grid.cols // 1000)
+    return lambda: recruit_immune_cells(grid, kills, 0)
+
+
+# name -> (engines it runs on, function returning the timed callable for a prepared simulation).
+# "initialize_tumor" times building the simulation itself.
+BENCHMARKS = {
+    "initialize_tumor": (tuple(ENGINES), None),
+    "make_action": (tuple(ENGINES), lambda simulation: simulation.grid.make_action),
+    "apply_chemotherapy": (tuple(ENGINES), lambda simulation: simulation.grid.apply_chemotherapy),
+    "apply_immunotherapy": (tuple(ENGINES), lambda simulation: simulation.grid.apply_immunotherapy),
+    "recruit_immune_cells": (("object", "sparse"), _recruitment),
+    "nearest_tumor_distance": (("object", "sparse"), _nearest_queries),
+}
+
+
+def time_benchmark(name: str, engine: str, size: int, fill: float, immune: float,
+                   repeats: int = 3, seed: int = 0) -> list[float]:
+    """
+    Return the wall times (seconds) of `repeats` runs of a benchmark.
+
+    Every run starts from a freshly built simulation; building it is not timed,
+    except for "initialize_tumor" where building is the measured operation.
+    """
+    _, prepare = BENCHMARKS[name]
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        simulation = build_simulation(engine, size, fill, immune, seed)
+        if prepare is None:
+            times.append(time.perf_counter() - start)
+            continue
+        operation = prepare(simulation)
+        start = time.perf_counter()
+        operation()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run_benchmarks(engines=("object",), sizes=SIZES, fills=TUMOR_FILLS, immune_densities=IMMUNE_DENSITIES,
+                   benchmarks=tuple(BENCHMARKS), repeats: int = 3, seed: int = 0, report=None) -> list[dict]:
+    """
+    Run every benchmark on every case of the matrix.
+
+    Args:
+        report (callable): Called with every result as soon as it is measured.
+
+    Returns:
+        One result per (benchmark, engine, size, fill, immune) with the median and
+        minimum wall time in seconds.
+    """
+    results = []
+    for engine, size, fill, immune, name in product(engines, sizes, fills, immune_densities, benchmarks):
+        if engine not in BENCHMARKS[name][0]:
+            continue
+        times = time_benchmark(name, engine, size, fill, immune, repeats, seed)
+        result = {
+            "benchmark": name, "engine": engine, "size": size, "fill": fill, "immune": immune,
+            "median": statistics.median(times), "min": min(times), "repeats": repeats,
+        }
+        results.append(result)
+        if report is not None:
+            report(result)
+    return results
+
+
+def result_key(result: dict) -> tuple:
+    return result["benchmark"], result["engine"], result["size"], result["fill"], result["immune"]
+
+
+def _git_revision() -> str:
+    """Return the revision of the benchmarked code, with "-dirty" if it has uncommitted changes."""
+    root = os.path.dirname(os.path.abspath(__file__))
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return revision + ("-dirty" if dirty else "")
+
+
+def append_history(path: str, results: list[dict], label: str = None) -> dict:
+    """Append a run with its environment to the JSON Lines history file and return it."""
+    run = {
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": _git_revision(),
+        "label": label,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(run) + "\n")
+    return run
+
+
+def read_history(path: str) -> list[dict]:
+    """Return the runs stored in a history file, oldest first."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def find_run(runs: list[dict], ref: str) -> dict:
+    """Find a run by index into the history (negative counts from the end), revision prefix or label."""
+    try:
+        return runs[int(ref)]
+    except ValueError:
+        pass
+    except IndexError:
+        raise ValueError(f"No run with index {ref} in the history.") from None
+    for run in reversed(runs):
+        if run.get("label") == ref or (run.get("revision") or "").startswith(ref):
+            return run
+    raise ValueError(f"No run matches {ref!r}.")
+
+
+def compare_runs(base: dict, new: dict, threshold: float = 1.2, min_time: float = 1e-3) -> list[dict]:
+    """
+    Compare the median times of two runs on the cases both contain.
+
+    Returns:
+        One row per case with the base and new medians, their ratio and a status:
+        "regression" if new / base > threshold, "improvement" if base / new > threshold,
+        "ok" otherwise. Cases where both medians are below `min_time` seconds are
+        dominated by timer noise and always "ok".
+    """
+    if threshold <= 1:
+        raise ValueError("Threshold must be greater than 1.")
+    base_results = {result_key(result): result for result in base["results"]}
+    rows = []
+    for result in new["results"]:
+        key = result_key(result)
+        if key not in base_results:
+            continue
+        before, after = base_results[key]["median"], result["median"]
+        ratio = after / before if before > 0 else math.inf
+        if max(before, after) < min_time:
+            status = "ok"
+        elif ratio > threshold:
+            status = "regression"
+        elif ratio < 1 / threshold:
+            status = "improvement"
+        else:
+            status = "ok"
+        rows.append({"key": key, "base": before, "new": after, "ratio": ratio, "status": status})
+    return rows
+
+
+def _format_case(key: tuple) -> str:
+    name, engine, size, fill, immune = key
+    return f"{name:<24}{engine:<12}{size:>6}{fill:>8.2f}{immune:>8.3f}"
+
+
+def parse_args(argv=None):
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Benchmark the simulation core.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Run the benchmark matrix and append it to the history.")
+    run.add_argument("--engines", nargs="+", choices=sorted(ENGINES), default=["object"], help="Grid implementations.")
+    run.add_argument("--sizes", nargs="+", type=int, default=None, help=f"Grid sizes (default {SIZES}).")
+    run.add_argument("--quick", action="store_true", help=f"Only the sizes {QUICK_SIZES}.")
+    run.add_argument("--fills", nargs="+", type=float, default=list(TUMOR_FILLS), help="Tumor fill fractions.")
+    run.add_argument("--immune", nargs="+", type=float, default=list(IMMUNE_DENSITIES),
+                     help="Immune cell densities.")
+    run.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS),
+                     help="Benchmarks to run.")
+    run.add_argument("--repeats", type=int, default=3, help="Runs per case, the median is recorded.")
+    run.add_argument("--seed", type=int, default=0, help="Seed of the benchmark states.")
+    run.add_argument("--label", default=None, help="Name of the run in the history.")
+    run.add_argument("--history", default=HISTORY_FILE, help="JSON Lines history file.")
+
+    compare = commands.add_parser("compare", help="Compare two runs of the history.")
+    compare.add_argument("base", nargs="?", default="-2", help="Base run: index, revision prefix or label.")
+    compare.add_argument("new", nargs="?", default="-1", help="New run: index, revision prefix or label.")
+    compare.add_argument("--threshold", type=float, default=1.2,
+                         help="Slowdown ratio of the median above which a case is a regression.")
+    compare.add_argument("--min-time", type=float, default=1e-3,
+                         help="Never flag cases where both medians are below this many seconds.")
+    compare.add_argument("--history", default=HISTORY_FILE, help="JSON Lines history file.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.command == "run":
+        sizes = args.sizes or (QUICK_SIZES if args.quick else SIZES)
+        print(f"{'benchmark':<24}{'engine':<12}{'size':>6}{'fill':>8}{'immune':>8}{'median s':>12}{'min s':>12}")
+        results = run_benchmarks(
+            args.engines, sizes, args.fills, args.immune, args.benchmarks, args.repeats, args.seed,
+            report=lambda result: print(f"{_format_case(result_key(result))}"
+                                        f"{result['median']:>12.5f}{result['min']:>12.5f}", flush=True),
+        )
+        run = append_history(args.history, results, args.label)
+        print(f"Recorded {len(results)} results of revision {run['revision']} in {args.history}")
+        return 0
+
+    runs = read_history(args.history)
+    base, new = find_run(runs, args.base), find_run(runs, args.new)
+    rows = compare_runs(base, new, args.threshold, args.min_time)
+    print(f"base: {base['revision']} {base['time']}   new: {new['revision']} {new['time']}")
+    print(f"{'benchmark':<24}{'engine':<12}{'size':>6}{'fill':>8}{'immune':>8}{'base s':>12}{'new s':>12}{'ratio':>8}")
+    for row in rows:
+        flag = {"regression": "  REGRESSION", "improvement": "  improved"}.get(row["status"], "")
+        print(f"{_format_case(row['key'])}{row['base']:>12.5f}{row['new']:>12.5f}{row['ratio']:>8.2f}{flag}")
+    regressions = sum(row["status"] == "regression" for row in rows)
+    print(f"{len(rows)} cases compared, {regressions} regressions (threshold {args.threshold:g}x)")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
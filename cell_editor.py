@@ -1,15 +1,29 @@
 import json
-import openai
+from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QLabel, QLineEdit, QTextEdit,
     QPushButton, QFileDialog, QMessageBox
 )
+from cell_generation import OpenAIBackend, GenerationCache, GenerationTask
 
 class CellEditor(QWidget):
-    def __init__(self, api_key):
+    def __init__(self, api_key, backend=None, cache: GenerationCache = None, timeout: float = 60.0):
+        """
+        Args:
+            api_key (str): OpenAI API key, used when no backend is given.
+            backend: Object with `name` and `generate(name, description)`, OpenAIBackend if None.
+            cache (GenerationCache): Cache of generated cells, GenerationCache() if None.
+            timeout (float): Seconds after which a running generation is abandoned.
+        """
         super().__init__()
         self.api_key = api_key
-        self.client = openai.OpenAI(api_key=self.api_key)
+        self.backend = backend or OpenAIBackend(api_key, timeout=timeout)
+        self.cache = cache if cache is not None else GenerationCache()
+        self.timeout = timeout
+        self.task = None
+        self.timeout_timer = QTimer(self)
+        self.timeout_timer.setSingleShot(True)
+        self.timeout_timer.timeout.connect(self.generation_timed_out)
         self.init_ui()
 
     def init_ui(self):
@@ -27,7 +41,7 @@ class CellEditor(QWidget):
         layout.addWidget(self.description_input)
 
         self.generate_button = QPushButton("Згенерувати JSON")
-        self.generate_button.clicked.connect(self.generate_json)
+        self.generate_button.clicked.connect(self.toggle_generation)
         layout.addWidget(self.generate_button)
 
         self.json_output = QTextEdit()
@@ -40,40 +54,58 @@ class CellEditor(QWidget):
 
         self.setLayout(layout)
 
+    def toggle_generation(self):
+        """Start a generation, or cancel the running one"""
+        if self.task is not None:
+            self.cancel_generation()
+        else:
+            self.generate_json()
+
     def generate_json(self):
+        """Show the cached cell for the name and description, or start generating it in the background"""
         description = self.description_input.toPlainText().strip()
         name = self.name_input.text().strip()
-        openai.api_key = self.api_key
-
-        prompt = (
-            f"Назва клітини: {name}\n"
-            f"Опис: {description}\n\n"
-            "Згенеруй JSON-структуру клітини для симуляції. "
-            "Формат має бути такий:\n"
-            "{\n"
-            '  "type": "immune" або "tumor",\n'
-            f'  "name": "{name}",\n'
-            '  "color": [R, G, B],\n'
-            '  "rates": {\n'
-            '    "apoptosis": float,\n'
-            '    "proliferation": float,\n'
-            '    "migration": float\n'
-            '  }\n'
-            "}\n"
-            "Поверни лише валідний JSON без пояснень чи коментарів."
-        )
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "Ти генератор клітин для симулятора."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            result = response.choices[0].message.content.strip()
+        cached = self.cache.get(self.backend.name, name, description)
+        if cached is not None:
+            self.json_output.setPlainText(cached)
+            return
+
+        # Not parented to the editor: a cancelled task keeps running after the editor is closed.
+        task = GenerationTask(self.backend, name, description, self.cache)
+        task.succeeded.connect(lambda result: self.generation_succeeded(task, result))
+        task.failed.connect(lambda message: self.generation_failed(task, message))
+        self.task = task
+        self.generate_button.setText("Скасувати")
+        self.timeout_timer.start(int(self.timeout * 1000))
+        task.start()
+
+    def cancel_generation(self):
+        """Stop waiting for the running generation"""
+        if self.task is None:
+            return
+        self.task.cancel()
+        self.task = None
+        self.timeout_timer.stop()
+        self.generate_button.setText("Згенерувати JSON")
+
+    def generation_succeeded(self, task, result):
+        if task is self.task:
+            self.cancel_generation()
             self.json_output.setPlainText(result)
-        except Exception as e:
-            QMessageBox.critical(self, "Помилка", str(e))
+
+    def generation_failed(self, task, message):
+        if task is self.task:
+            self.cancel_generation()
+            QMessageBox.critical(self, "Помилка", message)
+
+    def generation_timed_out(self):
+        if self.task is not None:
+            self.cancel_generation()
+            QMessageBox.critical(self, "Помилка", f"Час очікування відповіді ({self.timeout:g} с) вичерпано.")
+
+    def closeEvent(self, event):
+        self.cancel_generation()
+        super().closeEvent(event)
 
     def save_cell(self):
         try:
@@ -0,0 +1,187 @@
+"""cell_generation.py"""
+import hashlib
+import json
+import os
+import zlib
+from PyQt5.QtCore import QCoreApplication, QThread, pyqtSignal
+from parameters import DEFAULT_PARAMETERS
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "tumor_simulation", "cells")
+IMMUNE_KEYWORDS = ("immune", "імун", "лімфоцит", "lymphocyte", "nk", "ctl", "t-cell", "т-кліт")
+
+
+def build_prompt(name: str, description: str) -> str:
+    """Return the prompt asking a language model for the JSON of a cell."""
+    return (
+        f"Назва клітини: {name}\n"
+        f"Опис: {description}\n\n"
+        "Згенеруй JSON-структуру клітини для симуляції. "
+        "Формат має бути такий:\n"
+        "{\n"
+        '  "type": "immune" або "tumor",\n'
+        f'  "name": "{name}",\n'
+        '  "color": [R, G, B],\n'
+        '  "rates": {\n'
+        '    "apoptosis": float,\n'
+        '    "proliferation": float,\n'
+        '    "migration": float\n'
+        '  }\n'
+        "}\n"
+        "Поверни лише валідний JSON без пояснень чи коментарів."
+    )
+
+
+class OpenAIBackend:
+    """
+    Generate cells with an OpenAI-compatible chat completions API.
+
+    The client is created on the first request. `base_url` points the backend at any
+    compatible server, e.g. a local stub server in tests.
+    """
+    name = "openai"
+
+    def __init__(self, api_key: str, model: str = "gpt-4", base_url: str = None, timeout: float = 60.0):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url
+        self.timeout = timeout
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import openai
+            self._client = openai.OpenAI(api_key=self.api_key, base_url=self.base_url,
+                                         timeout=self.timeout, max_retries=0)
+        return self._client
+
+    def generate(self, name: str, description: str) -> str:
+        """Return the JSON text of a cell generated from its name and description."""
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": "Ти генератор клітин для симулятора."},
+                {"role": "user", "content": build_prompt(name, description)}
+            ]
+        )
+        return response.choices[0].message.content.strip()
+
+
+class OfflineBackend:
+    """
+    Generate cells locally without a network connection.
+
+    The type is guessed from keywords of the description, the rates are the default
+    parameters of that type and the color is derived from the name.
+    """
+    name = "offline"
+
+    def generate(self, name: str, description: str) -> str:
+        """Return the JSON text of a cell generated from its name and description."""
+        text = f"{name} {description}".lower()
+        cell_type = "immune" if any(word in text for word in IMMUNE_KEYWORDS) else "tumor"
+        defaults = DEFAULT_PARAMETERS["immune" if cell_type == "immune" else "regular_tumor"]
+        color = zlib.crc32(name.encode("utf-8")).to_bytes(4, "little")[:3]
+        cell = {
+            "type": cell_type,
+            "name": name,
+            "color": list(color),
+            "rates": {
+                "apoptosis": defaults["apoptosis_rate"],
+                "proliferation": defaults["proliferation_rate"],
+                "migration": defaults["migration_rate"],
+            },
+        }
+        return json.dumps(cell, ensure_ascii=False, indent=2)
+
+
+class GenerationCache:
+    """
+    On-disk cache of generated cells, one JSON file per (backend, name, description).
+
+    Only responses that parse as JSON are stored.
+    """
+    def __init__(self, path: str = DEFAULT_CACHE_DIR):
+        self.path = path
+
+    def _file(self, backend_name: str, name: str, description: str) -> str:
+        key = json.dumps([backend_name, name, description], ensure_ascii=False)
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.path, f"{digest}.json")
+
+    def get(self, backend_name: str, name: str, description: str) -> str:
+        """Return the cached JSON text, None if there is none."""
+        try:
+            with open(self._file(backend_name, name, description), "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, backend_name: str, name: str, description: str, result: str):
+        """Store a generated JSON text."""
+        try:
+            json.loads(result)
+        except json.JSONDecodeError:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        path = self._file(backend_name, name, description)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(result)
+        os.replace(path + ".tmp", path)
+
+
+class GenerationTask(QThread):
+    """
+    Run one generation request off the GUI thread.
+
+    Emits `succeeded(result)` or `failed(message)` unless the task was cancelled; a
+    cancelled request is left to finish (or time out) in the background and its result
+    is still stored in the cache. Started tasks are kept alive by the class until they
+    finish, so they can outlive the widget that started them, and the application waits
+    for them before it quits.
+    """
+    succeeded = pyqtSignal(str)
+    failed = pyqtSignal(str)
+    _running: set = set()
+    _wait_on_quit = False
+
+    def __init__(self, backend, name: str, description: str, cache: GenerationCache = None, parent=None):
+        super().__init__(parent)
+        self.backend = backend
+        self.cell_name = name
+        self.description = description
+        self.cache = cache
+        self.cancelled = False
+
+    def cancel(self):
+        """Drop the result of the request."""
+        self.cancelled = True
+
+    def start(self):
+        """Start the request in its own thread."""
+        cls = GenerationTask
+        app = QCoreApplication.instance()
+        if app is not None and not cls._wait_on_quit:
+            app.aboutToQuit.connect(cls.wait_all)
+            cls._wait_on_quit = True
+        cls._running.add(self)
+        self.finished.connect(lambda: cls._running.discard(self))
+        super().start()
+
+    @classmethod
+    def wait_all(cls):
+        """Block until all started tasks have finished."""
+        for task in list(cls._running):
+            task.wait()
+
+    def run(self):
+        try:
+            result = self.backend.generate(self.cell_name, self.description)
+        except Exception as error:
+            if not self.cancelled:
+                self.failed.emit(str(error))
+            return
+        if self.cache is not None:
+            self.cache.put(self.backend.name, self.cell_name, self.description, result)
+        if not self.cancelled:
+            self.succeeded.emit(result)
@@ -1,5 +1,17 @@
 """cells.py"""
 import random
+from events import (
+    ATTACK, APOPTOSIS, SENESCENCE, CHEMOTHERAPY, PROLIFERATION, KILL, ATTACK_FAILURE,
+    EXHAUSTION, LIFESPAN,
+)
+
+# Integer codes of cell types used by array-based representations of the grid.
+EMPTY = 0
+GENERIC = 1
+REGULAR_TUMOR = 2
+STEM_TUMOR = 3
+IMMUNE_NK = 4
+IMMUNE_CTL = 5
 
 class Cell:
     """Class representing a cell in a grid."""
@@ -8,24 +20,29 @@ class Cell:
     DEATH_CHEMOTHERAPY_CHANCE = 0.02
     CHEMOTHERAPY_RESISTANCE_INCREASE = 0.01
 
-    def __init__(self, position: tuple[int, int], proliferation_decrease_coef: float=0.0, chemotherapy_resistance: float=None):
-        """Initialize the cell with coordinates on a grid"""
+    def __init__(self, position: tuple[int, int], proliferation_decrease_coef: float=0.0, chemotherapy_resistance: float=None, rng=None):
+        """
+        Initialize the cell with coordinates on a grid.
+
+        `rng` is the random stream of the grid (`grid.rng`), the global `random` module if None.
+        """
         self.position = position  # Tuple of (x, y) coordinates on a grid
         self.is_tumor_cell = False
         self.proliferation_decrease_coef = proliferation_decrease_coef
-        self.chemotherapy_resistance = self.__beta_skewed() if chemotherapy_resistance is None else chemotherapy_resistance
+        self.chemotherapy_resistance = self.__beta_skewed(rng or random) if chemotherapy_resistance is None else chemotherapy_resistance
 
     @staticmethod
-    def __beta_skewed(alpha: float = 0.5) -> float:
+    def __beta_skewed(rng, alpha: float = 0.5) -> float:
         """
         Draw a sample from Beta(alpha, 1), skewed toward 0 when alpha < 1.
         
         Args:
+            rng: random stream to draw from.
             alpha: shape parameter (alpha < 1 biases samples toward 0).
         Returns:
             A float in (0,1).
         """
-        return random.betavariate(alpha, 1.0)
+        return rng.betavariate(alpha, 1.0)
 
     @classmethod
     def set_rates(cls, apoptosis_rate: float, proliferation_rate: float, migration_rate: float):
@@ -44,38 +61,39 @@ class Cell:
 
     def make_action(self, grid):
         """Determine the action of the cell based on its rates."""
-        if random.random() <= self.RATES['apoptosis']:
+        rng = grid.rng
+        if rng.random() <= self.RATES['apoptosis']:
             self.apoptosis(grid)
-        elif random.random() <= self.RATES['proliferation'] * (1-self.proliferation_decrease_coef):
+        elif rng.random() <= self.RATES['proliferation'] * (1-self.proliferation_decrease_coef):
             self.proliferation(grid)
-        elif random.random() <= self.RATES['migration']:
+        elif rng.random() <= self.RATES['migration']:
             self.migration(grid)
         else:
             self.quiscence()
 
-    def __die(self, grid):
+    def __die(self, grid, cause: int):
         """Cell dies."""
-        grid.remove_cell(self)
+        grid.remove_cell(self, cause)
 
-    def apoptosis(self, grid):
+    def apoptosis(self, grid, cause: int = APOPTOSIS):
         """Cell undergoes apoptosis."""
-        self.__die(grid)
+        self.__die(grid, cause)
 
     def proliferation(self, grid):
         """Cell proliferates to an empty neighboring cell."""
         # print(f"Cell at {self.position} proliferates.")
         empty_neighbors = grid.empty_neighbors(self)
         if empty_neighbors:
-            new_position = random.choice(empty_neighbors)
+            new_position = grid.rng.choice(empty_neighbors)
             new_cell = Cell(new_position, self.proliferation_decrease_coef, self.chemotherapy_resistance)
-            grid.add_cell(new_cell)
+            grid.add_cell(new_cell, PROLIFERATION)
 
     def migration(self, grid):
         """Cell migrates to an empty neighboring cell."""
         # print(f"Cell at {self.position} migrates.")
         empty_neighbors = grid.empty_neighbors(self)
         if empty_neighbors:
-            new_position = random.choice(empty_neighbors)
+            new_position = grid.rng.choice(empty_neighbors)
             grid.move_cell(self, new_position)
 
     def quiscence(self):
@@ -89,8 +107,8 @@ class Cell:
         # if self.proliferation_decrease_coef >= 1:
             # self.apoptosis(grid)
             # return
-        if random.random() <= self.DEATH_CHEMOTHERAPY_CHANCE*(1-self.chemotherapy_resistance):
-            self.apoptosis(grid)
+        if grid.rng.random() <= self.DEATH_CHEMOTHERAPY_CHANCE*(1-self.chemotherapy_resistance):
+            self.apoptosis(grid, CHEMOTHERAPY)
 
 
 class RegularTumorCell(Cell):
@@ -101,9 +119,10 @@ class RegularTumorCell(Cell):
     DEATH_CHEMOTHERAPY_CHANCE = 0.02
     CHEMOTHERAPY_RESISTANCE_INCREASE = 0.01
 
-    def __init__(self, position: tuple[int, int], proliferation_decrease_coef: float=0.0, p_remaining: int=None):
+    def __init__(self, position: tuple[int, int], proliferation_decrease_coef: float=0.0, p_remaining: int=None, rng=None,
+                 chemotherapy_resistance: float=None):
         """Initialize the regular tumor cell."""
-        super().__init__(position, proliferation_decrease_coef)
+        super().__init__(position, proliferation_decrease_coef, chemotherapy_resistance, rng=rng)
         # Number of divisions remaining
         self.p_remaining = self.MAX_DIVISIONS if p_remaining is None else p_remaining
         self.is_tumor_cell = True
@@ -147,15 +166,15 @@ class RegularTumorCell(Cell):
     def proliferation(self, grid):
         """RTC divides to empty neighboring position if p_remaining > 0."""
         if self.p_remaining == 0:
-            self.apoptosis(grid)
+            self.apoptosis(grid, SENESCENCE)
             return
 
         empty_neighbors = grid.empty_neighbors(self)
         if empty_neighbors:
-            new_position = random.choice(empty_neighbors)
+            new_position = grid.rng.choice(empty_neighbors)
             self.p_remaining -= 1
-            new_cell = RegularTumorCell(new_position, self.proliferation_decrease_coef, self.p_remaining)
-            grid.add_cell(new_cell)
+            new_cell = RegularTumorCell(new_position, self.proliferation_decrease_coef, self.p_remaining, rng=grid.rng)
+            grid.add_cell(new_cell, PROLIFERATION)
 
 
 class StemTumorCell(Cell):
@@ -165,9 +184,10 @@ class StemTumorCell(Cell):
     DEATH_CHEMOTHERAPY_CHANCE = 0.01
     CHEMOTHERAPY_RESISTANCE_INCREASE = 0.015
 
-    def __init__(self, position: tuple[int, int], proliferation_decrease_coef: float=0.0):
+    def __init__(self, position: tuple[int, int], proliferation_decrease_coef: float=0.0, rng=None,
+                 chemotherapy_resistance: float=None):
         """Initialize the stem tumor cell."""
-        super().__init__(position, proliferation_decrease_coef)
+        super().__init__(position, proliferation_decrease_coef, chemotherapy_resistance, rng=rng)
         self.is_tumor_cell = True
 
     @classmethod
@@ -213,12 +233,12 @@ class StemTumorCell(Cell):
         """CSC can divide symmetrically or asymmetrically."""
         empty_neighbors = grid.empty_neighbors(self)
         if empty_neighbors:
-            new_position = random.choice(empty_neighbors)
-            if random.random() <= self.RATES['symmetrical_division']:
-                new_cell = StemTumorCell(new_position, self.proliferation_decrease_coef)
+            new_position = grid.rng.choice(empty_neighbors)
+            if grid.rng.random() <= self.RATES['symmetrical_division']:
+                new_cell = StemTumorCell(new_position, self.proliferation_decrease_coef, rng=grid.rng)
             else:
-                new_cell = RegularTumorCell(new_position, self.proliferation_decrease_coef)
-            grid.add_cell(new_cell)
+                new_cell = RegularTumorCell(new_position, self.proliferation_decrease_coef, rng=grid.rng)
+            grid.add_cell(new_cell, PROLIFERATION)
 
 
 class ImmuneCell(Cell):
@@ -230,13 +250,14 @@ class ImmuneCell(Cell):
     DEFAULT_DEATH_CHANCE = 0.5
     DEFAULT_SUCCESS_CHANCE = 0.5
 
-    def __init__(self, position: tuple[int, int], cell_type: int, proliferation_decrease_coef: float=0.0):
+    def __init__(self, position: tuple[int, int], cell_type: int, proliferation_decrease_coef: float=0.0, rng=None,
+                 chemotherapy_resistance: float=None, lifespan: int=None):
         """Initialize the immune cell with coordinates on a grid."""
-        super().__init__(position)
+        super().__init__(position, chemotherapy_resistance=chemotherapy_resistance, rng=rng)
         self.max_attacks = self.DEFAULT_MAX_ATTACKS
         self.attacks_done = 0
         self.age = 0
-        self.lifespan = random.randint(10, 30)
+        self.lifespan = (rng or random).randint(10, 30) if lifespan is None else lifespan
         self.cell_type = cell_type
         self.death_chance_of_attack = self.DEFAULT_DEATH_CHANCE
         self.chance_of_succesfull_attack  =  self.DEFAULT_SUCCESS_CHANCE 
@@ -276,12 +297,8 @@ class ImmuneCell(Cell):
 
     def attack(self, target_cell, grid):
         """Immune cell attacks a tumor cell."""
-        neighbors = grid.neighbors(self)
-        immune_neighbors = [cell for cell in neighbors if isinstance(cell, ImmuneCell)]
-        tumor_neighbors = [cell for cell in neighbors if isinstance(cell, (RegularTumorCell, StemTumorCell))]
         self.attacks_done += 1
-        n_I1 = len(immune_neighbors)
-        n_PT1 = len(tumor_neighbors)
+        n_I1, n_PT1 = grid.neighbor_counts(self.position)
         if n_PT1 == 0:
             r_I = 0
         else:
@@ -299,9 +316,12 @@ class ImmuneCell(Cell):
         r_I = min(r_I, 1.0)
         
 
-        if random.random() <= r_I:
-            if target_cell in grid.cells.values():
-                grid.remove_cell(target_cell)
+        success = grid.rng.random() <= r_I
+        grid.events.append(ATTACK, KILL if success else ATTACK_FAILURE, cell_code(target_cell),
+                           target_cell.position, self.position)
+        if success:
+            if grid.cells.get(target_cell.position) is target_cell:
+                grid.remove_cell(target_cell, KILL, self.position)
             return True
         return False
 
@@ -312,8 +332,7 @@ class ImmuneCell(Cell):
             return
         min_dist = float('inf')
         best_pos = None
-        for pos in empty_neighbors:
-            dist = grid.nearest_tumor_distance(pos)
+        for pos, dist in zip(empty_neighbors, grid.nearest_tumor_distances(empty_neighbors)):
             if dist < min_dist:
                 min_dist = dist
                 best_pos = pos
@@ -323,11 +342,7 @@ class ImmuneCell(Cell):
 
     def get_failure_death_prob(self, grid):
         """Calculate the probability of death for the immune cell."""
-        neighbors = grid.neighbors(self)
-        immune_neighbors = [cell for cell in neighbors if isinstance(cell, ImmuneCell)]
-        tumor_neighbors = [cell for cell in neighbors if isinstance(cell, (RegularTumorCell, StemTumorCell))]
-        n_I1 = len(immune_neighbors)
-        n_PT1 = len(tumor_neighbors)
+        n_I1, n_PT1 = grid.neighbor_counts(self.position)
         if n_I1 == 0:
             return 1.0
         else:
@@ -340,48 +355,48 @@ class ImmuneCell(Cell):
         empty_neighbors =grid.empty_neighbors(self)
         if not empty_neighbors:
             return
-        if random.random() <= self.RATES['proliferation'] : 
-            position = random.choice(empty_neighbors)
-            new_cell = ImmuneCell(position, cell_type=self.cell_type)
-            grid.add_cell(new_cell)
+        if grid.rng.random() <= self.RATES['proliferation'] : 
+            position = grid.rng.choice(empty_neighbors)
+            new_cell = ImmuneCell(position, cell_type=self.cell_type, rng=grid.rng)
+            grid.add_cell(new_cell, PROLIFERATION)
 
 
     def make_action(self, grid):
         """Make action for the immune cell based on its type and local context."""
         self.age +=1
-        neighbors = grid.neighbors(self)
-        tumor_neighbors = [cell for cell in neighbors if isinstance(cell, (RegularTumorCell, StemTumorCell))]
+        _, n_PT1 = grid.neighbor_counts(self.position)
 
-        if tumor_neighbors:
+        if n_PT1:
+            tumor_neighbors = [cell for cell in grid.neighbors(self) if isinstance(cell, (RegularTumorCell, StemTumorCell))]
             if self.cell_type == 1:
                 for target in tumor_neighbors:
                     if self.attack(target, grid):
                         grid.kill_count += 1
                         self.proliferation(grid)
                         if self.attacks_done >= self.max_attacks:
-                            grid.remove_cell(self)
+                            grid.remove_cell(self, EXHAUSTION)
                         return
                     else:
                         grid.failure_count += 1
-                        if random.random() <= self.get_failure_death_prob(grid) or self.attacks_done >= self.max_attacks:
-                            grid.remove_cell(self)
+                        if grid.rng.random() <= self.get_failure_death_prob(grid) or self.attacks_done >= self.max_attacks:
+                            grid.remove_cell(self, ATTACK_FAILURE)
                             return
             elif self.cell_type == 0:
                 # NK — менш агресивні
-                target = random.choice(tumor_neighbors)
+                target = grid.rng.choice(tumor_neighbors)
                 if self.attack(target, grid):
                     grid.kill_count += 1
                     self.proliferation(grid)
-                    grid.remove_cell(self)
+                    grid.remove_cell(self, EXHAUSTION)
                 else:
                     grid.failure_count += 1
-                    if random.random() <= self.get_failure_death_prob(grid):
-                        grid.remove_cell(self)
+                    if grid.rng.random() <= self.get_failure_death_prob(grid):
+                        grid.remove_cell(self, ATTACK_FAILURE)
         else:
             self.migration(grid)
         if  self.age == self.lifespan:
-            if self in grid.cells.values():
-                self.apoptosis(grid)
+            if grid.cells.get(self.position) is self:
+                self.apoptosis(grid, LIFESPAN)
 
     def apply_immunotherapy(self):
         """Boost immune cell parameters through immunotherapy."""
@@ -395,4 +410,15 @@ class ImmuneCell(Cell):
         self.max_attacks =  self.DEFAULT_MAX_ATTACKS
        
         self.death_chance_of_attack = self.DEFAULT_DEATH_CHANCE
-        self.chance_of_succesfull_attack = self.DEFAULT_SUCCESS_CHANCE
\ No newline at end of file
+        self.chance_of_succesfull_attack = self.DEFAULT_SUCCESS_CHANCE
+
+
+def cell_code(cell) -> int:
+    """Return the integer code of a cell's type."""
+    if isinstance(cell, RegularTumorCell):
+        return REGULAR_TUMOR
+    if isinstance(cell, StemTumorCell):
+        return STEM_TUMOR
+    if isinstance(cell, ImmuneCell):
+        return IMMUNE_CTL if cell.cell_type == 1 else IMMUNE_NK
+    return GENERIC
@@ -0,0 +1,320 @@
+"""checkpoint.py"""
+import json
+import os
+import queue
+import shutil
+import threading
+import numpy as np
+from numpy.typing import NDArray
+from cells import (
+    Cell, RegularTumorCell, StemTumorCell, ImmuneCell, cell_code,
+    GENERIC, REGULAR_TUMOR, STEM_TUMOR, IMMUNE_NK, IMMUNE_CTL,
+)
+from decomposed_grid import DecomposedGrid
+from rng import SimulationRNG
+from simulation import Simulation, current_parameters, restore_parameters
+from vectorized_grid import VectorizedGrid
+
+CHECKPOINT_VERSION = 1
+CELLS_FILE = "cells.npy"
+FREE_SITES_FILE = "free_sites.npy"
+META_FILE = "meta.json"
+
+# One record per cell: position, type code and the complete per-cell state.
+CELL_DTYPE = np.dtype([
+    ("x", np.int32),
+    ("y", np.int32),
+    ("code", np.uint8),
+    ("name", np.int16),  # index into meta["custom_cells"], -1 for standard cells
+    ("p_remaining", np.int16),
+    ("chemotherapy_resistance", np.float64),
+    ("proliferation_decrease_coef", np.float64),
+    ("age", np.int32),
+    ("lifespan", np.int32),
+    ("attacks_done", np.int32),
+    ("max_attacks", np.int32),
+    ("death_chance_of_attack", np.float64),
+    ("chance_of_succesfull_attack", np.float64),
+])
+IMMUNE_FIELDS = ("age", "lifespan", "attacks_done", "max_attacks",
+                 "death_chance_of_attack", "chance_of_succesfull_attack")
+
+
+def _object_cells(grid) -> tuple[NDArray, list[dict]]:
+    """Return the cell records of an object grid (in insertion order) and its custom cell table."""
+    cells = list(grid.cells.values())
+    records = np.zeros(len(cells), dtype=CELL_DTYPE)
+    if not cells:
+        return records, []
+    records["x"], records["y"] = zip(*(cell.position for cell in cells))
+    records["code"] = [cell_code(cell) for cell in cells]
+    records["chemotherapy_resistance"] = [cell.chemotherapy_resistance for cell in cells]
+    records["proliferation_decrease_coef"] = [cell.proliferation_decrease_coef for cell in cells]
+    records["p_remaining"] = [getattr(cell, "p_remaining", 0) for cell in cells]
+    immune = [n for n, cell in enumerate(cells) if isinstance(cell, ImmuneCell)]
+    for field in IMMUNE_FIELDS:
+        records[field][immune] = [getattr(cells[n], field) for n in immune]
+
+    custom_cells = []
+    names = {}
+    name_index = []
+    for cell in cells:
+        name = getattr(cell, "name", None)
+        if name is not None and name not in names:
+            names[name] = len(custom_cells)
+            custom_cells.append({"name": name, "color": getattr(cell, "color", None),
+                                 "rates": getattr(cell, "rates", None)})
+        name_index.append(names.get(name, -1))
+    records["name"] = name_index
+    return records, custom_cells
+
+
+def _vectorized_cells(grid) -> NDArray:
+    """Return the cell records of a VectorizedGrid."""
+    sites = np.flatnonzero(grid.code)
+    records = np.zeros(len(sites), dtype=CELL_DTYPE)
+    records["x"], records["y"] = np.divmod(sites, grid.cols)
+    records["name"] = -1
+    for field in grid.STATE_FIELDS:
+        records[field] = getattr(grid, field)[sites]
+    return records
+
+
+def _make_cell(record: dict, custom_cells: list[dict]):
+    """Build a cell object from a record without drawing from any simulation stream."""
+    position = (record["x"], record["y"])
+    code = record["code"]
+    resistance = record["chemotherapy_resistance"]
+    if code == REGULAR_TUMOR:
+        cell = RegularTumorCell(position, p_remaining=record["p_remaining"], chemotherapy_resistance=resistance)
+    elif code == STEM_TUMOR:
+        cell = StemTumorCell(position, chemotherapy_resistance=resistance)
+    elif code in (IMMUNE_NK, IMMUNE_CTL):
+        cell = ImmuneCell(position, cell_type=1 if code == IMMUNE_CTL else 0, chemotherapy_resistance=resistance,
+                          lifespan=record["lifespan"])
+        for field in IMMUNE_FIELDS:
+            setattr(cell, field, record[field])
+    elif code == GENERIC:
+        cell = Cell(position, chemotherapy_resistance=resistance)
+    else:
+        raise ValueError(f"Unknown cell code {code} at {position}.")
+    cell.proliferation_decrease_coef = record["proliferation_decrease_coef"]
+    if record["name"] >= 0:
+        custom = custom_cells[record["name"]]
+        cell.name = custom["name"]
+        if custom["color"] is not None:
+            cell.color = custom["color"]
+        if custom["rates"] is not None:
+            cell.rates = dict(custom["rates"])
+    return cell
+
+
+def capture_state(simulation: Simulation) -> tuple[dict[str, NDArray], dict]:
+    """
+    Copy the complete state of a simulation.
+
+    Returns:
+        Arrays to store (file name -> array) and the JSON metadata.
+    """
+    grid = simulation.grid
+    if len(getattr(grid, "shape", (grid.rows, grid.cols))) != 2:
+        raise ValueError("Checkpoints support 2D grids only.")
+    arrays = {}
+    custom_cells = []
+    grid_options = {}
+    grid_state = {
+        "kill_count": grid.kill_count,
+        "failure_count": grid.failure_count,
+        "last_kill_count": grid.last_kill_count,
+        "last_failure_count": grid.last_failure_count,
+        "immune_spawn": grid.immune_spawn,
+        "immune_spawn_decrease": grid.immune_spawn_decrease,
+        "recruitment_enabled": grid.recruitment_enabled,
+    }
+    if isinstance(grid, VectorizedGrid):
+        arrays[CELLS_FILE] = _vectorized_cells(grid)
+        if isinstance(grid, DecomposedGrid):
+            # Every stripe draws from its own stream, so the decomposition must match on resume.
+            grid_options = {"workers": grid.workers, "halo": grid.halo, "transport": grid.transport}
+            grid_state["stripe_rngs"] = grid.stripe_rng_states()
+    else:
+        arrays[CELLS_FILE], custom_cells = _object_cells(grid)
+        grid_options = {"bucket_size": grid.spatial_index.bucket_size,
+                        "schedule_order": grid.schedule_order}
+        if hasattr(grid, "tile_size"):
+            grid_options["tile_size"] = grid.tile_size
+        else:
+            # The free list order decides which empty sites get sampled.
+            arrays[FREE_SITES_FILE] = np.array(grid._free[:grid._free_count], dtype=np.int64)
+        version, internal, gauss = grid._schedule_random.getstate()
+        grid_state["schedule_random"] = [version, list(internal), gauss]
+
+    meta = {
+        "version": CHECKPOINT_VERSION,
+        "engine": simulation.engine,
+        "rows": grid.rows,
+        "cols": grid.cols,
+        "grid_options": grid_options,
+        "grid_state": grid_state,
+        "simulation": {
+            "chemo_interval": simulation.chemo_interval,
+            "immuno_interval": simulation.immuno_interval,
+            "immunotherapy_duration": simulation.immunotherapy_duration,
+            "immunotherapy_active": simulation.immunotherapy_active,
+            "immunotherapy_iteration_counter": simulation.immunotherapy_iteration_counter,
+            "current_step": simulation.current_step,
+        },
+        "parameters": current_parameters(),
+        "custom_cells": custom_cells,
+        "rng": simulation.rng.get_full_state(),
+    }
+    return arrays, meta
+
+
+def write_checkpoint(path: str, arrays: dict[str, NDArray], meta: dict):
+    """
+    Write captured state to the checkpoint directory `path`.
+
+    The files are written to a temporary directory that then replaces `path`,
+    so an interrupted write never leaves a half-written checkpoint behind.
+    """
+    path = os.path.abspath(path)
+    tmp_path, old_path = path + ".tmp", path + ".old"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, name), array)
+    with open(os.path.join(tmp_path, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def save_checkpoint(simulation: Simulation, path: str):
+    """Save the complete state of a simulation to the checkpoint directory `path`."""
+    write_checkpoint(path, *capture_state(simulation))
+
+
+def load_checkpoint(path: str, mmap: bool = True) -> Simulation:
+    """
+    Restore a simulation saved with `save_checkpoint`.
+
+    Also sets the constants of the cell classes to the saved ones.
+
+    Args:
+        path (str): Checkpoint directory.
+        mmap (bool): Memory-map the cell records instead of reading them into memory.
+    """
+    with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version: {meta.get('version')}.")
+    records = np.load(os.path.join(path, CELLS_FILE), mmap_mode="r" if mmap else None)
+
+    restore_parameters(meta["parameters"])
+    settings = meta["simulation"]
+    simulation = Simulation(
+        meta["rows"], meta["cols"],
+        initial_tumor_radius=None,
+        chemo_interval=settings["chemo_interval"],
+        immuno_interval=settings["immuno_interval"],
+        immuno_duration=settings["immunotherapy_duration"],
+        engine=meta["engine"],
+        grid_options=meta["grid_options"],
+        seed=SimulationRNG.from_full_state(meta["rng"]),
+    )
+    simulation.immunotherapy_active = settings["immunotherapy_active"]
+    simulation.immunotherapy_iteration_counter = settings["immunotherapy_iteration_counter"]
+    simulation.current_step = settings["current_step"]
+
+    grid = simulation.grid
+    grid_state = meta["grid_state"]
+    for key in ("kill_count", "failure_count", "last_kill_count", "last_failure_count",
+                "immune_spawn", "immune_spawn_decrease", "recruitment_enabled"):
+        setattr(grid, key, grid_state[key])
+
+    if isinstance(grid, VectorizedGrid):
+        sites = records["x"].astype(np.int64) * grid.cols + records["y"]
+        for field in grid.STATE_FIELDS:
+            getattr(grid, field)[sites] = records[field]
+        # Other cells can carry immune fields left over from an earlier occupant of their site.
+        codes = records["code"]
+        stale = sites[(codes != IMMUNE_NK) & (codes != IMMUNE_CTL)]
+        for field in IMMUNE_FIELDS:
+            getattr(grid, field)[stale] = 0
+        if isinstance(grid, DecomposedGrid):
+            grid.set_stripe_rng_states(grid_state["stripe_rngs"])
+    else:
+        names = CELL_DTYPE.names
+        grid.fill_grid(_make_cell(dict(zip(names, values)), meta["custom_cells"]) for values in records.tolist())
+        version, internal, gauss = grid_state["schedule_random"]
+        grid._schedule_random.setstate((version, tuple(internal), gauss))
+        free_path = os.path.join(path, FREE_SITES_FILE)
+        if os.path.exists(free_path):
+            free_sites = np.load(free_path)
+            if len(free_sites) != grid._free_count:
+                raise ValueError("Checkpoint free list does not match its cells.")
+            # Occupied sites already have slot -1, only the free part changes order.
+            np.frombuffer(grid._free, dtype=np.int64)[:len(free_sites)] = free_sites
+            np.frombuffer(grid._free_slot, dtype=np.int64)[free_sites] = np.arange(len(free_sites))
+        # Restoring cells is not part of the simulated history.
+        grid.events.clear()
+    return simulation
+
+
+class AutoSaver:
+    """
+    Simulation callback that saves a checkpoint every `interval` steps.
+
+    The state is captured on the simulation thread, writing it to disk happens on a
+    background thread so the run continues meanwhile. If the previous checkpoint is
+    still being written, the simulation waits for it before handing over the next one.
+
+    Usage:
+        with AutoSaver("run.ckpt", interval=500) as saver:
+            simulation.run(100000, callback=saver)
+    """
+    def __init__(self, path: str, interval: int = 500):
+        if interval < 1:
+            raise ValueError("Autosave interval must be positive.")
+        self.path = path
+        self.interval = interval
+        self.error = None
+        self._queue: queue.Queue = queue.Queue(maxsize=1)
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                write_checkpoint(self.path, *item)
+            except Exception as error:  # reported on the simulation thread
+                self.error = error
+            finally:
+                self._queue.task_done()
+
+    def __call__(self, simulation: Simulation):
+        if self.error is not None:
+            raise RuntimeError("Autosave failed.") from self.error
+        if simulation.current_step % self.interval == 0:
+            self._queue.put(capture_state(simulation))
+
+    def close(self):
+        """Wait for the pending checkpoint to be written and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self.error is not None:
+            raise RuntimeError("Autosave failed.") from self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
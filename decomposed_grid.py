@@ -0,0 +1,407 @@
+"""decomposed_grid.py"""
+import os
+import traceback
+import weakref
+import multiprocessing
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from numpy.typing import NDArray
+from cells import Cell, RegularTumorCell, StemTumorCell, ImmuneCell, REGULAR_TUMOR, STEM_TUMOR
+from profiling import phase
+from rng import SimulationRNG
+from vectorized_grid import VectorizedGrid, chamfer_distance, _CODE_CLASSES
+
+# Fewest rows a stripe may have: the halves of neighboring stripes updated at the same
+# time must be at least two rows apart, so that no site is within reach of both.
+MIN_STRIPE_ROWS = 4
+TRANSPORTS = ("pipe", "socket")
+# Cell classes whose constants the rules of a step read.
+_RULE_CLASSES = (Cell, RegularTumorCell, StemTumorCell, ImmuneCell)
+
+
+def stripe_bounds(rows: int, workers: int) -> list[int]:
+    """Return the first row of every stripe and the number of rows, stripes as even as possible."""
+    return [i * rows // workers for i in range(workers + 1)]
+
+
+def exchange(index: int, up, down, to_up: bytes = b"", to_down: bytes = b"") -> tuple:
+    """
+    Swap messages with the neighboring stripes.
+
+    Links from an even stripe to the next one go first, then links from odd stripes,
+    and on every link the upper stripe sends first, so no two processes ever wait on
+    each other's send. Receiving from both neighbors also means both finished
+    everything they did before sending.
+
+    Args:
+        index (int): Index of this stripe.
+        up, down: Connections to the previous and next stripe, None at the lattice edge.
+        to_up, to_down (bytes): Messages for the neighbors.
+    Returns:
+        (from_up, from_down) messages, None for a missing neighbor.
+    """
+    received = {}
+    links = [("down", down, to_down, True), ("up", up, to_up, False)]
+    if index % 2:
+        links.reverse()
+    for name, conn, message, upper in links:
+        if conn is None:
+            continue
+        if upper:
+            conn.send_bytes(message)
+            received[name] = conn.recv_bytes()
+        else:
+            received[name] = conn.recv_bytes()
+            conn.send_bytes(message)
+    return received.get("up"), received.get("down")
+
+
+def cell_rules() -> list[tuple]:
+    """Return the (RATES, MAX_DIVISIONS) constants of the cell classes, sent to the workers every step."""
+    return [(dict(cls.RATES), getattr(cls, "MAX_DIVISIONS", None)) for cls in _RULE_CLASSES]
+
+
+def set_cell_rules(rules: list[tuple]):
+    """Set constants returned by `cell_rules`."""
+    for cls, (rates, max_divisions) in zip(_RULE_CLASSES, rules):
+        cls.RATES = rates
+        if max_divisions is not None:
+            cls.MAX_DIVISIONS = max_divisions
+
+
+def _pack_rows(mask: NDArray) -> bytes:
+    return np.packbits(mask, axis=1).tobytes()
+
+
+def _unpack_rows(message: bytes, cols: int) -> NDArray:
+    packed = np.frombuffer(message, dtype=np.uint8).reshape(-1, (cols + 7) // 8)
+    return np.unpackbits(packed, axis=1, count=cols).astype(bool)
+
+
+class StripeGrid(VectorizedGrid):
+    """
+    Rows [first, last) of a DecomposedGrid lattice, updated by one worker process.
+
+    The arrays are views of the shared lattice arrays that also cover the row next to
+    the stripe on either side (if there is one), so cells can be born into, move into
+    and attack the neighboring stripes. Only cells inside the current region act.
+    """
+    def __init__(self, blocks: dict[str, tuple[str, int]], rows: int, cols: int,
+                 first: int, last: int, rng: SimulationRNG = None):
+        """
+        Attach to the shared lattice.
+
+        Args:
+            blocks (dict): Shared memory name and number of sites of every state field and "acted".
+            rows (int): Number of rows of the whole lattice.
+            cols (int): Number of columns.
+            first, last (int): Rows of the stripe.
+            rng (SimulationRNG): Random stream of the stripe.
+        """
+        self.ghost_top = 1 if first > 0 else 0
+        self.ghost_bottom = 1 if last < rows else 0
+        self.first, self.last = first, last
+        self._blocks = blocks
+        self._attached = []
+        super().__init__(last - first + self.ghost_top + self.ghost_bottom, cols, rng)
+        self.acted: NDArray = self._new_field("acted", self.rows * cols)
+        self.own = slice(self.ghost_top * cols, (self.ghost_top + last - first) * cols)
+        self._region = self.own
+        self._distance = np.full(self.shape, np.inf)
+
+        # Immune cells appear on the border of the whole lattice, not of the stripe.
+        x, y = np.divmod(np.arange(self.own.start, self.own.stop), cols)
+        x += first - self.ghost_top
+        border = (x == 0) | (x == rows - 1) | (y == 0) | (y == cols - 1)
+        self._border_sites: NDArray = np.arange(self.own.start, self.own.stop)[border]
+
+    def _new_field(self, field: str, size: int) -> NDArray:
+        name, sites = self._blocks[field]
+        block = SharedMemory(name=name)
+        self._attached.append(block)
+        dtype = bool if field == "acted" else self.FIELD_DTYPES[field]
+        start = (self.first - self.ghost_top) * self.cols
+        return np.ndarray(sites, dtype=dtype, buffer=block.buf)[start:start + size]
+
+    def set_region(self, start_row: int, stop_row: int):
+        """Let the cells of rows [start_row, stop_row) of the stripe act."""
+        offset = self.ghost_top
+        self._region = slice((offset + start_row) * self.cols, (offset + stop_row) * self.cols)
+
+    def _acting_sites(self, mask: NDArray) -> NDArray:
+        region = self._region
+        return np.flatnonzero(mask[region] & ~self.acted[region]) + region.start
+
+    def _updated_sites(self, mask: NDArray) -> NDArray:
+        # Cells of the region and those that moved or were born next to it.
+        start = max(self._region.start - self.cols, 0)
+        stop = min(self._region.stop + self.cols, len(self.code))
+        updated = self.acted[start:stop].copy()
+        updated[self._region.start - start:self._region.stop - start] = True
+        return np.flatnonzero(mask[start:stop] & updated) + start
+
+    def _code_counts(self) -> NDArray:
+        return np.bincount(self.code[self.own], minlength=len(_CODE_CLASSES) + 1)
+
+    def _claim_empty_neighbors(self, sources: NDArray, preferred=None) -> NDArray:
+        targets = super()._claim_empty_neighbors(sources, preferred)
+        # Daughters and migrants have acted, wherever they land.
+        self.acted[targets[targets >= 0]] = True
+        return targets
+
+    @property
+    def tumor_distance(self) -> NDArray:
+        """Distance to the nearest tumor cell within the halo, as of the start of the step."""
+        return self._distance
+
+    def step(self, index: int, up, down, halo: int):
+        """
+        Update the stripe by one step, synchronized with the neighboring stripes.
+
+        The tumor rows nearest to either edge are sent to the neighbors and the tumor
+        distance is computed over the stripe and the `halo` rows received from them.
+        Then the upper halves of all stripes act, then the lower halves, so a site at a
+        stripe boundary is only ever changed by one process at a time: the stripe below
+        the boundary goes first. Cells that moved or were born during the step do not
+        act again. Finally border immune cells and recruits are placed on the stripe.
+        """
+        height = self.last - self.first
+        own_tumor = (self.codes == REGULAR_TUMOR) | (self.codes == STEM_TUMOR)
+        own_tumor = own_tumor[self.ghost_top:self.ghost_top + height]
+        from_up, from_down = exchange(index, up, down, _pack_rows(own_tumor[:halo]),
+                                      _pack_rows(own_tumor[height - halo:]))
+        above = _unpack_rows(from_up, self.cols) if from_up is not None else own_tumor[:0]
+        below = _unpack_rows(from_down, self.cols) if from_down is not None else own_tumor[:0]
+        distance = chamfer_distance(np.vstack([above, own_tumor, below]))
+        start = len(above) - self.ghost_top
+        self._distance = distance[start:start + self.rows]
+
+        for rows in ((0, height // 2), (height // 2, height)):
+            if rows[0] > 0:
+                exchange(index, up, down)
+            self.set_region(*rows)
+            self._tumor_actions()
+            self._immune_actions()
+        exchange(index, up, down)
+
+        self._region = self.own
+        self.acted[self.own] = False
+        self._spawn_border_immune_cells()
+        if self.recruitment_enabled:
+            self._recruit_immune_cells()
+
+    def close(self):
+        """Detach from the shared lattice."""
+        for field in self.STATE_FIELDS + ("acted",):
+            setattr(self, field, None)
+        for block in self._attached:
+            block.close()
+
+
+def _connect(index: int, count: int, control, transport: str, links: tuple, authkey: bytes):
+    """Return the (up, down) connections of a stripe."""
+    if transport == "pipe":
+        return links
+    # The upper stripe of every link listens, the lower one connects to the address
+    # the coordinator forwards; on one host or several, only the addresses change.
+    listener = Listener(("127.0.0.1", 0), authkey=authkey) if index < count - 1 else None
+    control.send(listener.address if listener is not None else None)
+    address = control.recv()
+    up = Client(address, authkey=authkey) if address is not None else None
+    down = listener.accept() if listener is not None else None
+    if listener is not None:
+        listener.close()
+    return up, down
+
+
+def stripe_worker(index: int, count: int, control, spec: dict, links: tuple = (None, None)):
+    """
+    Main loop of the worker process owning one stripe.
+
+    Commands from the coordinator arrive on `control`: ("step", immune_spawn,
+    recruitment_enabled, cell_rules()), ("rng",), ("set_rng", state) and ("close",).
+    Every command is answered with ("ok", result) or ("error", traceback).
+    """
+    up = down = grid = None
+    try:
+        up, down = _connect(index, count, control, spec["transport"], links, spec["authkey"])
+        grid = StripeGrid(spec["blocks"], spec["rows"], spec["cols"], *spec["bounds"][index:index + 2],
+                          rng=spec["rng"])
+        while True:
+            command, *args = control.recv()
+            if command == "close":
+                break
+            if command == "step":
+                grid.immune_spawn, grid.recruitment_enabled, rules = args
+                set_cell_rules(rules)
+                grid.step(index, up, down, spec["halo"])
+                result = (grid.kill_count, grid.failure_count)
+                grid.kill_count = grid.failure_count = 0
+            elif command == "rng":
+                result = grid.rng.get_full_state()
+            elif command == "set_rng":
+                grid.rng.set_full_state(args[0])
+                result = None
+            else:
+                raise ValueError(f"Unknown command: {command}.")
+            control.send(("ok", result))
+    except Exception:
+        control.send(("error", traceback.format_exc()))
+    finally:
+        # Closed links make waiting neighbors fail instead of hanging.
+        for conn in (up, down):
+            if conn is not None:
+                conn.close()
+        if grid is not None:
+            grid.close()
+
+
+def _shutdown(processes, controls, blocks):
+    for control in controls:
+        try:
+            control.send(("close",))
+        except OSError:
+            pass
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+    for block in blocks:
+        block.unlink()
+
+
+class DecomposedGrid(VectorizedGrid):
+    """
+    VectorizedGrid whose steps are computed by worker processes, one per stripe of rows.
+
+    The state arrays live in `multiprocessing.shared_memory`, so the coordinating
+    process reads and edits the lattice (counts, therapies, adding cells, checkpoints)
+    in place between steps. In a step, every worker updates its stripe in two halves;
+    the halves updated at the same time are at least two rows apart, so births and
+    migrations across a stripe boundary are never contested, and each stripe draws
+    from its own random stream. Results are reproducible per seed and number of workers.
+
+    Neighboring stripes exchange their tumor rows near the boundary every step and
+    synchronize over `multiprocessing.connection` links, pipes or TCP sockets
+    (`transport="socket"`); the messages are the same for both. Immune cells follow
+    the tumor distance computed from their stripe and `halo` rows beyond it, and
+    recruitment (if enabled) counts the kills and tumor cells of each stripe.
+    Call `close()` when done; the workers are also stopped when the grid is collected.
+    """
+    def __init__(self, rows: int, cols: int, rng: SimulationRNG = None, workers: int = None,
+                 halo: int = 16, transport: str = "pipe"):
+        """
+        Initialize an empty grid and start the workers.
+
+        Args:
+            rows (int): Number of rows.
+            cols (int): Number of columns.
+            rng (SimulationRNG): Random stream of the grid; the stripe streams are spawned from it.
+            workers (int): Number of worker processes, all cores (at most one per
+            max(MIN_STRIPE_ROWS, halo) rows) if None.
+            halo (int): Rows beyond its stripe a worker sees tumor cells in.
+            transport (str): Links between neighboring stripes, "pipe" or "socket".
+        """
+        if transport not in TRANSPORTS:
+            raise ValueError(f"Unknown transport: {transport}.")
+        if halo < 1:
+            raise ValueError("Halo must be at least one row.")
+        min_rows = max(MIN_STRIPE_ROWS, halo)
+        if workers is None:
+            workers = max(1, min(os.cpu_count() or 1, rows // min_rows))
+        if workers < 1 or workers > 1 and rows // workers < min_rows:
+            raise ValueError(f"Every worker needs at least {min_rows} rows.")
+        self.workers = workers
+        self.halo = halo
+        self.transport = transport
+        self.bounds = stripe_bounds(rows, workers)
+        self._shared = {}
+        super().__init__(rows, cols, rng)
+        self.acted: NDArray = self._new_field("acted", rows * cols)
+
+        context = multiprocessing.get_context()
+        spec = {
+            "blocks": {field: (block.name, rows * cols) for field, block in self._shared.items()},
+            "rows": rows, "cols": cols, "bounds": self.bounds, "halo": halo,
+            "transport": transport, "authkey": os.urandom(16),
+        }
+        links = [[None, None] for _ in range(workers)]
+        if transport == "pipe":
+            for i in range(workers - 1):
+                links[i][1], links[i + 1][0] = context.Pipe()
+        self._controls = []
+        self._processes = []
+        for i, stream in enumerate(self.rng.spawn(workers)):
+            control, child = context.Pipe()
+            process = context.Process(target=stripe_worker, args=(i, workers, child, dict(spec, rng=stream),
+                                                                  tuple(links[i])), daemon=True)
+            process.start()
+            child.close()
+            self._controls.append(control)
+            self._processes.append(process)
+        for link in links:
+            for conn in link:
+                if conn is not None:
+                    conn.close()
+        if transport == "socket":
+            addresses = [control.recv() for control in self._controls]
+            for i, control in enumerate(self._controls):
+                control.send(addresses[i - 1] if i > 0 else None)
+        self._finalizer = weakref.finalize(self, _shutdown, self._processes, self._controls,
+                                           list(self._shared.values()))
+
+    def _new_field(self, field: str, size: int) -> NDArray:
+        dtype = np.dtype(bool if field == "acted" else self.FIELD_DTYPES[field])
+        block = SharedMemory(create=True, size=max(size * dtype.itemsize, 1))
+        self._shared[field] = block
+        array = np.ndarray(size, dtype=dtype, buffer=block.buf)
+        array.fill(0)
+        return array
+
+    def _command(self, *message) -> list:
+        """Send a command to every worker and return their results."""
+        for control in self._controls:
+            control.send(message)
+        replies = [control.recv() for control in self._controls]
+        errors = [result for status, result in replies if status == "error"]
+        if errors:
+            raise RuntimeError("Stripe worker failed:\n" + errors[0])
+        return [result for _, result in replies]
+
+    def make_action(self):
+        """Make action for every cell in the grid, all stripes in parallel."""
+        profiler = self.profiler
+        with phase(profiler, "stripes"):
+            results = self._command("step", self.immune_spawn, self.recruitment_enabled, cell_rules())
+        if profiler is not None:
+            profiler.steps += 1
+        self.last_kill_count = self.kill_count + sum(kills for kills, _ in results)
+        self.last_failure_count = self.failure_count + sum(failures for _, failures in results)
+        self.kill_count = 0
+        self.failure_count = 0
+
+    def stripe_rng_states(self) -> list[dict]:
+        """Return the state of the random stream of every stripe."""
+        return self._command("rng")
+
+    def set_stripe_rng_states(self, states: list[dict]):
+        """Restore states returned by `stripe_rng_states`."""
+        if len(states) != self.workers:
+            raise ValueError(f"Expected {self.workers} stripe states, got {len(states)}.")
+        for control, state in zip(self._controls, states):
+            control.send(("set_rng", state))
+        for control in self._controls:
+            status, result = control.recv()
+            if status == "error":
+                raise RuntimeError("Stripe worker failed:\n" + result)
+
+    def close(self):
+        """Stop the workers and release the shared memory; the arrays become private copies."""
+        if not self._finalizer.alive:
+            return
+        for field in self.STATE_FIELDS + ("acted",):
+            setattr(self, field, np.array(getattr(self, field)))
+        self._finalizer()
+        for block in self._shared.values():
+            block.close()
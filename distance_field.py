@@ -0,0 +1,68 @@
+"""distance_field.py"""
+import numpy as np
+from numpy.typing import NDArray
+
+
+def _row_transform(f: NDArray) -> NDArray:
+    """
+    Return min_k (j - k)^2 + f[:, k] for every column j of every row of `f`.
+
+    Lower envelope of parabolas (Felzenszwalb and Huttenlocher) built for all rows at
+    once: every column is one NumPy step over the rows, plus one step per parabola popped
+    from the envelopes. Columns with f = inf add no parabola.
+    """
+    rows, cols = f.shape
+    index = np.arange(rows)
+    # Envelope of every row: vertices v[:, :k + 1] and their intervals [z[:, i], z[:, i + 1]).
+    v = np.zeros((rows, cols), dtype=np.int64)
+    z = np.empty((rows, cols + 1))
+    k = np.full(rows, -1)
+
+    def intersection(r, q):
+        vk = v[r, k[r]]
+        return ((f[r, q] + q * q) - (f[r, vk] + vk * vk)) / (2.0 * (q - vk))
+
+    for q in range(cols):
+        adding = index[np.isfinite(f[:, q])]
+        pending = adding[k[adding] >= 0]
+        while len(pending):
+            popped = intersection(pending, q) <= z[pending, k[pending]]
+            pending = pending[popped]
+            k[pending] -= 1
+        first = adding[k[adding] < 0]
+        rest = adding[k[adding] >= 0]
+        s = intersection(rest, q)
+        k[adding] += 1
+        v[adding, k[adding]] = q
+        z[first, 0] = -np.inf
+        z[rest, k[rest]] = s
+        z[adding, k[adding] + 1] = np.inf
+
+    out = np.full((rows, cols), np.inf)
+    filled = index[k >= 0]
+    j = np.zeros(rows, dtype=np.int64)
+    for q in range(cols):
+        behind = filled[z[filled, j[filled] + 1] < q]
+        while len(behind):
+            j[behind] += 1
+            behind = behind[z[behind, j[behind] + 1] < q]
+        vj = v[filled, j[filled]]
+        out[filled, q] = (q - vj) ** 2 + f[filled, vj]
+    return out
+
+
+def euclidean_distance(mask: NDArray) -> NDArray:
+    """
+    Return the exact Euclidean distance from every site to the nearest True site of `mask`.
+
+    Separable transform: running extrema along every column give the distance to the
+    nearest source in the same column, then a lower envelope of parabolas along every
+    row combines the columns in O(rows * cols). Sites are infinitely far away if the
+    mask is empty.
+    """
+    rows, cols = mask.shape
+    index = np.arange(rows, dtype=float)[:, None]
+    above = np.maximum.accumulate(np.where(mask, index, -np.inf), axis=0)
+    below = np.minimum.accumulate(np.where(mask, index, np.inf)[::-1], axis=0)[::-1]
+    column = np.minimum(index - above, below - index) ** 2
+    return np.sqrt(_row_transform(column))
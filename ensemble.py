@@ -0,0 +1,158 @@
+"""ensemble.py"""
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from numpy.typing import NDArray
+from simulation import Simulation, ENGINES
+
+SCENARIOS = {
+    "no_chemo_no_immune": {},
+    "chemo_no_immune": {"chemo_interval": 50},
+    "no_chemo_immune": {"immuno_interval": 50, "immuno_duration": 10},
+    "chemo_immune": {"chemo_interval": 50, "immuno_interval": 50, "immuno_duration": 10},
+}
+
+
+def run_replicate(config: dict, num_steps: int, seed) -> tuple[list[str], NDArray]:
+    """
+    Run one replicate of a configuration.
+
+    Args:
+        config (dict): Keyword arguments of `Simulation`.
+        num_steps (int): Number of steps to perform.
+        seed: `numpy.random.SeedSequence` (or integer) the replicate is seeded from.
+
+    Returns:
+        Population count names and an array of shape (num_steps + 1, len(names))
+        with the counts after every step (row 0 is the initial state).
+    """
+    config = dict(config)
+    # Always set the cell constants so results do not depend on the process start method.
+    config.setdefault("parameters", {})
+    simulation = Simulation(**config, seed=seed)
+
+    names = list(simulation.population_counts())
+    counts = np.zeros((num_steps + 1, len(names)), dtype=np.int64)
+    counts[0] = list(simulation.population_counts().values())
+
+    def record(sim):
+        counts[sim.current_step] = list(sim.population_counts().values())
+
+    simulation.run(num_steps, callback=record)
+    return names, counts
+
+
+def _run_replicate_args(args):
+    return run_replicate(*args)
+
+
+class EnsembleResult:
+    """Population trajectories of all replicates of one configuration."""
+    def __init__(self, names: list[str], trajectories: NDArray, seeds: list[np.random.SeedSequence]):
+        self.names: list[str] = names
+        self.trajectories: NDArray = trajectories
+        self.seeds: list[np.random.SeedSequence] = seeds
+
+    @property
+    def num_replicates(self) -> int:
+        return self.trajectories.shape[0]
+
+    @property
+    def num_steps(self) -> int:
+        return self.trajectories.shape[1] - 1
+
+    def series(self, name: str) -> NDArray:
+        """Return the (replicates, steps + 1) trajectories of one population."""
+        if name == "tumor":
+            return self.series("regular_tumor") + self.series("stem_tumor")
+        if name == "immune":
+            return self.series("immune_type0") + self.series("immune_type1")
+        if name not in self.names:
+            raise ValueError(f"Unknown population: {name}.")
+        return self.trajectories[:, :, self.names.index(name)]
+
+    def mean(self, name: str) -> NDArray:
+        """Return the mean trajectory of one population over the replicates."""
+        return self.series(name).mean(axis=0)
+
+    def quantiles(self, name: str, q=(0.05, 0.5, 0.95)) -> NDArray:
+        """Return an array of shape (len(q), steps + 1) with the quantile bands of one population."""
+        return np.quantile(self.series(name), q, axis=0)
+
+
+def run_ensemble(config: dict = None, num_steps: int = 100, replicates: int = 10,
+                 seed: int = None, workers: int = None) -> EnsembleResult:
+    """
+    Run independent replicates of a configuration across a process pool.
+
+    Args:
+        config (dict): Keyword arguments of `Simulation`, or the name of one of SCENARIOS.
+        num_steps (int): Number of steps of every replicate.
+        replicates (int): Number of replicates.
+        seed (int): Root seed, every replicate gets an independent child of its SeedSequence.
+        Random if None.
+        workers (int): Number of worker processes, all cores if None, in-process if 1.
+    """
+    if isinstance(config, str):
+        if config not in SCENARIOS:
+            raise ValueError(f"Unknown scenario: {config}.")
+        config = SCENARIOS[config]
+    config = dict(config or {})
+    if replicates < 1:
+        raise ValueError("Number of replicates must be positive.")
+
+    seeds = np.random.SeedSequence(seed).spawn(replicates)
+    tasks = [(config, num_steps, s) for s in seeds]
+    workers = min(workers or os.cpu_count() or 1, replicates)
+    if workers == 1:
+        results = [_run_replicate_args(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_run_replicate_args, tasks))
+
+    names = results[0][0]
+    trajectories = np.stack([counts for _, counts in results])
+    return EnsembleResult(names, trajectories, seeds)
+
+
+def parse_args(argv=None):
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Run an ensemble of tumor growth simulations.")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="no_chemo_no_immune",
+                        help="Therapy scenario.")
+    parser.add_argument("--size", type=int, default=50, help="Grid size (rows = cols).")
+    parser.add_argument("--steps", type=int, default=500, help="Number of steps per replicate.")
+    parser.add_argument("--replicates", type=int, default=16, help="Number of replicates.")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="object", help="Grid implementation.")
+    parser.add_argument("--seed", type=int, default=None, help="Root seed of the ensemble.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes.")
+    parser.add_argument("--output", default="ensemble.csv",
+                        help="CSV file with mean and 5/50/95%% bands of tumor and immune counts.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = dict(SCENARIOS[args.scenario], rows=args.size, engine=args.engine)
+    start = time.perf_counter()
+    result = run_ensemble(config, args.steps, args.replicates, seed=args.seed, workers=args.workers)
+    elapsed = time.perf_counter() - start
+
+    columns = []
+    header = ["step"]
+    for name in ("tumor", "immune"):
+        header += [f"{name}_mean", f"{name}_q05", f"{name}_q50", f"{name}_q95"]
+        columns += [result.mean(name), *result.quantiles(name)]
+    with open(args.output, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for step in range(result.num_steps + 1):
+            writer.writerow([step, *(round(float(column[step]), 3) for column in columns)])
+    print(f"{args.replicates} replicates x {args.steps} steps in {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
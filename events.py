@@ -0,0 +1,113 @@
+"""events.py"""
+import numpy as np
+from numpy.typing import NDArray
+
+# Event kinds.
+BIRTH = 1
+DEATH = 2
+MOVE = 3
+ATTACK = 4
+
+# Causes.
+PLACEMENT = 1       # initial tumor, manual placement, checkpoint restore
+REMOVAL = 2         # manual removal
+PROLIFERATION = 3
+MIGRATION = 4
+APOPTOSIS = 5
+SENESCENCE = 6      # regular tumor cell out of divisions
+CHEMOTHERAPY = 7
+KILL = 8            # tumor cell killed by an immune cell / successful attack
+ATTACK_FAILURE = 9  # failed attack / immune cell died after a failed attack
+EXHAUSTION = 10     # immune cell removed after a kill or its last attack
+LIFESPAN = 11
+SPAWN = 12          # immune cell spawned at the border
+RECRUITMENT = 13
+
+KIND_NAMES = {BIRTH: "birth", DEATH: "death", MOVE: "move", ATTACK: "attack"}
+CAUSE_NAMES = {
+    PLACEMENT: "placement", REMOVAL: "removal", PROLIFERATION: "proliferation",
+    MIGRATION: "migration", APOPTOSIS: "apoptosis", SENESCENCE: "senescence",
+    CHEMOTHERAPY: "chemotherapy", KILL: "kill", ATTACK_FAILURE: "attack_failure",
+    EXHAUSTION: "exhaustion", LIFESPAN: "lifespan", SPAWN: "spawn", RECRUITMENT: "recruitment",
+}
+
+# (x, y) is where the event happened; (from_x, from_y) is the previous position of a
+# moved cell or the position of the attacking immune cell, -1 otherwise.
+EVENT_DTYPE = np.dtype([
+    ("kind", np.uint8),
+    ("cause", np.uint8),
+    ("code", np.uint8),
+    ("x", np.int32),
+    ("y", np.int32),
+    ("from_x", np.int32),
+    ("from_y", np.int32),
+])
+
+
+class EventBuffer:
+    """
+    Ring buffer of grid change events.
+
+    Events of the current step are appended as tuples; `end_step` converts them into one
+    structured NumPy batch (EVENT_DTYPE), copies it into a ring of the last `capacity`
+    events and passes it to every observer.
+    """
+    def __init__(self, capacity: int = 65536):
+        if capacity < 1:
+            raise ValueError("Capacity must be positive.")
+        self.capacity = capacity
+        self._ring: NDArray = np.zeros(capacity, dtype=EVENT_DTYPE)
+        self._head = 0
+        self._size = 0
+        self._pending: list[tuple] = []
+        self.observers: list = []
+
+    def append(self, kind: int, cause: int, code: int, position, source=(-1, -1)):
+        """Record an event of the current step."""
+        self._pending.append((kind, cause, code, position[0], position[1], source[0], source[1]))
+
+    @property
+    def pending(self) -> int:
+        """Number of events recorded in the current step."""
+        return len(self._pending)
+
+    def cause_at(self, index: int) -> int:
+        """Return the cause of the index-th event of the current step, 0 if there is none yet."""
+        pending = self._pending
+        return pending[index][1] if index < len(pending) else 0
+
+    def add_observer(self, observer):
+        """Call `observer(batch)` with the events of every step."""
+        self.observers.append(observer)
+
+    def remove_observer(self, observer):
+        self.observers.remove(observer)
+
+    def end_step(self) -> NDArray:
+        """Close the current step: store its events in the ring and notify the observers."""
+        batch = np.array(self._pending, dtype=EVENT_DTYPE)
+        self._pending = []
+        n = len(batch)
+        if n:
+            stored = batch[-self.capacity:]
+            start = (self._head + n - len(stored)) % self.capacity
+            first = min(len(stored), self.capacity - start)
+            self._ring[start:start + first] = stored[:first]
+            self._ring[:len(stored) - first] = stored[first:]
+            self._head = (self._head + n) % self.capacity
+            self._size = min(self._size + n, self.capacity)
+        for observer in self.observers:
+            observer(batch)
+        return batch
+
+    def recent(self, n: int = None) -> NDArray:
+        """Return up to the last n stored events (all stored events if None), oldest first."""
+        n = self._size if n is None else min(n, self._size)
+        indices = (self._head - n + np.arange(n)) % self.capacity
+        return self._ring[indices]
+
+    def clear(self):
+        """Drop pending and stored events."""
+        self._pending = []
+        self._head = 0
+        self._size = 0
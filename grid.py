@@ -1,66 +1,315 @@
 """grid.py"""
+import math
 import random
+import time
+from array import array
+from collections import Counter
 import numpy as np
 from numpy.typing import NDArray
 from immune_utils import recruit_immune_cells
-import random
-from cells import ImmuneCell
+from distance_field import euclidean_distance
+from spatial_index import SpatialHashIndex
+from rng import SimulationRNG
+from events import EventBuffer, BIRTH, DEATH, MOVE, PLACEMENT, REMOVAL, MIGRATION, SPAWN
+from profiling import cell_label, action_name
+from cells import Cell, RegularTumorCell, StemTumorCell, ImmuneCell, cell_code, EMPTY, REGULAR_TUMOR, STEM_TUMOR
+
+def moore_neighbor_counts(mask: NDArray) -> NDArray:
+    """Return the number of True sites in the Moore neighborhood (8 neighbors) of every site."""
+    padded = np.pad(mask.astype(np.int8), 1)
+    rows, cols = mask.shape
+    counts = np.zeros(mask.shape, dtype=np.int8)
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            if dx or dy:
+                counts += padded[1 + dx:1 + dx + rows, 1 + dy:1 + dy + cols]
+    return counts
+
 
 class Grid:
     """Class representing a grid of cells."""
-    def __init__(self, rows: int, cols: int):
+    SCHEDULE_ORDERS = ("raster", "random", "seeded")
+
+    def __init__(self, rows: int, cols: int, bucket_size: int = 8,
+                 schedule_order: str = "raster", schedule_seed: int = 0, rng: SimulationRNG = None):
+        """
+        Initialize an empty grid.
+
+        Args:
+            rows (int): Number of rows.
+            cols (int): Number of columns.
+            bucket_size (int): Bucket size of the spatial index.
+            schedule_order (str): Order in which cells act in `make_action`: "raster"
+            (by position), "random" (new permutation every step) or "seeded"
+            (permutations from a generator seeded with `schedule_seed`).
+            schedule_seed (int): Seed of the "seeded" schedule.
+            rng (SimulationRNG): Random stream used by the grid and its cells,
+            freshly seeded from OS entropy if None.
+        """
+        if schedule_order not in self.SCHEDULE_ORDERS:
+            raise ValueError(f"Unknown schedule order: {schedule_order}.")
+        self.schedule_order = schedule_order
+        self._schedule_random = random.Random(schedule_seed)
+        self.rng: SimulationRNG = rng if rng is not None else SimulationRNG()
         self.rows: int = rows
         self.cols: int = cols
-        self.grid: NDArray = np.zeros(shape=(self.rows, self.cols), dtype=bool)
         self.cells: dict[tuple[int, int]: "Cell"] = {}
         self.kill_count = 0
         self.failure_count= 0
+        # Attack outcomes of the last completed step (kill_count / failure_count are reset after it).
+        self.last_kill_count = 0
+        self.last_failure_count = 0
         self.immune_spawn = 0.003
         self.immune_spawn_decrease = 0.03
+        self.spatial_index = SpatialHashIndex(bucket_size)
+        # Tumor cells with a non-tumor neighbor site; the nearest tumor cell to any other site is one of them.
+        self.tumor_frontier = SpatialHashIndex(bucket_size)
+        self._frontier_keys: dict[tuple[int, int], tuple] = {}
+        # Set while fill_grid adds cells in bulk; the frontier is rebuilt once afterwards.
+        self._frontier_deferred = False
+        self._counts: Counter = Counter()
+        self._named_counts: Counter = Counter()
+        # Positions of cells with their own display color (custom cells from the GUI).
+        self.colored_positions: set[tuple[int, int]] = set()
+        self.recruitment_enabled = False
+        # Births, deaths, moves and attacks of the current step, handed to observers by make_action.
+        self.events = EventBuffer()
+        # StepProfiler recording the cost of every step, None when profiling is off.
+        self.profiler = None
+        self._init_lattice()
 
+    def _init_lattice(self):
+        """Allocate the dense per-site structures for an empty grid."""
+        self.grid: NDArray = np.zeros(shape=(self.rows, self.cols), dtype=bool)
+        # Cell type code (cells.EMPTY, ...) and chemotherapy resistance of the cell at every site.
+        self.codes: NDArray = np.zeros((self.rows, self.cols), dtype=np.uint8)
+        self.resistance: NDArray = np.zeros((self.rows, self.cols), dtype=np.float32)
+        self._reset_free_sites()
+        # Number of tumor / immune cells in the Moore neighborhood of every site.
+        self.tumor_neighbor_count: NDArray = np.zeros((self.rows, self.cols), dtype=np.int8)
+        self.immune_neighbor_count: NDArray = np.zeros((self.rows, self.cols), dtype=np.int8)
+        # Border sites in the order _spawn_border_immune_cells visits them.
+        border = [(i, j) for j in range(self.cols) for i in (0, self.rows - 1)]
+        border += [(i, j) for i in range(1, self.rows - 1) for j in (0, self.cols - 1)]
+        self._border_sites: NDArray = np.array(list(dict.fromkeys(border)), dtype=np.int64).reshape(-1, 2)
+        # Cached tumor_distance field, None after a tumor site changed.
+        self._tumor_distance: NDArray = None
 
     @property
     def num_cells(self) -> int:
         """Return the number of cells in the grid."""
         return len(self.cells)
 
-    def add_cell(self, cell):
+    @property
+    def tumor_distance(self) -> NDArray:
+        """
+        Euclidean distance from every site to the nearest tumor cell, shaped (rows, cols).
+
+        The field is cached and recomputed lazily on the first read after a tumor cell is
+        placed or removed. The returned array is read-only.
+        """
+        if self._tumor_distance is None:
+            tumor = (self.codes == REGULAR_TUMOR) | (self.codes == STEM_TUMOR)
+            self._tumor_distance = euclidean_distance(tumor)
+            self._tumor_distance.flags.writeable = False
+        return self._tumor_distance
+
+    @property
+    def num_empty(self) -> int:
+        """Return the number of empty positions in the grid."""
+        return self._free_count
+
+    def _reset_free_sites(self):
+        """Mark every site as free."""
+        size = self.rows * self.cols
+        # _free[:_free_count] holds the flat indices of empty sites,
+        # _free_slot[site] is the index of a site in _free (or -1 if occupied).
+        self._free = array('q', range(size))
+        self._free_slot = array('q', range(size))
+        self._free_count = size
+
+    def _occupy_site(self, site: int):
+        """Remove a site from the free list by swapping it with the last free site."""
+        free, slot = self._free, self._free_slot
+        i = slot[site]
+        last = free[self._free_count - 1]
+        free[i] = last
+        slot[last] = i
+        slot[site] = -1
+        self._free_count -= 1
+
+    def _vacate_site(self, site: int):
+        """Append a site to the free list."""
+        self._free[self._free_count] = site
+        self._free_slot[site] = self._free_count
+        self._free_count += 1
+
+    def _update_neighbor_counts(self, cell, delta: int):
+        """Add delta to the neighbor count field of the cell's kind around its position."""
+        if cell.is_tumor_cell:
+            field = self.tumor_neighbor_count
+        elif isinstance(cell, ImmuneCell):
+            field = self.immune_neighbor_count
+        else:
+            return
+        x, y = cell.position
+        field[max(x - 1, 0):x + 2, max(y - 1, 0):y + 2] += delta
+        field[x, y] -= delta
+
+    def recount_neighbors(self):
+        """Recompute the neighbor count fields from scratch."""
+        tumor = np.zeros((self.rows, self.cols), dtype=bool)
+        immune = np.zeros((self.rows, self.cols), dtype=bool)
+        for (x, y), cell in self.cells.items():
+            if cell.is_tumor_cell:
+                tumor[x, y] = True
+            elif isinstance(cell, ImmuneCell):
+                immune[x, y] = True
+        self.tumor_neighbor_count = moore_neighbor_counts(tumor)
+        self.immune_neighbor_count = moore_neighbor_counts(immune)
+
+    def neighbor_counts(self, position) -> tuple[int, int]:
+        """Return the numbers of (immune, tumor) cells neighboring a position."""
+        x, y = position
+        return int(self.immune_neighbor_count[x, y]), int(self.tumor_neighbor_count[x, y])
+
+    def _frontier_key(self, site):
+        """Index key of the cell at a site if it is a tumor cell with a non-tumor neighbor site, else None."""
+        cell = self.cells.get(site)
+        if cell is None or not cell.is_tumor_cell:
+            return None
+        i, j = site
+        rows, cols = self.rows, self.cols
+        if 0 < i < rows - 1 and 0 < j < cols - 1:
+            sites = 8
+        else:
+            sites = (min(i + 2, rows) - max(i - 1, 0)) * (min(j + 2, cols) - max(j - 1, 0)) - 1
+        return self._index_key(cell) if self.neighbor_counts(site)[1] < sites else None
+
+    def _update_frontier(self, position):
+        """Add the tumor cells at and around a position to the frontier index or remove them from it."""
+        if self._frontier_deferred:
+            return
+        x, y = position
+        frontier = self._frontier_keys
+        for i in range(max(x - 1, 0), min(x + 2, self.rows)):
+            for j in range(max(y - 1, 0), min(y + 2, self.cols)):
+                site = (i, j)
+                key = self._frontier_key(site)
+                old = frontier.get(site)
+                if old == key:
+                    continue
+                if old is not None:
+                    self.tumor_frontier.remove(old, site)
+                    del frontier[site]
+                if key is not None:
+                    self.tumor_frontier.insert(key, site)
+                    frontier[site] = key
+
+    @staticmethod
+    def _index_key(cell) -> tuple:
+        """Key of a cell in the spatial index: its class and immune cell type."""
+        return type(cell), getattr(cell, "cell_type", None)
+
+    def _index_keys(self, cell_class, cell_type=None) -> list[tuple]:
+        """Spatial index keys of cells that are instances of `cell_class` (class or tuple)."""
+        return [
+            key for key in self.spatial_index.keys
+            if issubclass(key[0], cell_class) and (cell_type is None or key[1] == cell_type)
+        ]
+
+    def _occupy(self, cell):
+        """Update the per-site structures after a cell is placed at its position."""
+        x, y = cell.position
+        self.grid[x, y] = True
+        self.codes[x, y] = cell_code(cell)
+        self.resistance[x, y] = cell.chemotherapy_resistance
+        self._occupy_site(x * self.cols + y)
+        self._update_neighbor_counts(cell, 1)
+        if cell.is_tumor_cell:
+            self._tumor_distance = None
+
+    def _vacate(self, cell):
+        """Update the per-site structures before a cell leaves its position."""
+        x, y = cell.position
+        self.grid[x, y] = False
+        self.codes[x, y] = EMPTY
+        self.resistance[x, y] = 0.0
+        self._vacate_site(x * self.cols + y)
+        self._update_neighbor_counts(cell, -1)
+        if cell.is_tumor_cell:
+            self._tumor_distance = None
+
+    def _index_cell(self, cell):
+        """Update the auxiliary structures after a cell is placed at its position."""
+        self._occupy(cell)
+        key = self._index_key(cell)
+        self.spatial_index.insert(key, cell.position)
+        if cell.is_tumor_cell:
+            self._update_frontier(cell.position)
+        self._counts[key] += 1
+        if hasattr(cell, "name"):
+            self._named_counts[cell.name] += 1
+        if hasattr(cell, "color"):
+            self.colored_positions.add(cell.position)
+
+    def _unindex_cell(self, cell):
+        """Update the auxiliary structures after a cell left its position."""
+        self._vacate(cell)
+        key = self._index_key(cell)
+        self.spatial_index.remove(key, cell.position)
+        if cell.is_tumor_cell:
+            self._update_frontier(cell.position)
+        self._counts[key] -= 1
+        if hasattr(cell, "name"):
+            self._named_counts[cell.name] -= 1
+        if hasattr(cell, "color"):
+            self.colored_positions.discard(cell.position)
+
+    def add_cell(self, cell, cause: int = PLACEMENT):
         """Add a cell to the grid."""
         x, y = cell.position
         if 0 <= x < self.rows and 0 <= y < self.cols:
-            self.grid[x, y] = True
             self.cells[cell.position] = cell
+            self._index_cell(cell)
+            self.events.append(BIRTH, cause, cell_code(cell), cell.position)
         else:
             raise ValueError("Cell position out of bounds.")
 
-    def remove_cell(self, cell):
-        """Remove a cell from the grid."""
+    def remove_cell(self, cell, cause: int = REMOVAL, source=(-1, -1)):
+        """
+        Remove a cell from the grid.
+
+        `cause` and `source` (position of the killing cell) are recorded in the death event.
+        """
         x, y = cell.position
         if (x, y) in self.cells:
-            self.grid[x, y] = False
-            del self.cells[(x, y)]
+            removed = self.cells.pop((x, y))
+            self._unindex_cell(removed)
+            self.events.append(DEATH, cause, cell_code(removed), (x, y), source)
         else:
             raise ValueError("Cell not found in grid.")
 
-    def remove_cell_at(self, position):
+    def remove_cell_at(self, position, cause: int = REMOVAL):
         """Remove a cell at a specific position."""
         if position in self.cells:
-            self.remove_cell(self.cells[position])
+            self.remove_cell(self.cells[position], cause)
 
-    def move_cell(self, cell, new_position: tuple[int, int]):
+    def move_cell(self, cell, new_position: tuple[int, int], cause: int = MIGRATION):
         """Move a cell to a new position on the grid."""
         x, y = cell.position
         new_x, new_y = new_position
         if (new_x, new_y) in self.cells:
             raise ValueError("New position already occupied by another cell.")
         if 0 <= new_x < self.rows and 0 <= new_y < self.cols:
-            self.grid[x, y] = False
-            self.grid[new_x, new_y] = True
             # Add a check to make sure the cell position exists before deleting
             if (x, y) in self.cells:
                 del self.cells[(x, y)]
+                self._unindex_cell(cell)
             cell.position = new_position
             self.cells[new_position] = cell
+            self._index_cell(cell)
+            self.events.append(MOVE, cause, cell_code(cell), new_position, (x, y))
         else:
             raise ValueError("New position out of bounds.")
 
@@ -80,13 +329,36 @@ class Grid:
 
     def empty_grid(self):
         """Empty the grid."""
-        self.grid.fill(False)
         self.cells.clear()
+        self.spatial_index.clear()
+        self.tumor_frontier.clear()
+        self._frontier_keys.clear()
+        self._counts.clear()
+        self._named_counts.clear()
+        self.colored_positions.clear()
+        self.events.clear()
+        self._init_lattice()
 
     def fill_grid(self, cells: dict[tuple[int, int]: "Cell"]):
         """Fill the grid with a list of cells."""
-        for cell in cells:
-            self.add_cell(cell)
+        self._frontier_deferred = True
+        try:
+            for cell in cells:
+                self.add_cell(cell)
+        finally:
+            self._frontier_deferred = False
+            self.rebuild_frontier()
+
+    def rebuild_frontier(self):
+        """Recompute the tumor frontier index from the cells."""
+        self.tumor_frontier.clear()
+        self._frontier_keys.clear()
+        for site, cell in self.cells.items():
+            if cell.is_tumor_cell:
+                key = self._frontier_key(site)
+                if key is not None:
+                    self.tumor_frontier.insert(key, site)
+                    self._frontier_keys[site] = key
 
     def apply_chemotherapy(self):
         """Apply chemotherapy to all cells in the grid."""
@@ -111,35 +383,104 @@ class Grid:
 
     def spawn_possible_cell(self, i, j):
         """Spawn a possible immune cell with weighted random type at (i, j)."""
-        spell_type = random.choices([0, 1], weights=[0.7, 0.3])[0]  # 70% для 0, 30% для 1
-        new_cell = ImmuneCell((i, j), spell_type)
-        self.add_cell(new_cell)
+        spell_type = self.rng.choices([0, 1], weights=[0.7, 0.3])[0]  # 70% для 0, 30% для 1
+        new_cell = ImmuneCell((i, j), spell_type, rng=self.rng)
+        self.add_cell(new_cell, SPAWN)
+
+    def schedule(self) -> list:
+        """Return a snapshot of the cells in the order they act in this step."""
+        cells = list(self.cells.values())
+        if self.schedule_order == "raster":
+            cells.sort(key=lambda cell: cell.position)
+        elif self.schedule_order == "random":
+            self.rng.shuffle(cells)
+        else:
+            self._schedule_random.shuffle(cells)
+        return cells
 
     def make_action(self):
-        """Make action for each cell in the grid."""
+        """
+        Make action for each cell in the grid.
+
+        Only cells present at the start of the step act, each at most once,
+        so cells born or moved during the step wait for the next one.
+        """
         # print(self.immune_spawn)
-        for i, line in enumerate(self.grid):
-            for j, cell in enumerate(line):
-                if cell:
-                    self.cells[(i, j)].make_action(self)
+        if self.profiler is not None:
+            self._profiled_make_action()
+            return
+        for cell in self.schedule():
+            # Skip cells that died earlier in this step.
+            if self.cells.get(cell.position) is cell:
+                cell.make_action(self)
 
+        self._spawn_border_immune_cells()
+        if self.recruitment_enabled:
+            recruit_immune_cells(self, self.kill_count, self.failure_count)
+        self._end_step()
 
-        rows = len(self.grid)
-        cols = len(self.grid[0]) if rows > 0 else 0
+    def _profiled_make_action(self):
+        """
+        `make_action` that records its phases and the time of every cell in self.profiler.
 
-        for j in range(cols):
-            for i in [0, rows - 1]:
-                if not self.grid[i, j] and random.random() < self.immune_spawn:
-                    self.spawn_possible_cell(i, j)
+        A cell's time is attributed to its label and action, the action being the
+        cause of the first event it recorded.
+        """
+        profiler = self.profiler
+        clock = time.perf_counter
+        events = self.events
+        with profiler.phase("schedule"):
+            cells = self.schedule()
+        start = clock()
+        for cell in cells:
+            if self.cells.get(cell.position) is cell:
+                first = events.pending
+                cell_start = clock()
+                cell.make_action(self)
+                profiler.add_cell(cell_label(cell), action_name(events.cause_at(first)), clock() - cell_start)
+        profiler.add_phase("cells", clock() - start)
 
+        with profiler.phase("border_spawn"):
+            self._spawn_border_immune_cells()
+        if self.recruitment_enabled:
+            with profiler.phase("recruitment"):
+                recruit_immune_cells(self, self.kill_count, self.failure_count)
+        with profiler.phase("events"):
+            self._end_step()
+        profiler.steps += 1
 
-        for i in range(1, rows - 1):
-            for j in [0, cols - 1]:
-                if not self.grid[i, j] and random.random() < self.immune_spawn:
-                    self.spawn_possible_cell(i, j)
-        # recruit_immune_cells(self, self.kill_count, self.failure_count)
+    def _end_step(self):
+        """Keep the attack outcomes of the finished step and hand its events to the observers."""
+        self.last_kill_count = self.kill_count
+        self.last_failure_count = self.failure_count
         self.kill_count = 0
         self.failure_count= 0
+        self.events.end_step()
+
+    def add_observer(self, observer):
+        """
+        Register `observer(events)`, called at the end of every step.
+
+        `events` is a structured array (events.EVENT_DTYPE) of the births, deaths, moves
+        and attacks of the step, in the order they happened.
+        """
+        self.events.add_observer(observer)
+
+    def remove_observer(self, observer):
+        """Unregister an observer added with `add_observer`."""
+        self.events.remove_observer(observer)
+
+    def _spawn_border_immune_cells(self):
+        """
+        Spawn immune cells on empty border sites with probability immune_spawn.
+
+        The uniforms of all border sites are drawn as one array per step.
+        """
+        border = self._border_sites
+        hits = border[self.rng.generator.random(len(border)) < self.immune_spawn]
+        for i, j in hits.tolist():
+            if not self.grid[i, j]:
+                self.spawn_possible_cell(i, j)
 
 
     def neighbors(self, cell) -> list[tuple[int, int]]:
@@ -158,38 +499,111 @@ class Grid:
 
     
     def count_cells(self, cell_types : tuple):
-        """Count the number of cells of a specific type in the grid."""
-        count = 0
-        for cell in self.cells.values():
-            if isinstance(cell_types, tuple):
-                for cell_type in cell_types:
-                    if isinstance(cell, cell_type):
-                        count += 1
-            else:
-                if isinstance(cell, cell_types):
-                    count += 1
-        return count
+        """Count the number of cells of a specific type (class or tuple of classes) in the grid."""
+        return sum(
+            count for (cls, _), count in self._counts.items()
+            if issubclass(cls, cell_types)
+        )
+
+    def population_counts(self) -> dict:
+        """Return the number of cells of every type in the grid."""
+        counts = {
+            "regular_tumor": 0,
+            "stem_tumor": 0,
+            "immune_type0": 0,
+            "immune_type1": 0,
+            "generic": 0,
+        }
+        for (cls, cell_type), count in self._counts.items():
+            if issubclass(cls, RegularTumorCell):
+                counts["regular_tumor"] += count
+            elif issubclass(cls, StemTumorCell):
+                counts["stem_tumor"] += count
+            elif issubclass(cls, ImmuneCell):
+                if cell_type == 0:
+                    counts["immune_type0"] += count
+                elif cell_type == 1:
+                    counts["immune_type1"] += count
+            elif issubclass(cls, Cell):
+                counts["generic"] += count
+        return counts
+
+    def custom_counts(self) -> dict[str, int]:
+        """Return the number of custom cells by their name."""
+        return {name: count for name, count in self._named_counts.items() if count > 0}
 
     def empty_cells(self):
         """Return a list of empty positions in the grid."""
-        empty = []
-        for y in range(self.rows):
-            for x in range(self.cols):
-                if not self.grid[y][x]:
-                    empty.append((y, x))
-        return empty
+        cols = self.cols
+        return [divmod(site, cols) for site in self._free[:self._free_count]]
+
+    def sample_empty_positions(self, k: int) -> list[tuple[int, int]]:
+        """Return up to k distinct random empty positions in O(k)."""
+        free, slot = self._free, self._free_slot
+        k = min(k, self._free_count)
+        # Partial Fisher-Yates shuffle of the free list.
+        for i in range(k):
+            j = self.rng.randrange(i, self._free_count)
+            a, b = free[i], free[j]
+            free[i], free[j] = b, a
+            slot[b], slot[a] = i, j
+        cols = self.cols
+        return [divmod(site, cols) for site in free[:k]]
 
     def nearest_tumor_distance(self, position):
-        """Return the distance from the given position to the nearest tumor cell."""
-        min_dist = float('inf')
-        for cell in self.cells.values():
-            if cell.is_tumor_cell:
-                dist = np.sqrt((position[0] - cell.position[0]) ** 2 + (position[1] - cell.position[1]) ** 2)
-                if dist < min_dist:
-                    min_dist = dist
-        return min_dist
+        """Return the distance from the given position to the nearest tumor cell, a frontier index query."""
+        cell = self.cells.get(tuple(position))
+        if cell is not None and cell.is_tumor_cell:
+            return 0.0
+        keys = self._index_keys((RegularTumorCell, StemTumorCell))
+        nearest = self.tumor_frontier.nearest(keys, position, 1)
+        return nearest[0][0] if nearest else float('inf')
+
+    def nearest_tumor_distances(self, positions) -> list[float]:
+        """
+        Return `nearest_tumor_distance` for each of a group of nearby positions.
+
+        One nearest query from the middle of the group bounds the search for all of them,
+        so a single radius query collects every tumor cell that can be nearest to any of them.
+        """
+        if not positions:
+            return []
+        keys = self._index_keys((RegularTumorCell, StemTumorCell))
+        x0 = (min(x for x, _ in positions) + max(x for x, _ in positions)) // 2
+        y0 = (min(y for _, y in positions) + max(y for _, y in positions)) // 2
+        nearest = self.tumor_frontier.nearest(keys, (x0, y0), 1)
+        if not nearest:
+            return [float('inf')] * len(positions)
+        spread = max(math.hypot(x - x0, y - y0) for x, y in positions)
+        # The slack keeps the nearest cell itself when the radius rounds below its distance.
+        candidates = self.tumor_frontier.within_radius(keys, (x0, y0), nearest[0][0] + 2 * spread + 1e-6)
+        cells = self.cells
+        return [
+            0.0 if (x, y) in cells and cells[(x, y)].is_tumor_cell
+            else math.sqrt(min((px - x) ** 2 + (py - y) ** 2 for px, py in candidates))
+            for x, y in positions
+        ]
+
+    def nearest_cells(self, position, cell_class=Cell, k: int = 1, cell_type: int = None) -> list:
+        """
+        Return up to k cells closest to a position, nearest first.
+
+        Args:
+            position: Query position; a cell at this position is not returned.
+            cell_class: Class or tuple of classes of the cells to search for.
+            k (int): Number of cells to return.
+            cell_type (int): Only return immune cells of this type if given.
+        """
+        keys = self._index_keys(cell_class, cell_type)
+        return [self.cells[pos] for _, pos in self.spatial_index.nearest(keys, position, k, exclude=position)]
+
+    def cells_within_radius(self, position, radius: float, cell_class=Cell, cell_type: int = None) -> list:
+        """Return all cells of the given class (and immune type) within a radius of a position."""
+        keys = self._index_keys(cell_class, cell_type)
+        return [self.cells[pos] for pos in self.spatial_index.within_radius(keys, position, radius)]
 
     def get_random_empty_position(self):
         """Find a random empty spot on the grid"""
-        empty = [(i, j) for i in range(self.rows) for j in range(self.cols) if not self.grid[i, j]]
-        return random.choice(empty) if empty else None
+        if self._free_count == 0:
+            return None
+        return divmod(self._free[self.rng.randrange(self._free_count)], self.cols)
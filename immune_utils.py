@@ -1,5 +1,5 @@
-import random
 from cells import ImmuneCell, RegularTumorCell, StemTumorCell
+from events import RECRUITMENT
 
 def recruit_immune_cells(grid, v, f):
         """
@@ -18,10 +18,7 @@ def recruit_immune_cells(grid, v, f):
         if newborns <= 0:
             return
 
-        empty_cells = grid.empty_cells()
-        for _ in range(min(newborns, len(empty_cells))):
-            position = random.choice(empty_cells)
-            value = random.choice([0, 1])
-            new_cell = ImmuneCell(position, cell_type=value)
-            grid.add_cell(new_cell)
-            empty_cells.remove(position)
+        for position in grid.sample_empty_positions(newborns):
+            value = grid.rng.choice([0, 1])
+            new_cell = ImmuneCell(position, cell_type=value, rng=grid.rng)
+            grid.add_cell(new_cell, RECRUITMENT)
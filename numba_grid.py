@@ -0,0 +1,302 @@
+"""numba_grid.py"""
+import math
+import numpy as np
+from numpy.typing import NDArray
+from cells import RegularTumorCell, StemTumorCell, EMPTY, GENERIC, REGULAR_TUMOR, STEM_TUMOR, IMMUNE_NK
+from vectorized_grid import VectorizedGrid, NEIGHBOR_OFFSETS
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+NUMBA_AVAILABLE = numba is not None
+_NEIGHBOR_DX = np.ascontiguousarray(NEIGHBOR_OFFSETS[:, 0])
+_NEIGHBOR_DY = np.ascontiguousarray(NEIGHBOR_OFFSETS[:, 1])
+_SQRT2 = math.sqrt(2)
+
+
+def _kernel(function):
+    """Compile a kernel with Numba, or leave it as plain Python if Numba is not installed."""
+    if numba is None:
+        return function
+    return numba.njit(cache=True, nogil=True)(function)
+
+
+@_kernel
+def chamfer_kernel(mask, dist):
+    """
+    Write the (1, sqrt(2)) chamfer distance to the nearest True site of `mask` into `dist`.
+
+    Classic two-pass chamfer transform with the 3 x 3 mask: a forward raster scan
+    from the upper and left neighbors, then a backward scan from the lower and right ones.
+    """
+    rows, cols = mask.shape
+    for i in range(rows):
+        for j in range(cols):
+            if mask[i, j]:
+                dist[i, j] = 0.0
+                continue
+            d = np.inf
+            if j > 0:
+                d = min(d, dist[i, j - 1] + 1.0)
+            if i > 0:
+                d = min(d, dist[i - 1, j] + 1.0)
+                if j > 0:
+                    d = min(d, dist[i - 1, j - 1] + _SQRT2)
+                if j < cols - 1:
+                    d = min(d, dist[i - 1, j + 1] + _SQRT2)
+            dist[i, j] = d
+    for i in range(rows - 1, -1, -1):
+        for j in range(cols - 1, -1, -1):
+            d = dist[i, j]
+            if j < cols - 1:
+                d = min(d, dist[i, j + 1] + 1.0)
+            if i < rows - 1:
+                d = min(d, dist[i + 1, j] + 1.0)
+                if j < cols - 1:
+                    d = min(d, dist[i + 1, j + 1] + _SQRT2)
+                if j > 0:
+                    d = min(d, dist[i + 1, j - 1] + _SQRT2)
+            dist[i, j] = d
+
+
+@_kernel
+def claim_kernel(code, claimed, rows, cols, sources, order, scores, targets):
+    """
+    Assign to every source an empty, unclaimed neighboring site, in the given order.
+
+    Source `order[i]` claims its free neighbor with the lowest finite score of its
+    row of `scores` (shape (len(sources), 8), columns in NEIGHBOR_OFFSETS order);
+    random scores give a random free neighbor. Writes the claimed site into `targets`,
+    -1 where none is left.
+    """
+    for i in order:
+        x, y = divmod(sources[i], cols)
+        best = -1
+        best_score = np.inf
+        for k in range(8):
+            nx = x + _NEIGHBOR_DX[k]
+            ny = y + _NEIGHBOR_DY[k]
+            if nx < 0 or nx >= rows or ny < 0 or ny >= cols:
+                continue
+            n = nx * cols + ny
+            if code[n] == EMPTY and not claimed[n] and scores[i, k] < best_score:
+                best = n
+                best_score = scores[i, k]
+        targets[i] = best
+        if best >= 0:
+            claimed[best] = True
+
+
+@_kernel
+def division_kernel(code, p_remaining, chemotherapy_resistance, proliferation_decrease_coef, age, attacks_done,
+                    parents, children, division_u, symmetrical_rate, max_divisions):
+    """
+    Place the daughters of the cells at `parents` on the claimed sites `children`.
+
+    A regular tumor cell uses up one division and passes the remaining ones on, a stem
+    cell divides symmetrically if `division_u[i, 0]` is at most `symmetrical_rate`,
+    and tumor daughters get the chemotherapy resistance `division_u[i, 1] ** 2`.
+    """
+    for i in range(len(parents)):
+        parent = parents[i]
+        child = children[i]
+        parent_code = code[parent]
+        if parent_code == REGULAR_TUMOR:
+            p_remaining[parent] -= 1
+            child_code = REGULAR_TUMOR
+            child_divisions = p_remaining[parent]
+        elif parent_code == STEM_TUMOR:
+            child_code = STEM_TUMOR if division_u[i, 0] <= symmetrical_rate else REGULAR_TUMOR
+            child_divisions = max_divisions if child_code == REGULAR_TUMOR else 0
+        else:
+            child_code = parent_code
+            child_divisions = p_remaining[parent]
+        code[child] = child_code
+        p_remaining[child] = child_divisions
+        proliferation_decrease_coef[child] = proliferation_decrease_coef[parent]
+        if parent_code == GENERIC:
+            chemotherapy_resistance[child] = chemotherapy_resistance[parent]
+        else:
+            chemotherapy_resistance[child] = division_u[i, 1] ** 2
+        age[child] = 0
+        attacks_done[child] = 0
+
+
+@_kernel
+def attack_kernel(code, attacks_done, max_attacks, death_chance_of_attack, chance_of_succesfull_attack,
+                  rows, cols, sites, order, keys, attack_u, engaged, killed, dead, tallies):
+    """
+    Attacks of the immune cells at `sites` on their tumor neighbors, one cell at a time.
+
+    Neighbor counts and the tumor neighbors a cell may attack are taken before any
+    attack. In the given order, an NK cell attacks the tumor neighbor with the highest
+    `keys` entry, a CTL cell attacks its tumor neighbors in turn until it kills one, dies
+    or runs out of them. `attack_u[i, k]` holds the two uniforms (success, death on
+    failure) of the k-th attack. Killed cells are removed at once. Fills the boolean
+    `engaged`, `killed` and `dead` arrays over `sites` and adds the numbers of
+    successful and failed attacks to `tallies[0]` and `tallies[1]`.
+    """
+    n = len(sites)
+    tumor_bits = np.zeros(n, dtype=np.int32)
+    n_pt = np.zeros(n, dtype=np.int32)
+    n_i = np.zeros(n, dtype=np.int32)
+    for i in range(n):
+        x, y = divmod(sites[i], cols)
+        for k in range(8):
+            nx = x + _NEIGHBOR_DX[k]
+            ny = y + _NEIGHBOR_DY[k]
+            if nx < 0 or nx >= rows or ny < 0 or ny >= cols:
+                continue
+            neighbor = code[nx * cols + ny]
+            if neighbor == REGULAR_TUMOR or neighbor == STEM_TUMOR:
+                tumor_bits[i] |= 1 << k
+                n_pt[i] += 1
+            elif neighbor >= IMMUNE_NK:
+                n_i[i] += 1
+        engaged[i] = n_pt[i] > 0
+
+    for i in order:
+        if not engaged[i]:
+            continue
+        s = sites[i]
+        x, y = divmod(s, cols)
+        is_nk = code[s] == IMMUNE_NK
+        if is_nk:
+            best = -1.0
+            only = 0
+            for k in range(8):
+                if tumor_bits[i] & (1 << k) and keys[i, k] > best:
+                    best = keys[i, k]
+                    only = k
+            candidates = 1 << only
+        else:
+            candidates = tumor_bits[i]
+        attack = 0
+        for k in range(8):
+            if not candidates & (1 << k):
+                continue
+            target = (x + _NEIGHBOR_DX[k]) * cols + y + _NEIGHBOR_DY[k]
+            attacks_done[s] += 1
+            chance = chance_of_succesfull_attack[s] * (n_i[i] / n_pt[i])
+            if code[target] == STEM_TUMOR:
+                chance *= 0.2
+            elif code[target] != REGULAR_TUMOR:
+                chance = 0.0
+            chance *= 0.8 if is_nk else 1.2
+            success = attack_u[i, attack, 0] <= min(chance, 1.0)
+            exhausted = attacks_done[s] >= max_attacks[s]
+            if success:
+                code[target] = EMPTY
+                tallies[0] += 1
+                killed[i] = True
+                dead[i] = is_nk or exhausted
+                break
+            tallies[1] += 1
+            failure_death = 1.0 if n_i[i] == 0 else min(death_chance_of_attack[s] * n_pt[i] / n_i[i], 1.0)
+            if attack_u[i, attack, 1] <= failure_death or (exhausted and not is_nk):
+                dead[i] = True
+                break
+            attack += 1
+
+
+class NumbaGrid(VectorizedGrid):
+    """
+    VectorizedGrid whose sequential parts run as compiled per-site kernels.
+
+    Cell fates are drawn with array operations as in VectorizedGrid; the placement
+    of cells into empty neighbors, the divisions of tumor cells, the attacks of immune
+    cells and the tumor distance field are loops over sites compiled with Numba. Cells claim empty sites one at a time in
+    random order, so every cell with a free neighbor gets one. All random numbers are
+    drawn from the grid's stream beforehand, so runs are reproducible per seed and the
+    kernels give the same results compiled or, without Numba, as (slow) plain Python.
+    Use the "numba" engine of `Simulation`, which falls back to "vectorized" if Numba
+    is not installed.
+    """
+    @property
+    def tumor_distance(self) -> NDArray:
+        """Chamfer distance from every site to the nearest tumor cell, shaped (rows, cols)."""
+        tumor = (self.codes == REGULAR_TUMOR) | (self.codes == STEM_TUMOR)
+        dist = np.empty((self.rows, self.cols))
+        chamfer_kernel(tumor, dist)
+        return dist
+
+    def _claim_empty_neighbors(self, sources: NDArray, preferred=None) -> NDArray:
+        """Claim random empty neighbors with the compiled kernel; a `preferred` callable uses the NumPy rounds."""
+        if preferred is not None:
+            return super()._claim_empty_neighbors(sources, preferred)
+        return self._claim_scored_neighbors(sources)
+
+    def _claim_scored_neighbors(self, sources: NDArray, scores: NDArray = None) -> NDArray:
+        """
+        Assign to every source an empty neighboring site, each site to at most one source.
+
+        Sources claim in random order the free neighbor with the lowest finite score,
+        a random one if `scores` is None. Returns target sites, -1 where no site was left.
+        """
+        n = len(sources)
+        targets = np.full(n, -1, dtype=np.int64)
+        if n == 0:
+            return targets
+        if scores is None:
+            scores = self.rng.generator.random((n, len(NEIGHBOR_OFFSETS)))
+        order = self.rng.generator.permutation(n)
+        claimed = np.zeros(self.code.shape, dtype=bool)
+        claim_kernel(self.code, claimed, self.rows, self.cols, sources, order, scores, targets)
+        return targets
+
+    def _tumor_actions(self):
+        """Apoptosis, proliferation and migration of tumor and generic cells."""
+        sites = self._acting_sites((self.code >= GENERIC) & (self.code <= STEM_TUMOR))
+        if len(sites) == 0:
+            return
+        dies, divides, migrates = self._tumor_fates(sites)
+        self.code[sites[dies]] = EMPTY
+
+        movers = sites[divides | migrates]
+        dividing = divides[divides | migrates]
+        targets = self._claim_empty_neighbors(movers)
+        placed = targets >= 0
+
+        migrants, migrant_targets = movers[placed & ~dividing], targets[placed & ~dividing]
+        self._copy_state(migrant_targets, migrants)
+        self.code[migrants] = EMPTY
+
+        parents, children = movers[placed & dividing], targets[placed & dividing]
+        division_kernel(
+            self.code, self.p_remaining, self.chemotherapy_resistance, self.proliferation_decrease_coef,
+            self.age, self.attacks_done, parents, children, self.rng.generator.random((len(parents), 2)),
+            StemTumorCell.RATES.get('symmetrical_division', 0.0), RegularTumorCell.MAX_DIVISIONS,
+        )
+
+    def _immune_attacks(self, sites: NDArray):
+        n = len(sites)
+        generator = self.rng.generator
+        order = generator.permutation(n)
+        keys = generator.random((n, len(NEIGHBOR_OFFSETS)))
+        attack_u = generator.random((n, len(NEIGHBOR_OFFSETS), 2))
+        engaged = np.zeros(n, dtype=bool)
+        killed = np.zeros(n, dtype=bool)
+        dead = np.zeros(n, dtype=bool)
+        tallies = np.zeros(2, dtype=np.int64)
+        attack_kernel(
+            self.code, self.attacks_done, self.max_attacks, self.death_chance_of_attack,
+            self.chance_of_succesfull_attack, self.rows, self.cols, sites, order, keys, attack_u,
+            engaged, killed, dead, tallies,
+        )
+        self.kill_count += int(tallies[0])
+        self.failure_count += int(tallies[1])
+        return engaged, killed, dead
+
+    def _immune_migration(self, sites: NDArray):
+        """Immune cells move to the empty neighbor closest to the nearest tumor cell."""
+        if len(sites) == 0:
+            return
+        distance = self.tumor_distance.ravel()
+        neighbors, valid = self._neighbor_sites(sites)
+        targets = self._claim_scored_neighbors(sites, np.where(valid, distance[neighbors], np.inf))
+        placed = targets >= 0
+        sources, targets = sites[placed], targets[placed]
+        self._copy_state(targets, sources)
+        self.code[sources] = EMPTY
@@ -0,0 +1,27 @@
+"""parameters.py"""
+
+DEFAULT_PARAMETERS = {
+    "regular_tumor": {
+        "apoptosis_rate": 0.05,
+        "proliferation_rate": 0.25,
+        "migration_rate": 0.05,
+        "max_divisions": 5,
+        "proliferation_decrease_coef": 0.3,
+        "death_chemotherapy_chance": 0.15,
+    },
+    "stem_tumor": {
+        "apoptosis_rate": 0.0,
+        "proliferation_rate": 0.25,
+        "migration_rate": 0.05,
+        "symmetrical_division_rate": 0.1,
+        "proliferation_decrease_coef": 0.2,
+        "death_chemotherapy_chance": 0.12,
+    },
+    "immune": {
+        "apoptosis_rate": 0.08,
+        "proliferation_rate": 0.15,
+        "migration_rate": 0.3,
+        "proliferation_decrease_coef": 0.16,
+        "death_chemotherapy_chance": 0.1,
+    },
+}
@@ -0,0 +1,113 @@
+"""profiling.py"""
+import time
+from contextlib import contextmanager, nullcontext
+from cells import cell_code, GENERIC, REGULAR_TUMOR, STEM_TUMOR, IMMUNE_NK, IMMUNE_CTL
+from events import CAUSE_NAMES
+
+CELL_LABELS = {
+    GENERIC: "generic",
+    REGULAR_TUMOR: "RTC",
+    STEM_TUMOR: "STC",
+    IMMUNE_NK: "NK",
+    IMMUNE_CTL: "CTL",
+}
+_NO_PHASE = nullcontext()
+
+
+def phase(profiler, name: str):
+    """Return a context manager timing a phase on `profiler`, a no-op if it is None."""
+    return _NO_PHASE if profiler is None else profiler.phase(name)
+
+
+def action_name(cause: int) -> str:
+    """Return the action name of an event cause, "idle" for no event (cause 0)."""
+    return CAUSE_NAMES.get(cause, "idle")
+
+
+def cell_label(cell) -> str:
+    """Return the profiling label of a cell: its custom name, or RTC, STC, NK, CTL, generic."""
+    name = getattr(cell, "name", None)
+    if name is not None:
+        return f"custom:{name}"
+    return CELL_LABELS[cell_code(cell)]
+
+
+class StepProfiler:
+    """
+    Accumulated wall time and call counts of the phases of simulation steps.
+
+    Phases are parts of a step (schedule, cells, border_spawn, recruitment, events,
+    chemotherapy, immunotherapy, ...). The time of the "cells" phase is further
+    attributed to (cell label, action) pairs, where the action is the cause of the
+    first event the cell produced (proliferation, migration, apoptosis, kill, ...)
+    or "idle" if it produced none.
+
+    Usage:
+        profiler = simulation.enable_profiling()
+        simulation.run(100)
+        print(profiler.format())
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Drop all accumulated measurements."""
+        self.steps = 0
+        self.phases: dict[str, list] = {}
+        self.cells: dict[tuple[str, str], list] = {}
+
+    def add_phase(self, name: str, seconds: float, calls: int = 1):
+        entry = self.phases.get(name)
+        if entry is None:
+            self.phases[name] = [seconds, calls]
+        else:
+            entry[0] += seconds
+            entry[1] += calls
+
+    def add_cell(self, label: str, action: str, seconds: float):
+        key = (label, action)
+        entry = self.cells.get(key)
+        if entry is None:
+            self.cells[key] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time the enclosed block as one call of a phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - start)
+
+    def report(self) -> dict:
+        """
+        Return the measurements.
+
+        Returns:
+            {"steps": n, "phases": {phase: {"seconds", "calls"}},
+             "cells": {label: {action: {"seconds", "calls"}}}}
+        """
+        cells = {}
+        for (label, action), (seconds, calls) in sorted(self.cells.items()):
+            cells.setdefault(label, {})[action] = {"seconds": seconds, "calls": calls}
+        return {
+            "steps": self.steps,
+            "phases": {name: {"seconds": seconds, "calls": calls}
+                       for name, (seconds, calls) in self.phases.items()},
+            "cells": cells,
+        }
+
+    def format(self) -> str:
+        """Return the measurements as a text table, most expensive first."""
+        lines = [f"Profiled steps: {self.steps}",
+                 f"{'phase':<28}{'total s':>10}{'calls':>10}{'mean ms':>10}"]
+        for name, (seconds, calls) in sorted(self.phases.items(), key=lambda item: -item[1][0]):
+            lines.append(f"{name:<28}{seconds:>10.3f}{calls:>10}{1000 * seconds / calls:>10.3f}")
+        if self.cells:
+            lines.append(f"{'cell / action':<28}{'total s':>10}{'calls':>10}{'mean us':>10}")
+        for (label, action), (seconds, calls) in sorted(self.cells.items(), key=lambda item: -item[1][0]):
+            lines.append(f"{label + ' ' + action:<28}{seconds:>10.3f}{calls:>10}{1e6 * seconds / calls:>10.1f}")
+        return "\n".join(lines)
@@ -0,0 +1,132 @@
+"""recorder.py"""
+import json
+import os
+import numpy as np
+from numpy.typing import NDArray
+
+META_FILE = "meta.json"
+
+
+class MetricsRecorder:
+    """
+    Append-only columnar recorder of per-step simulation metrics.
+
+    Every metric is a column stored as a raw little-endian binary file `<name>.bin` in the
+    recorder directory, `meta.json` lists the columns, their dtypes and the number of
+    rows written so far. Rows are collected in preallocated NumPy buffers and appended
+    to the files every `chunk_size` steps, so memory use does not grow with the run.
+    The row count in `meta.json` is updated only after the data is written, so readers
+    (`read_metrics`) can memory-map the files while the run is still in progress.
+
+    Used as a `Simulation.run` callback:
+        with MetricsRecorder("metrics") as recorder:
+            simulation.run(100000, callback=recorder)
+    """
+    def __init__(self, path: str, chunk_size: int = 1024):
+        if chunk_size < 1:
+            raise ValueError("Chunk size must be positive.")
+        self.path = path
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self._columns: dict[str, np.dtype] = {}
+        self._buffers: dict[str, NDArray] = {}
+        self._buffered = 0
+        os.makedirs(path, exist_ok=True)
+
+    def _metrics(self, simulation) -> dict:
+        grid = simulation.grid
+        metrics = {
+            "step": simulation.current_step,
+            "wall_time": simulation.last_step_time,
+            "cells": grid.num_cells,
+        }
+        metrics.update(grid.population_counts())
+        metrics.update({
+            "kill_count": grid.last_kill_count,
+            "failure_count": grid.last_failure_count,
+            "immune_spawn": grid.immune_spawn,
+            "chemotherapy_applied": simulation.chemotherapy_applied,
+            "immunotherapy_active": simulation.immunotherapy_active,
+        })
+        return metrics
+
+    def _start(self, metrics: dict):
+        """Define the columns from the first row and create empty column files."""
+        for name, value in metrics.items():
+            if isinstance(value, (bool, np.bool_)):
+                dtype = np.dtype(np.uint8)
+            elif isinstance(value, (int, np.integer)):
+                dtype = np.dtype("<i8")
+            else:
+                dtype = np.dtype("<f8")
+            self._columns[name] = dtype
+            self._buffers[name] = np.zeros(self.chunk_size, dtype=dtype)
+            open(self._column_path(name), "wb").close()
+        self._write_meta()
+
+    def _column_path(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _write_meta(self):
+        meta = {
+            "rows": self.rows,
+            "columns": {name: dtype.str for name, dtype in self._columns.items()},
+        }
+        tmp_path = os.path.join(self.path, META_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(self.path, META_FILE))
+
+    def record(self, simulation):
+        """Append the metrics of the last step of a simulation."""
+        metrics = self._metrics(simulation)
+        if not self._columns:
+            self._start(metrics)
+        i = self._buffered
+        for name, buffer in self._buffers.items():
+            buffer[i] = metrics.get(name, 0)
+        self._buffered += 1
+        if self._buffered == self.chunk_size:
+            self.flush()
+
+    __call__ = record
+
+    def flush(self):
+        """Append the buffered rows to the column files."""
+        if not self._buffered:
+            return
+        for name, buffer in self._buffers.items():
+            with open(self._column_path(name), "ab") as f:
+                f.write(buffer[:self._buffered].tobytes())
+        self.rows += self._buffered
+        self._buffered = 0
+        self._write_meta()
+
+    def close(self):
+        """Write the remaining buffered rows."""
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_metrics(path: str) -> dict[str, NDArray]:
+    """
+    Memory-map the columns written by a MetricsRecorder.
+
+    Only the rows that are completely written are returned, so this is safe to call
+    while the run is still in progress.
+    """
+    with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    rows = meta["rows"]
+    columns = {}
+    for name, dtype in meta["columns"].items():
+        if rows == 0:
+            columns[name] = np.zeros(0, dtype=dtype)
+        else:
+            columns[name] = np.memmap(os.path.join(path, f"{name}.bin"), dtype=dtype, mode="r", shape=(rows,))
+    return columns
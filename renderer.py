@@ -0,0 +1,66 @@
+"""renderer.py"""
+import numpy as np
+from numpy.typing import NDArray
+from PyQt5.QtGui import QColor, QImage, QPainterPath
+from cells import EMPTY, GENERIC, REGULAR_TUMOR, STEM_TUMOR, IMMUNE_NK, IMMUNE_CTL
+
+CELL_COLORS = {
+    EMPTY: "#FFFFFF",
+    GENERIC: "#000000",
+    REGULAR_TUMOR: "#FF5733",
+    STEM_TUMOR: "#C70039",
+    IMMUNE_NK: "#33FF57",
+    IMMUNE_CTL: "#33C1FF",
+}
+
+
+def lattice_slice(codes: NDArray, axis: int = 0, index: int = None) -> NDArray:
+    """Return the slice of a 3D lattice at `index` along `axis` (the middle one if None), 2D lattices as they are."""
+    if codes.ndim == 2:
+        return codes
+    return np.take(codes, codes.shape[axis] // 2 if index is None else index, axis=axis)
+
+
+class GridRenderer:
+    """
+    Draw a grid into a single RGB image, one pixel per site.
+
+    Cell type codes are mapped to colors through a lookup table in one NumPy
+    indexing operation; cells with their own color (custom cells) are painted on top.
+    The returned QImage shares memory with the renderer's buffer, which stays valid
+    until the next call of `render`.
+    """
+    def __init__(self, colors: dict[int, str] = None):
+        self.lut: NDArray = np.zeros((256, 3), dtype=np.uint8)
+        for code, color in (colors or CELL_COLORS).items():
+            qcolor = QColor(color)
+            self.lut[code] = (qcolor.red(), qcolor.green(), qcolor.blue())
+        self._buffer: NDArray = None
+
+    def render(self, grid, axis: int = 0, index: int = None) -> QImage:
+        """Return an image of the grid with `rows` lines of `cols` pixels, of a slice for 3D grids."""
+        colors = {position: grid.cells[position].color[:3]
+                  for position in getattr(grid, "colored_positions", ())}
+        return self.render_codes(lattice_slice(grid.codes, axis, index), colors)
+
+    def render_codes(self, codes: NDArray, colors: dict = None) -> QImage:
+        """Return an image of a lattice of cell type codes, `colors` maps positions to own colors."""
+        rgb = self.lut[codes]
+        for position, color in (colors or {}).items():
+            rgb[position] = color
+        self._buffer = rgb
+        rows, cols = codes.shape
+        return QImage(rgb.data, cols, rows, 3 * cols, QImage.Format_RGB888)
+
+
+def grid_lines_path(rows: int, cols: int, cell_size: float) -> QPainterPath:
+    """Return a path with the lines between grid sites."""
+    path = QPainterPath()
+    width, height = cols * cell_size, rows * cell_size
+    for i in range(rows + 1):
+        path.moveTo(0, i * cell_size)
+        path.lineTo(width, i * cell_size)
+    for j in range(cols + 1):
+        path.moveTo(j * cell_size, 0)
+        path.lineTo(j * cell_size, height)
+    return path
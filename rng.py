@@ -0,0 +1,95 @@
+"""rng.py"""
+import random
+import numpy as np
+
+
+class SimulationRNG(random.Random):
+    """
+    Random number streams of one simulation run.
+
+    Seeded from a `numpy.random.SeedSequence`: scalar draws (`random()`, `choice()`,
+    `randint()`, ...) use the Mersenne Twister of `random.Random`, array draws use
+    `generator`, a NumPy Generator seeded from an independent child of the same sequence.
+    `spawn()` derives statistically independent streams, e.g. one per ensemble replicate.
+
+    Beta(0.5, 1) variates, drawn for the chemotherapy resistance of every newborn cell,
+    are generated in blocks of POOL_SIZE by the NumPy generator and handed out from a
+    buffer. Uniforms stay with `random()`: a single C call is cheaper than any
+    Python-level buffer, array consumers draw blocks from `generator` directly.
+    """
+    POOL_SIZE = 4096
+
+    def __init__(self, seed=None):
+        """
+        Initialize the streams.
+
+        Args:
+            seed: Integer, `SeedSequence` or None (fresh entropy from the OS).
+        """
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        self.seed_sequence: np.random.SeedSequence = seed
+        scalar_seed, array_seed = seed.spawn(2)
+        super().__init__(int.from_bytes(scalar_seed.generate_state(8).tobytes(), "little"))
+        self.generator: np.random.Generator = np.random.default_rng(array_seed)
+        self._beta_pool = iter(())
+
+    @property
+    def entropy(self):
+        """Root entropy of the seed sequence, enough to recreate a top-level stream."""
+        return self.seed_sequence.entropy
+
+    def spawn(self, n: int) -> list["SimulationRNG"]:
+        """Return n independent child streams."""
+        return [SimulationRNG(child) for child in self.seed_sequence.spawn(n)]
+
+    def betavariate(self, alpha: float, beta: float) -> float:
+        """Beta distribution, Beta(0.5, 1) is served from a pool."""
+        if alpha == 0.5 and beta == 1.0:
+            try:
+                return next(self._beta_pool)
+            except StopIteration:
+                # If U ~ U(0, 1) then U ** 2 ~ Beta(0.5, 1).
+                self._beta_pool = iter((self.generator.random(self.POOL_SIZE) ** 2).tolist())
+                return next(self._beta_pool)
+        return super().betavariate(alpha, beta)
+
+    def get_full_state(self) -> dict:
+        """Return the state of both streams, the Beta pool and the seed sequence as plain Python objects."""
+        pool = list(self._beta_pool)
+        self._beta_pool = iter(pool)
+        version, internal, gauss = self.getstate()
+        seed = self.seed_sequence
+        return {
+            "random": [version, list(internal), gauss],
+            "generator": self.generator.bit_generator.state,
+            "beta_pool": pool,
+            "seed_sequence": {
+                "entropy": seed.entropy,
+                "spawn_key": list(seed.spawn_key),
+                "n_children_spawned": seed.n_children_spawned,
+            },
+        }
+
+    def set_full_state(self, state: dict):
+        """Restore a state returned by `get_full_state`."""
+        version, internal, gauss = state["random"]
+        self.setstate((version, tuple(internal), gauss))
+        self.generator = np.random.default_rng()
+        self.generator.bit_generator.state = state["generator"]
+        self._beta_pool = iter(state["beta_pool"])
+        seed = state["seed_sequence"]
+        self.seed_sequence = np.random.SeedSequence(
+            seed["entropy"], spawn_key=tuple(seed["spawn_key"]),
+            n_children_spawned=seed["n_children_spawned"])
+
+    @classmethod
+    def from_full_state(cls, state: dict) -> "SimulationRNG":
+        """Create a stream from a state returned by `get_full_state`."""
+        rng = cls.__new__(cls)
+        random.Random.__init__(rng)
+        rng.set_full_state(state)
+        return rng
+
+    def __reduce__(self):
+        return SimulationRNG.from_full_state, (self.get_full_state(),)
@@ -0,0 +1,180 @@
+"""Run the tumor growth simulation without GUI and write population counts to disk."""
+import argparse
+import csv
+import json
+import os
+import time
+from grid import Grid
+from simulation import Simulation, ENGINES
+from checkpoint import AutoSaver, load_checkpoint
+from recorder import MetricsRecorder
+from trajectory import TrajectoryWriter
+
+# Options that define the simulation itself; a resumed run takes them from the checkpoint.
+SIMULATION_OPTIONS = ("size", "tumor_radius", "chemo_interval", "immuno_interval", "immuno_duration",
+                      "parameters", "engine", "depth", "workers", "transport", "schedule",
+                      "schedule_seed", "seed", "recruitment")
+# Outputs a resumed run would overwrite from the checkpoint step on.
+OUTPUT_OPTIONS = ("output", "metrics", "trajectory", "slices")
+
+
+def parse_args(argv=None):
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Headless tumor growth simulation.")
+    parser.add_argument("--size", type=int, default=50, help="Grid size (rows = cols).")
+    parser.add_argument("--steps", type=int, default=1000, help="Number of steps to simulate.")
+    parser.add_argument("--tumor-radius", type=int, default=3, help="Initial tumor radius.")
+    parser.add_argument("--chemo-interval", type=int, default=None,
+                        help="Apply chemotherapy every N steps.")
+    parser.add_argument("--immuno-interval", type=int, default=None,
+                        help="Start immunotherapy every N steps.")
+    parser.add_argument("--immuno-duration", type=int, default=10,
+                        help="Duration of immunotherapy in steps.")
+    parser.add_argument("--parameters", default=None,
+                        help="JSON file with cell parameters (see parameters.DEFAULT_PARAMETERS).")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="object",
+                        help="Grid implementation.")
+    parser.add_argument("--depth", type=int, default=None,
+                        help="Number of slices of the vectorized3d lattice, equal to --size if not given.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of worker processes of the decomposed engine, all cores if not given.")
+    parser.add_argument("--transport", choices=("pipe", "socket"), default="pipe",
+                        help="Links between the stripes of the decomposed engine.")
+    parser.add_argument("--schedule", choices=Grid.SCHEDULE_ORDERS, default="raster",
+                        help="Order in which cells act (object and sparse engines).")
+    parser.add_argument("--schedule-seed", type=int, default=0,
+                        help="Seed of the 'seeded' schedule.")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Seed of the run, random if not given.")
+    parser.add_argument("--recruitment", action="store_true",
+                        help="Recruit immune cells globally after successful attacks.")
+    parser.add_argument("--output", default="simulation.csv",
+                        help="CSV file for per-step population counts.")
+    parser.add_argument("--metrics", default=None,
+                        help="Directory for the columnar per-step metrics (see recorder.read_metrics).")
+    parser.add_argument("--trajectory", default=None,
+                        help="Directory for the full lattice history (all engines but sparse).")
+    parser.add_argument("--slices", default=None,
+                        help="Directory for PNG images of the lattice (its middle slice on the 3D engine).")
+    parser.add_argument("--slice-interval", type=int, default=10,
+                        help="Save a lattice image every N steps.")
+    parser.add_argument("--keyframe-interval", type=int, default=100,
+                        help="Store a full trajectory keyframe every N steps, diffs in between.")
+    parser.add_argument("--checkpoint", default=None,
+                        help="Checkpoint directory, saved in the background during the run (2D engines only).")
+    parser.add_argument("--checkpoint-interval", type=int, default=500,
+                        help="Save a checkpoint every N steps.")
+    parser.add_argument("--resume", default=None,
+                        help="Continue from a checkpoint directory up to --steps steps in total "
+                             "(simulation options are taken from the checkpoint, outputs must be new paths).")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print the time spent in every step phase and cell class after the run.")
+    parser.add_argument("--quiet", action="store_true", help="Do not print progress.")
+    args = parser.parse_args(argv)
+    if args.checkpoint and args.engine == "vectorized3d":
+        parser.error("--checkpoint is not supported by --engine vectorized3d (checkpoints store 2D grids only)")
+    if args.resume:
+        ignored = [name for name in SIMULATION_OPTIONS if getattr(args, name) != parser.get_default(name)]
+        if ignored:
+            parser.error("--resume takes the simulation from the checkpoint, remove "
+                         + ", ".join("--" + name.replace("_", "-") for name in ignored))
+        for name in OUTPUT_OPTIONS:
+            path = getattr(args, name)
+            if path and os.path.exists(path) and not (os.path.isdir(path) and not os.listdir(path)):
+                parser.error(f"--{name} {path} already exists, a resumed run writes its outputs to new paths")
+    return args
+
+
+def slice_saver(path: str, interval: int):
+    """Return a callback saving a PNG image of the lattice (middle slice of 3D grids) every `interval` steps."""
+    from renderer import GridRenderer
+    os.makedirs(path, exist_ok=True)
+    renderer = GridRenderer()
+
+    def save(simulation):
+        if simulation.current_step % interval == 0:
+            image = renderer.render(simulation.grid)
+            image.save(os.path.join(path, f"step_{simulation.current_step:06d}.png"))
+    return save
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    parameters = {}
+    if args.parameters:
+        with open(args.parameters, "r", encoding="utf-8") as f:
+            parameters = json.load(f)
+    grid_options = {}
+    if args.engine in ("object", "sparse"):
+        grid_options = {"schedule_order": args.schedule, "schedule_seed": args.schedule_seed}
+    elif args.engine == "vectorized3d" and args.depth is not None:
+        grid_options = {"depth": args.depth}
+    elif args.engine == "decomposed":
+        grid_options = {"workers": args.workers, "transport": args.transport}
+
+    if args.resume:
+        simulation = load_checkpoint(args.resume)
+    else:
+        simulation = Simulation(
+            rows=args.size,
+            initial_tumor_radius=args.tumor_radius,
+            chemo_interval=args.chemo_interval,
+            immuno_interval=args.immuno_interval,
+            immuno_duration=args.immuno_duration,
+            parameters=parameters,
+            engine=args.engine,
+            immune_recruitment=args.recruitment,
+            grid_options=grid_options,
+            seed=args.seed,
+        )
+    num_steps = max(args.steps - simulation.current_step, 0)
+    profiler = simulation.enable_profiling() if args.profile else None
+    saver = AutoSaver(args.checkpoint, args.checkpoint_interval) if args.checkpoint else None
+    recorder = MetricsRecorder(args.metrics) if args.metrics else None
+    trajectory = TrajectoryWriter(args.trajectory, args.keyframe_interval) if args.trajectory else None
+    if trajectory is not None:
+        trajectory(simulation)
+    slices = slice_saver(args.slices, args.slice_interval) if args.slices else None
+    if slices is not None:
+        slices(simulation)
+
+    with open(args.output, "w", newline="", encoding="utf-8") as f:
+        counts = simulation.population_counts()
+        writer = csv.writer(f)
+        writer.writerow(["step", "cells", *counts.keys()])
+        writer.writerow([simulation.current_step, simulation.grid.num_cells, *counts.values()])
+
+        def write_row(sim):
+            writer.writerow([sim.current_step, sim.grid.num_cells, *sim.population_counts().values()])
+            if recorder is not None:
+                recorder(sim)
+            if trajectory is not None:
+                trajectory(sim)
+            if slices is not None:
+                slices(sim)
+            if saver is not None:
+                saver(sim)
+            if not args.quiet and sim.current_step % 100 == 0:
+                print(f"Step: {sim.current_step}, Cells: {sim.grid.num_cells}")
+
+        start = time.perf_counter()
+        try:
+            simulation.run(num_steps, callback=write_row)
+        finally:
+            if recorder is not None:
+                recorder.close()
+            if trajectory is not None:
+                trajectory.close()
+            if saver is not None:
+                saver.close()
+        elapsed = time.perf_counter() - start
+
+    if not args.quiet:
+        print(f"Seed entropy: {simulation.rng.entropy}")
+        print(f"{num_steps} steps in {elapsed:.2f} s ({num_steps / max(elapsed, 1e-9):.1f} steps/s)")
+    if profiler is not None:
+        print(profiler.format())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""simulation.py"""
+import time
+import warnings
+import numpy as np
+from cells import RegularTumorCell, StemTumorCell, ImmuneCell
+from decomposed_grid import DecomposedGrid
+from grid import Grid
+from numba_grid import NumbaGrid, NUMBA_AVAILABLE
+from parameters import DEFAULT_PARAMETERS
+from profiling import StepProfiler, phase
+from rng import SimulationRNG
+from sparse_grid import SparseGrid
+from vectorized_grid import VectorizedGrid
+from vectorized_grid3d import VectorizedGrid3D
+
+ENGINES = {
+    "object": Grid,
+    "sparse": SparseGrid,
+    "vectorized": VectorizedGrid,
+    "numba": NumbaGrid,
+    "vectorized3d": VectorizedGrid3D,
+    "decomposed": DecomposedGrid,
+}
+
+
+def apply_parameters(parameters: dict = None):
+    """
+    Set the constants of all cell classes.
+
+    Args:
+        parameters (dict): Mapping with optional "regular_tumor", "stem_tumor" and "immune"
+        groups of `set_constants` arguments. Missing groups and keys use DEFAULT_PARAMETERS.
+    """
+    parameters = parameters or {}
+    groups = {
+        "regular_tumor": RegularTumorCell,
+        "stem_tumor": StemTumorCell,
+        "immune": ImmuneCell,
+    }
+    for group, cell_class in groups.items():
+        values = dict(DEFAULT_PARAMETERS[group])
+        values.update(parameters.get(group, {}))
+        cell_class.set_constants(**values)
+
+
+def current_parameters() -> dict:
+    """Return the current constants of all cell classes in the format of DEFAULT_PARAMETERS."""
+    def common(cell_class):
+        return {
+            "apoptosis_rate": cell_class.RATES['apoptosis'],
+            "proliferation_rate": cell_class.RATES['proliferation'],
+            "migration_rate": cell_class.RATES['migration'],
+            "proliferation_decrease_coef": cell_class.PROLIFERATION_DECREASE,
+            "death_chemotherapy_chance": cell_class.DEATH_CHEMOTHERAPY_CHANCE,
+        }
+    return {
+        "regular_tumor": dict(common(RegularTumorCell), max_divisions=RegularTumorCell.MAX_DIVISIONS),
+        "stem_tumor": dict(common(StemTumorCell),
+                           symmetrical_division_rate=StemTumorCell.RATES.get('symmetrical_division', 0.0)),
+        "immune": common(ImmuneCell),
+    }
+
+
+def restore_parameters(parameters: dict):
+    """
+    Set the constants of all cell classes to values returned by `current_parameters`.
+
+    The values are assigned as they are, without the checks of `set_constants`: a
+    simulation that never applied parameters has the all-zero default rates.
+    """
+    groups = {
+        "regular_tumor": RegularTumorCell,
+        "stem_tumor": StemTumorCell,
+        "immune": ImmuneCell,
+    }
+    for group, cell_class in groups.items():
+        values = parameters[group]
+        cell_class.RATES = {
+            'apoptosis': values["apoptosis_rate"],
+            'proliferation': values["proliferation_rate"],
+            'migration': values["migration_rate"],
+        }
+        cell_class.PROLIFERATION_DECREASE = values["proliferation_decrease_coef"]
+        cell_class.DEATH_CHEMOTHERAPY_CHANCE = values["death_chemotherapy_chance"]
+    RegularTumorCell.MAX_DIVISIONS = parameters["regular_tumor"]["max_divisions"]
+    StemTumorCell.RATES['symmetrical_division'] = parameters["stem_tumor"]["symmetrical_division_rate"]
+
+
+class Simulation:
+    """Headless tumor growth simulation: grid, initial conditions and therapy schedule."""
+    def __init__(self, rows: int = 50, cols: int = None,
+                 initial_tumor_radius: int = 3,
+                 chemo_interval: int = None,
+                 immuno_interval: int = None,
+                 immuno_duration: int = 10,
+                 parameters: dict = None,
+                 engine: str = "object",
+                 immune_recruitment: bool = False,
+                 grid_options: dict = None,
+                 seed=None):
+        """
+        Initialize the simulation and place the initial tumor in the center of the grid.
+
+        Args:
+            rows (int): Number of grid rows.
+            cols (int): Number of grid columns, equal to rows if not given.
+            initial_tumor_radius (int): Radius of the initial circular tumor, no tumor if None.
+            chemo_interval (int): Apply chemotherapy every N steps, disabled if None.
+            immuno_interval (int): Start immunotherapy every N steps, disabled if None.
+            immuno_duration (int): Number of steps immunotherapy stays active.
+            parameters (dict): Cell parameters passed to `apply_parameters`,
+            None keeps the current constants of the cell classes.
+            engine (str): Grid implementation, one of ENGINES ("object", "sparse", "vectorized",
+            "numba", "vectorized3d" or "decomposed"); "numba" falls back to "vectorized" if Numba is not installed.
+            "vectorized3d" is a 3D lattice of depth rows (or grid_options["depth"]) with a
+            spherical initial tumor. "decomposed" runs the vectorized rules in worker
+            processes, one per stripe of rows (grid_options["workers"], all cores by default).
+            immune_recruitment (bool): Recruit immune cells at random empty sites
+            after every step based on successful and failed attacks.
+            grid_options (dict): Extra keyword arguments of the grid constructor,
+            e.g. {"schedule_order": "random"} for the object engine.
+            seed: Integer, `numpy.random.SeedSequence` or `SimulationRNG` the run is seeded from,
+            fresh OS entropy if None. Runs with equal seeds and settings are identical.
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine: {engine}.")
+        if engine == "numba" and not NUMBA_AVAILABLE:
+            warnings.warn("Numba is not installed, using the vectorized engine.", RuntimeWarning)
+            engine = "vectorized"
+        self.engine = engine
+        self.chemo_interval = chemo_interval
+        self.immuno_interval = immuno_interval
+        self.immunotherapy_duration = immuno_duration
+        self.immunotherapy_active = False
+        self.immunotherapy_iteration_counter = 0
+        self.current_step = 0
+        # Whether chemotherapy was applied in the last step and how long the step took.
+        self.chemotherapy_applied = False
+        self.last_step_time = 0.0
+
+        if parameters is not None:
+            apply_parameters(parameters)
+        self.rng: SimulationRNG = seed if isinstance(seed, SimulationRNG) else SimulationRNG(seed)
+        self.grid = ENGINES[engine](rows, rows if cols is None else cols, rng=self.rng, **(grid_options or {}))
+        self.grid.recruitment_enabled = immune_recruitment
+        if initial_tumor_radius is not None and hasattr(self.grid, "initialize_spheroid"):
+            self.grid.initialize_spheroid(initial_tumor_radius)
+        elif initial_tumor_radius is not None:
+            self.initialize_tumor(self.grid.rows // 2, self.grid.cols // 2, initial_tumor_radius)
+
+    def initialize_tumor(self, center_x, center_y, initial_radius=3):
+        """Initialize tumor cells in a circular pattern around the given center."""
+        cells = []
+        for i in range(max(center_x - initial_radius, 0), min(center_x + initial_radius + 1, self.grid.rows)):
+            for j in range(max(center_y - initial_radius, 0), min(center_y + initial_radius + 1, self.grid.cols)):
+                distance = np.sqrt((i - center_x) ** 2 + (j - center_y) ** 2)
+                if distance <= initial_radius:
+                    rand = self.rng.random()
+                    if rand < 0.5:
+                        cells.append(RegularTumorCell((i, j), rng=self.rng))
+                    else:
+                        cells.append(StemTumorCell((i, j), rng=self.rng))
+        if hasattr(self.grid, "fill_grid"):
+            self.grid.fill_grid(cells)
+        else:
+            for cell in cells:
+                self.grid.add_cell(cell)
+
+    def apply_chemotherapy(self):
+        """Apply chemotherapy to the grid once."""
+        with phase(self.grid.profiler, "chemotherapy"):
+            self.grid.apply_chemotherapy()
+
+    def start_immunotherapy(self, duration: int = None):
+        """Start immunotherapy for `duration` steps (the configured duration by default)."""
+        if duration is not None:
+            self.immunotherapy_duration = duration
+        self.immunotherapy_active = True
+        self.immunotherapy_iteration_counter = 0
+        with phase(self.grid.profiler, "immunotherapy"):
+            self.grid.apply_immunotherapy()
+
+    def step(self):
+        """Advance the simulation by one step, applying scheduled therapies first."""
+        start = time.perf_counter()
+        self.chemotherapy_applied = bool(self.chemo_interval) and self.current_step % self.chemo_interval == 0
+        if self.chemotherapy_applied:
+            self.apply_chemotherapy()
+
+        if self.immuno_interval and self.current_step % self.immuno_interval == 0:
+            self.start_immunotherapy()
+
+        if self.immunotherapy_active:
+            self.immunotherapy_iteration_counter += 1
+            if self.immunotherapy_iteration_counter >= self.immunotherapy_duration:
+                self.immunotherapy_active = False
+                with phase(self.grid.profiler, "immunotherapy"):
+                    self.grid.reset_all_immune_cells()
+
+        self.grid.make_action()
+        self.current_step += 1
+        self.last_step_time = time.perf_counter() - start
+
+    def run(self, num_steps: int, callback=None):
+        """
+        Run the simulation for a number of steps.
+
+        Args:
+            num_steps (int): Number of steps to perform.
+            callback (callable): Called as `callback(simulation)` after every step.
+        """
+        for _ in range(num_steps):
+            self.step()
+            if callback is not None:
+                callback(self)
+
+    def population_counts(self) -> dict:
+        """Return the number of cells of every type in the grid."""
+        return self.grid.population_counts()
+
+    def enable_profiling(self, profiler: StepProfiler = None) -> StepProfiler:
+        """
+        Start recording the cost of every step phase and cell class.
+
+        Args:
+            profiler (StepProfiler): Profiler to add the measurements to, a new one if None.
+        Returns:
+            The profiler in use.
+        """
+        self.grid.profiler = profiler if profiler is not None else StepProfiler()
+        return self.grid.profiler
+
+    def disable_profiling(self) -> StepProfiler:
+        """Stop profiling and return the profiler with the measurements (None if it was off)."""
+        profiler, self.grid.profiler = self.grid.profiler, None
+        return profiler
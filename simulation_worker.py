@@ -0,0 +1,113 @@
+"""simulation_worker.py"""
+import threading
+import time
+from typing import NamedTuple
+import numpy as np
+from numpy.typing import NDArray
+from PyQt5.QtCore import QThread
+
+
+class Snapshot(NamedTuple):
+    """Read-only copy of everything the GUI shows about one simulation step."""
+    step: int
+    num_cells: int
+    codes: NDArray                     # cell type codes, shaped (rows, cols), not writeable
+    colors: dict                       # position -> RGB of cells with their own color
+    counts: dict                       # Grid.population_counts()
+    custom_counts: dict                # Grid.custom_counts()
+
+    @classmethod
+    def capture(cls, simulation) -> "Snapshot":
+        """Copy the current state of a simulation; the caller must hold the worker lock."""
+        grid = simulation.grid
+        codes = np.array(grid.codes)
+        codes.setflags(write=False)
+        colors = {position: tuple(grid.cells[position].color[:3])
+                  for position in getattr(grid, "colored_positions", ())}
+        return cls(simulation.current_step, grid.num_cells, codes, colors,
+                   grid.population_counts(), grid.custom_counts())
+
+
+class SimulationWorker(QThread):
+    """
+    Thread that steps a simulation and publishes snapshots for the GUI.
+
+    The simulation is advanced every `step_interval` seconds, or as fast as possible when
+    it is 0. At most one snapshot per `frame_interval` is published; the GUI picks up the
+    latest one with `take_snapshot` and intermediate snapshots are dropped.
+
+    Code on other threads that reads or changes the simulation must hold `lock`:
+        with worker.lock:
+            worker.simulation.apply_chemotherapy()
+    """
+    def __init__(self, simulation=None, num_steps: int = 100, step_interval: float = 0.15,
+                 frame_interval: float = 1 / 30, parent=None):
+        super().__init__(parent)
+        self.lock = threading.RLock()
+        self.simulation = simulation
+        self.num_steps = num_steps
+        self.step_interval = step_interval
+        self.frame_interval = frame_interval
+        self._running = threading.Event()
+        self._stopped = False
+        self._latest: Snapshot = None
+        self._latest_lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._running.is_set()
+
+    def set_running(self, running: bool):
+        """Resume or pause stepping."""
+        if running:
+            self._running.set()
+        else:
+            self._running.clear()
+
+    def set_simulation(self, simulation):
+        """Replace the simulation being stepped."""
+        with self.lock:
+            self.simulation = simulation
+            self.publish()
+
+    def stop(self):
+        """Stop the thread and wait for it to finish."""
+        self._stopped = True
+        self._running.set()
+        self.wait()
+
+    def publish(self) -> Snapshot:
+        """Capture a snapshot of the simulation and make it the latest one."""
+        with self.lock:
+            snapshot = Snapshot.capture(self.simulation)
+        with self._latest_lock:
+            self._latest = snapshot
+        return snapshot
+
+    def take_snapshot(self) -> Snapshot:
+        """Return the latest snapshot not taken yet, None if there is none."""
+        with self._latest_lock:
+            snapshot, self._latest = self._latest, None
+        return snapshot
+
+    def run(self):
+        last_frame = next_step = time.perf_counter()
+        while not self._stopped:
+            if not self._running.wait(0.1):
+                continue
+            with self.lock:
+                if self._stopped:
+                    break
+                finished = self.simulation.current_step >= self.num_steps
+                if not finished:
+                    self.simulation.step()
+            now = time.perf_counter()
+            if finished or not self._running.is_set() or now - last_frame >= self.frame_interval:
+                self.publish()
+                last_frame = now
+            if finished:
+                self._running.clear()
+                continue
+            if self.step_interval > 0:
+                next_step = max(next_step + self.step_interval, now)
+                time.sleep(max(0.0, next_step - time.perf_counter()))
@@ -0,0 +1,231 @@
+"""sparse_grid.py"""
+import numpy as np
+from numpy.typing import NDArray
+from grid import Grid
+from cells import RegularTumorCell, StemTumorCell, ImmuneCell
+
+
+class Tile:
+    """
+    Fixed-size block of the lattice that contains at least one cell.
+
+    A tile keeps the set of its occupied sites until it holds more than `dense_count`
+    cells, then switches to a boolean occupancy array, so a lone cell (e.g. an immune
+    cell spawned on the border) does not allocate a full tile.
+    """
+    __slots__ = ("sites", "occupancy", "count")
+
+    def __init__(self):
+        self.sites: set[tuple[int, int]] = set()
+        self.occupancy: NDArray = None
+        self.count = 0
+
+
+class SparseGrid(Grid):
+    """
+    Grid for very large, mostly empty domains.
+
+    Occupancy is stored in fixed-size tiles that are allocated when the first cell enters
+    them and freed when the last cell leaves, so memory is proportional to the occupied
+    area instead of rows x cols. Dense per-site fields of `Grid` (neighbor count arrays,
+    free list) are replaced by queries on the cell dictionary and the spatial index;
+    dense views (`occupancy`, `empty_cells`, `tumor_distance_window`) are built for a
+    window of at most MAX_WINDOW_SITES sites.
+    """
+    MAX_WINDOW_SITES = 1 << 22
+
+    def __init__(self, rows: int, cols: int, tile_size: int = 64, bucket_size: int = 16, **kwargs):
+        self.tile_size: int = tile_size
+        # Tiles with more cells than this store an occupancy array instead of a set of sites.
+        self.dense_count: int = max(1, tile_size * tile_size // 64)
+        super().__init__(rows, cols, bucket_size=bucket_size, **kwargs)
+
+    def _init_lattice(self):
+        """Start with no tiles."""
+        self.tiles: dict[tuple[int, int], Tile] = {}
+
+    def _occupy(self, cell):
+        x, y = cell.position
+        ts = self.tile_size
+        key = (x // ts, y // ts)
+        tile = self.tiles.get(key)
+        if tile is None:
+            tile = self.tiles[key] = Tile()
+        site = (x % ts, y % ts)
+        if tile.occupancy is None:
+            tile.sites.add(site)
+            if len(tile.sites) > self.dense_count:
+                tile.occupancy = np.zeros((ts, ts), dtype=bool)
+                tile.occupancy[tuple(np.array(list(tile.sites)).T)] = True
+                tile.sites = None
+        else:
+            tile.occupancy[site] = True
+        tile.count += 1
+
+    def _vacate(self, cell):
+        x, y = cell.position
+        ts = self.tile_size
+        key = (x // ts, y // ts)
+        tile = self.tiles[key]
+        if tile.occupancy is None:
+            tile.sites.discard((x % ts, y % ts))
+        else:
+            tile.occupancy[x % ts, y % ts] = False
+        tile.count -= 1
+        if tile.count == 0:
+            del self.tiles[key]
+
+    @property
+    def num_empty(self) -> int:
+        """Return the number of empty positions in the grid."""
+        return self.rows * self.cols - len(self.cells)
+
+    def _window(self, x0: int, y0: int, x1: int, y1: int) -> tuple[int, int, int, int]:
+        """Fill in the whole-domain defaults of a window and check its bounds and size."""
+        x1 = self.rows if x1 is None else x1
+        y1 = self.cols if y1 is None else y1
+        if not (0 <= x0 < x1 <= self.rows and 0 <= y0 < y1 <= self.cols):
+            raise ValueError(f"Window [{x0}, {x1}) x [{y0}, {y1}) is outside the grid.")
+        if (x1 - x0) * (y1 - y0) > self.MAX_WINDOW_SITES:
+            raise ValueError(f"Window of {(x1 - x0) * (y1 - y0)} sites exceeds {self.MAX_WINDOW_SITES} sites, "
+                             f"pass a smaller window.")
+        return x0, y0, x1, y1
+
+    @property
+    def tumor_distance(self) -> NDArray:
+        """Euclidean distance from every site to the nearest tumor cell, for domains of at most MAX_WINDOW_SITES."""
+        return self.tumor_distance_window()
+
+    def tumor_distance_window(self, x0: int = 0, y0: int = 0, x1: int = None, y1: int = None) -> NDArray:
+        """
+        Return the exact Euclidean distance to the nearest tumor cell for the window [x0, x1) x [y0, y1).
+
+        The window is split into blocks; for every block one nearest query bounds the
+        tumor frontier cells that can be nearest to any of its sites, which are then
+        compared with all sites of the block at once.
+        """
+        x0, y0, x1, y1 = self._window(x0, y0, x1, y1)
+        distance = np.full((x1 - x0, y1 - y0), np.inf)
+        keys = self._index_keys((RegularTumorCell, StemTumorCell))
+        if not keys:
+            return distance
+        block = self.spatial_index.bucket_size
+        for bx in range(x0, x1, block):
+            for by in range(y0, y1, block):
+                ex, ey = min(bx + block, x1), min(by + block, y1)
+                center = ((bx + ex - 1) // 2, (by + ey - 1) // 2)
+                nearest = self.tumor_frontier.nearest(keys, center, 1)
+                if not nearest:
+                    continue
+                spread = np.hypot(max(center[0] - bx, ex - 1 - center[0]), max(center[1] - by, ey - 1 - center[1]))
+                radius = nearest[0][0] + 2 * spread + 1e-6
+                candidates = np.array(self.tumor_frontier.within_radius(keys, center, radius))
+                xs = np.arange(bx, ex)[:, None, None] - candidates[:, 0]
+                ys = np.arange(by, ey)[None, :, None] - candidates[:, 1]
+                distance[bx - x0:ex - x0, by - y0:ey - y0] = np.sqrt((xs * xs + ys * ys).min(axis=2))
+                # Sites inside the tumor are not reached by the frontier cells.
+                for x, y in self.spatial_index.within_radius(keys, center, spread):
+                    if bx <= x < ex and by <= y < ey:
+                        distance[x - x0, y - y0] = 0.0
+        return distance
+
+    def occupancy(self, x0: int, y0: int, x1: int, y1: int) -> NDArray:
+        """Return the boolean occupancy of the window [x0, x1) x [y0, y1)."""
+        window = np.zeros((x1 - x0, y1 - y0), dtype=bool)
+        ts = self.tile_size
+        for (tx, ty), tile in self.tiles.items():
+            ax0, ay0 = max(tx * ts, x0), max(ty * ts, y0)
+            ax1, ay1 = min((tx + 1) * ts, x1), min((ty + 1) * ts, y1)
+            if not (ax0 < ax1 and ay0 < ay1):
+                continue
+            if tile.occupancy is None:
+                for sx, sy in tile.sites:
+                    x, y = tx * ts + sx, ty * ts + sy
+                    if ax0 <= x < ax1 and ay0 <= y < ay1:
+                        window[x - x0, y - y0] = True
+            else:
+                window[ax0 - x0:ax1 - x0, ay0 - y0:ay1 - y0] = \
+                    tile.occupancy[ax0 - tx * ts:ax1 - tx * ts, ay0 - ty * ts:ay1 - ty * ts]
+        return window
+
+    def empty_neighbors(self, cell) -> list[tuple[int, int]]:
+        """Return a list of empty neighboring positions for a given cell."""
+        x, y = cell.position
+        cells = self.cells
+        neighbors = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                if dx == 0 and dy == 0:
+                    continue
+                new_x, new_y = x + dx, y + dy
+                if 0 <= new_x < self.rows and 0 <= new_y < self.cols and (new_x, new_y) not in cells:
+                    neighbors.append((new_x, new_y))
+        return neighbors
+
+    def neighbor_counts(self, position) -> tuple[int, int]:
+        """Return the numbers of (immune, tumor) cells neighboring a position."""
+        n_immune = n_tumor = 0
+        for cell in self._neighbors_at(position):
+            if cell.is_tumor_cell:
+                n_tumor += 1
+            elif isinstance(cell, ImmuneCell):
+                n_immune += 1
+        return n_immune, n_tumor
+
+    def _neighbors_at(self, position) -> list:
+        """Return the cells neighboring a position."""
+        x, y = position
+        cells = self.cells
+        return [
+            cells[(x + dx, y + dy)]
+            for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+            if (dx or dy) and (x + dx, y + dy) in cells
+        ]
+
+    def recount_neighbors(self):
+        """Neighbor counts are computed on demand, nothing to recount."""
+
+    def empty_cells(self, x0: int = 0, y0: int = 0, x1: int = None, y1: int = None) -> list[tuple[int, int]]:
+        """Return the empty positions of the window [x0, x1) x [y0, y1), the whole grid by default."""
+        x0, y0, x1, y1 = self._window(x0, y0, x1, y1)
+        xs, ys = np.nonzero(~self.occupancy(x0, y0, x1, y1))
+        return list(zip((xs + x0).tolist(), (ys + y0).tolist()))
+
+    def sample_empty_positions(self, k: int) -> list[tuple[int, int]]:
+        """Return up to k distinct random empty positions by rejection sampling."""
+        k = min(k, self.num_empty)
+        found = set()
+        while len(found) < k:
+            position = (self.rng.randrange(self.rows), self.rng.randrange(self.cols))
+            if position not in self.cells:
+                found.add(position)
+        return list(found)
+
+    def get_random_empty_position(self):
+        """Find a random empty spot on the grid"""
+        positions = self.sample_empty_positions(1)
+        return positions[0] if positions else None
+
+    def _spawn_border_immune_cells(self):
+        """
+        Spawn immune cells on empty border sites with probability immune_spawn.
+
+        Draws the number of spawn sites from a binomial distribution over the perimeter and
+        then that many distinct border sites, instead of one uniform per border site.
+        """
+        rows, cols = self.rows, self.cols
+        # Distinct sites of the first and last rows, and of every row in between.
+        top = cols if rows == 1 else 2 * cols
+        sides = 1 if cols == 1 else 2
+        perimeter = top + sides * max(rows - 2, 0)
+        num_sites = self.rng.generator.binomial(perimeter, self.immune_spawn)
+        if num_sites == 0:
+            return
+        for k in self.rng.generator.choice(perimeter, num_sites, replace=False).tolist():
+            if k < top:
+                position = (k // cols * (rows - 1), k % cols)
+            else:
+                k -= top
+                position = (1 + k // sides, k % sides * (cols - 1))
+            if position not in self.cells:
+                self.spawn_possible_cell(*position)
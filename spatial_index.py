@@ -0,0 +1,167 @@
+"""spatial_index.py"""
+import heapq
+import math
+from collections import defaultdict
+
+
+class SpatialHashIndex:
+    """
+    Positions bucketed into square tiles and grouped by key (e.g. cell class).
+
+    Radius queries only visit the buckets overlapping the query circle, and k-nearest
+    queries search rings of buckets outwards from the query position, stopping as soon
+    as no unvisited bucket can contain a closer position. When the query position is far
+    from everything, the occupied buckets are visited directly in order of distance.
+    """
+    def __init__(self, bucket_size: int = 8):
+        if bucket_size < 1:
+            raise ValueError("Bucket size must be positive.")
+        self.bucket_size: int = bucket_size
+        self._buckets: dict = defaultdict(lambda: defaultdict(set))
+        self._counts: dict = defaultdict(int)
+
+    def _bucket(self, position: tuple[int, int]) -> tuple[int, int]:
+        return position[0] // self.bucket_size, position[1] // self.bucket_size
+
+    @property
+    def keys(self) -> list:
+        """Keys that currently have at least one position."""
+        return [key for key, count in self._counts.items() if count > 0]
+
+    def count(self, key) -> int:
+        """Return the number of positions stored under a key."""
+        return self._counts.get(key, 0)
+
+    def insert(self, key, position: tuple[int, int]):
+        """Add a position under a key."""
+        self._buckets[key][self._bucket(position)].add(position)
+        self._counts[key] += 1
+
+    def remove(self, key, position: tuple[int, int]):
+        """Remove a position stored under a key."""
+        buckets = self._buckets[key]
+        bucket = self._bucket(position)
+        positions = buckets[bucket]
+        positions.discard(position)
+        if not positions:
+            del buckets[bucket]
+        self._counts[key] -= 1
+
+    def clear(self):
+        """Remove all positions."""
+        self._buckets.clear()
+        self._counts.clear()
+
+    def _ring(self, center: tuple[int, int], r: int):
+        """Yield the buckets at Chebyshev distance r from the center bucket."""
+        bx, by = center
+        if r == 0:
+            yield center
+            return
+        for dy in range(-r, r + 1):
+            yield bx - r, by + dy
+            yield bx + r, by + dy
+        for dx in range(-r + 1, r):
+            yield bx + dx, by - r
+            yield bx + dx, by + r
+
+    def within_radius(self, keys, position: tuple[int, int], radius: float) -> list[tuple[int, int]]:
+        """Return the positions under any of `keys` within `radius` of `position`."""
+        x, y = position
+        (bx0, by0), (bx1, by1) = (
+            self._bucket((math.floor(x - radius), math.floor(y - radius))),
+            self._bucket((math.floor(x + radius), math.floor(y + radius))),
+        )
+        radius_sq = radius * radius
+        size = self.bucket_size
+        found = []
+        for key in keys:
+            buckets = self._buckets.get(key)
+            if not buckets:
+                continue
+            if (bx1 - bx0 + 1) * (by1 - by0 + 1) > len(buckets):
+                candidates = (b for b in list(buckets) if bx0 <= b[0] <= bx1 and by0 <= b[1] <= by1)
+            else:
+                candidates = ((i, j) for i in range(bx0, bx1 + 1) for j in range(by0, by1 + 1))
+            for bucket in candidates:
+                positions = buckets.get(bucket)
+                if not positions:
+                    continue
+                # Skip buckets of the bounding box that lie entirely outside the circle.
+                dx = max(bucket[0] * size - x, 0, x - (bucket[0] * size + size - 1))
+                dy = max(bucket[1] * size - y, 0, y - (bucket[1] * size + size - 1))
+                if dx * dx + dy * dy > radius_sq:
+                    continue
+                for px, py in positions:
+                    if (px - x) ** 2 + (py - y) ** 2 <= radius_sq:
+                        found.append((px, py))
+        return found
+
+    def nearest(self, keys, position: tuple[int, int], k: int = 1,
+                exclude: tuple[int, int] = None) -> list[tuple[float, tuple[int, int]]]:
+        """
+        Return up to k (distance, position) pairs under any of `keys`, closest first.
+
+        Args:
+            keys: Keys to search.
+            position: Query position.
+            k (int): Number of positions to return.
+            exclude: Position to leave out of the result (usually the query position itself).
+        """
+        keys = [key for key in keys if self._counts.get(key, 0) > 0]
+        total = sum(self._counts[key] for key in keys)
+        if exclude is not None:
+            total -= sum(1 for key in keys if exclude in self._buckets[key].get(self._bucket(exclude), ()))
+        k = min(k, total)
+        if k <= 0:
+            return []
+        x, y = position
+        center = self._bucket(position)
+        best = []  # max-heap of (-distance, position)
+
+        size = self.bucket_size
+
+        def bound(bucket):
+            # Distance from the query position to the closest site of the bucket.
+            bx, by = bucket
+            return math.hypot(max(bx * size - x, 0, x - (bx * size + size - 1)),
+                              max(by * size - y, 0, y - (by * size + size - 1)))
+
+        def visit(bucket):
+            nonlocal seen
+            if len(best) == k and bound(bucket) > -best[0][0]:
+                return
+            for key in keys:
+                for p in self._buckets[key].get(bucket, ()):
+                    if p == exclude:
+                        continue
+                    seen += 1
+                    dist = math.hypot(p[0] - x, p[1] - y)
+                    if len(best) < k:
+                        heapq.heappush(best, (-dist, p))
+                    elif dist < -best[0][0]:
+                        heapq.heapreplace(best, (-dist, p))
+
+        num_occupied = sum(len(self._buckets[key]) for key in keys)
+        seen = 0
+        r = 0
+        # Search rings of buckets while they are cheaper than scanning the occupied ones.
+        while (2 * r + 1) ** 2 <= num_occupied:
+            for bucket in self._ring(center, r):
+                visit(bucket)
+            # Positions outside the visited rings are at least r * bucket_size + 1 away.
+            if seen >= total or (len(best) == k and -best[0][0] <= r * self.bucket_size + 1):
+                return sorted((-d, p) for d, p in best)
+            r += 1
+
+        # Far from everything: visit the remaining occupied buckets, closest first.
+        occupied = set()
+        for key in keys:
+            occupied.update(self._buckets[key])
+        remaining = sorted((bound(bucket), bucket) for bucket in occupied
+                           if max(abs(bucket[0] - center[0]), abs(bucket[1] - center[1])) >= r)
+        for distance, bucket in remaining:
+            if len(best) == k and distance > -best[0][0]:
+                break
+            visit(bucket)
+        return sorted((-d, p) for d, p in best)
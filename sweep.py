@@ -0,0 +1,281 @@
+"""sweep.py"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+import numpy as np
+from numpy.typing import NDArray
+from ensemble import EnsembleResult, run_replicate
+from simulation import DEFAULT_PARAMETERS, ENGINES
+
+# Simulation settings a sweep can vary besides the cell parameters.
+SETTINGS = ("chemo_interval", "immuno_interval", "immuno_duration", "initial_tumor_radius", "immune_recruitment")
+# Modules whose source decides the results; their hash is part of every cache key.
+CODE_MODULES = (
+    "cells", "decomposed_grid", "distance_field", "ensemble", "events", "grid", "immune_utils", "numba_grid", "profiling",
+    "rng", "simulation", "sparse_grid", "spatial_index", "vectorized_grid", "vectorized_grid3d",
+)
+DEFAULT_CACHE_DIR = "sweep_cache"
+
+
+def code_version() -> str:
+    """Return a hash of the source of the simulation modules."""
+    root = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256()
+    for module in CODE_MODULES:
+        with open(os.path.join(root, f"{module}.py"), "rb") as f:
+            digest.update(module.encode() + b"\0" + f.read() + b"\0")
+    return digest.hexdigest()
+
+
+def check_key(key: str):
+    """Raise ValueError unless `key` is a setting or a "group.parameter" of DEFAULT_PARAMETERS."""
+    if key in SETTINGS:
+        return
+    group, _, name = key.partition(".")
+    if group not in DEFAULT_PARAMETERS or name not in DEFAULT_PARAMETERS[group]:
+        raise ValueError(f"Unknown sweep parameter: {key}.")
+
+
+def grid_points(space: dict) -> list[dict]:
+    """Return every combination of the values of a {key: values} space."""
+    for key in space:
+        check_key(key)
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in product(*(space[key] for key in keys))]
+
+
+def random_points(ranges: dict, samples: int, seed: int = None) -> list[dict]:
+    """
+    Draw random points from a {key: range} space.
+
+    A range is a (low, high) tuple, sampled uniformly (integers inclusive if both
+    bounds are integers), or a list of values to choose from.
+    """
+    for key in ranges:
+        check_key(key)
+    generator = np.random.default_rng(seed)
+    points = [{} for _ in range(samples)]
+    for key, spec in ranges.items():
+        if isinstance(spec, list):
+            values = [spec[i] for i in generator.integers(len(spec), size=samples)]
+        else:
+            low, high = spec
+            if isinstance(low, int) and isinstance(high, int):
+                values = generator.integers(low, high + 1, size=samples).tolist()
+            else:
+                values = generator.uniform(low, high, size=samples).tolist()
+        for point, value in zip(points, values):
+            point[key] = value
+    return points
+
+
+def point_config(point: dict, base: dict) -> dict:
+    """
+    Return the `Simulation` keyword arguments of a sweep point.
+
+    The cell parameters are resolved completely (DEFAULT_PARAMETERS, then the base
+    config's "parameters", then the point), so equal configs have equal cache keys.
+    """
+    config = {key: value for key, value in base.items() if key != "parameters"}
+    parameters = {group: dict(values) for group, values in DEFAULT_PARAMETERS.items()}
+    for group, values in (base.get("parameters") or {}).items():
+        parameters[group].update(values)
+    for key, value in point.items():
+        check_key(key)
+        if key in SETTINGS:
+            config[key] = value
+        else:
+            group, _, name = key.partition(".")
+            parameters[group][name] = value
+    config["parameters"] = parameters
+    return config
+
+
+def result_key(config: dict, num_steps: int, seed, replicate: int, version: str) -> str:
+    """Return the content address of one replicate run."""
+    content = json.dumps({"config": config, "steps": num_steps, "seed": seed, "replicate": replicate,
+                          "code": version}, sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Directory of replicate results, one .npz file (names, counts) per content address."""
+    def __init__(self, path: str = DEFAULT_CACHE_DIR):
+        self.path = path
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], f"{key}.npz")
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self._file(key))
+
+    def get(self, key: str) -> tuple[list[str], NDArray]:
+        with np.load(self._file(key)) as data:
+            return data["names"].tolist(), data["counts"]
+
+    def put(self, key: str, names: list[str], counts: NDArray):
+        path = self._file(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, names=np.array(names), counts=counts)
+        os.replace(path + ".tmp", path)
+
+
+class SweepResult:
+    """Results of a sweep: one EnsembleResult per point."""
+    def __init__(self, points: list[dict], results: list[EnsembleResult], computed: int, cached: int):
+        self.points: list[dict] = points
+        self.results: list[EnsembleResult] = results
+        self.computed = computed
+        self.cached = cached
+
+    def final(self, name: str) -> NDArray:
+        """Return the (points, replicates) populations after the last step."""
+        return np.stack([result.series(name)[:, -1] for result in self.results])
+
+
+def _run_task(args):
+    key, config, num_steps, seed = args
+    return key, run_replicate(config, num_steps, seed)
+
+
+def run_sweep(points: list[dict], base: dict = None, num_steps: int = 100, replicates: int = 4,
+              seed: int = 0, workers: int = None, cache: ResultCache = None) -> SweepResult:
+    """
+    Run every point of a sweep, reusing cached results.
+
+    Replicate r of every point is seeded with child r of the root SeedSequence, so
+    points and replicates can be added to a sweep without changing existing results.
+    Every replicate is stored under a hash of its complete configuration, number of
+    steps, seed and the source of the simulation modules; only missing ones are run.
+
+    Args:
+        points (list[dict]): Sweep points, see `grid_points` and `random_points`.
+        base (dict): `Simulation` keyword arguments shared by all points.
+        num_steps (int): Number of steps of every replicate.
+        replicates (int): Number of replicates per point.
+        seed (int): Root seed of the replicates.
+        workers (int): Number of worker processes, all cores if None, in-process if 1.
+        cache (ResultCache): Result cache, ResultCache() if None.
+    """
+    if replicates < 1:
+        raise ValueError("Number of replicates must be positive.")
+    cache = cache if cache is not None else ResultCache()
+    version = code_version()
+    root = np.random.SeedSequence(seed)
+    seeds = [np.random.SeedSequence(root.entropy, spawn_key=(r,)) for r in range(replicates)]
+
+    keys = []
+    tasks = {}
+    for point in points:
+        config = point_config(point, base or {})
+        point_keys = [result_key(config, num_steps, str(root.entropy), r, version) for r in range(replicates)]
+        keys.append(point_keys)
+        for r, key in enumerate(point_keys):
+            if key not in cache and key not in tasks:
+                tasks[key] = (key, config, num_steps, seeds[r])
+
+    workers = min(workers or os.cpu_count() or 1, max(len(tasks), 1))
+    if workers == 1:
+        for task in tasks.values():
+            cache.put(*_flatten(_run_task(task)))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for future in as_completed([executor.submit(_run_task, task) for task in tasks.values()]):
+                cache.put(*_flatten(future.result()))
+
+    results = []
+    for point_keys in keys:
+        runs = [cache.get(key) for key in point_keys]
+        results.append(EnsembleResult(runs[0][0], np.stack([counts for _, counts in runs]), seeds))
+    total = len({key for point_keys in keys for key in point_keys})
+    return SweepResult(points, results, computed=len(tasks), cached=total - len(tasks))
+
+
+def _flatten(item):
+    key, (names, counts) = item
+    return key, names, counts
+
+
+def _parse_value(text: str):
+    if text == "none":
+        return None
+    if text in ("true", "false"):
+        return text == "true"
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    raise ValueError(f"Not a number: {text}.")
+
+
+def _parse_spec(text: str, random: bool):
+    """Parse "key=v1,v2,..." (values) or, for random specs, "key=low:high"."""
+    key, sep, values = text.partition("=")
+    if not sep:
+        raise ValueError(f"Expected key=values: {text}.")
+    if random and ":" in values:
+        low, high = values.split(":")
+        return key, (_parse_value(low), _parse_value(high))
+    return key, [_parse_value(value) for value in values.split(",")]
+
+
+def parse_args(argv=None):
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Sweep cell parameters and therapy settings.")
+    parser.add_argument("--grid", action="append", default=[], metavar="KEY=V1,V2,...",
+                        help="Values of a parameter, all combinations are run, e.g. "
+                             "regular_tumor.proliferation_rate=0.2,0.3 or chemo_interval=25,50.")
+    parser.add_argument("--random", action="append", default=[], metavar="KEY=LOW:HIGH",
+                        help="Range (or comma-separated choices) a parameter is sampled from.")
+    parser.add_argument("--samples", type=int, default=10, help="Number of random samples.")
+    parser.add_argument("--sample-seed", type=int, default=0, help="Seed of the random samples.")
+    parser.add_argument("--size", type=int, default=50, help="Grid size (rows = cols).")
+    parser.add_argument("--steps", type=int, default=300, help="Number of steps per replicate.")
+    parser.add_argument("--replicates", type=int, default=4, help="Number of replicates per point.")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="object", help="Grid implementation.")
+    parser.add_argument("--seed", type=int, default=0, help="Root seed of the replicates.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes.")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_DIR, help="Result cache directory.")
+    parser.add_argument("--output", default="sweep.csv",
+                        help="CSV file with the final tumor and immune counts of every point.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    points = grid_points(dict(_parse_spec(spec, False) for spec in args.grid))
+    if args.random:
+        samples = random_points(dict(_parse_spec(spec, True) for spec in args.random),
+                                args.samples, args.sample_seed)
+        points = [dict(point, **sample) for point in points for sample in samples]
+
+    base = {"rows": args.size, "engine": args.engine}
+    start = time.perf_counter()
+    result = run_sweep(points, base, args.steps, args.replicates, args.seed, args.workers,
+                       ResultCache(args.cache))
+    elapsed = time.perf_counter() - start
+
+    keys = list(dict.fromkeys(key for point in points for key in point))
+    header = keys + [f"{name}_{stat}" for name in ("tumor", "immune") for stat in ("mean", "sd")]
+    finals = {name: result.final(name) for name in ("tumor", "immune")}
+    with open(args.output, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for i, point in enumerate(points):
+            stats = []
+            for name in ("tumor", "immune"):
+                stats += [round(float(finals[name][i].mean()), 3), round(float(finals[name][i].std()), 3)]
+            writer.writerow([point.get(key) for key in keys] + stats)
+    print(f"{len(points)} points x {args.replicates} replicates: {result.computed} run, "
+          f"{result.cached} from cache, {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
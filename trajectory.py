@@ -0,0 +1,197 @@
+"""trajectory.py"""
+import json
+import os
+import numpy as np
+from numpy.typing import NDArray
+from cells import EMPTY
+
+META_FILE = "meta.json"
+KEYFRAME_CODES_FILE = "keyframe_codes.bin"
+KEYFRAME_RESISTANCE_FILE = "keyframe_resistance.bin"
+DIFF_SITES_FILE = "diff_sites.bin"
+DIFF_CODES_FILE = "diff_codes.bin"
+DIFF_RESISTANCE_FILE = "diff_resistance.bin"
+DIFF_ENDS_FILE = "diff_ends.bin"
+
+SITE_DTYPE = np.dtype("<u4")
+CODE_DTYPE = np.dtype("u1")
+RESISTANCE_DTYPE = np.dtype("<f4")
+END_DTYPE = np.dtype("<i8")
+
+
+def _lattices(grid) -> tuple[NDArray, NDArray]:
+    """Return flat copies of the code and resistance lattices of a grid."""
+    if not hasattr(grid, "codes"):
+        raise ValueError(f"{type(grid).__name__} has no dense lattice to record.")
+    if grid.codes.ndim != 2:
+        raise ValueError("Trajectories record 2D lattices only.")
+    codes = np.array(grid.codes, dtype=CODE_DTYPE).ravel()
+    resistance = np.array(grid.resistance, dtype=RESISTANCE_DTYPE).ravel()
+    return codes, resistance
+
+
+class TrajectoryWriter:
+    """
+    Record every frame of a run as keyframes plus per-step diffs.
+
+    A frame is the lattice of cell type codes together with the chemotherapy
+    resistance of every cell. Every `keyframe_interval` frames the full lattices
+    are stored, for the frames in between only the sites that changed since the
+    previous frame (site, new code, new resistance). All data is appended to raw
+    binary files in the trajectory directory, `meta.json` holds the lattice shape,
+    the keyframe interval and the number of frames written.
+
+    Used as a `Simulation.run` callback, called once before the run to record the
+    initial state:
+        with TrajectoryWriter("run.traj", keyframe_interval=100) as writer:
+            writer(simulation)
+            simulation.run(5000, callback=writer)
+    """
+    def __init__(self, path: str, keyframe_interval: int = 100):
+        if keyframe_interval < 1:
+            raise ValueError("Keyframe interval must be positive.")
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self.frames = 0
+        self.first_step = None
+        self.shape = None
+        self._codes = None
+        self._resistance = None
+        self._diff_end = 0
+        self._files = {}
+        os.makedirs(path, exist_ok=True)
+
+    def _open(self, grid):
+        self.shape = (grid.rows, grid.cols)
+        for name in (KEYFRAME_CODES_FILE, KEYFRAME_RESISTANCE_FILE, DIFF_SITES_FILE,
+                     DIFF_CODES_FILE, DIFF_RESISTANCE_FILE, DIFF_ENDS_FILE):
+            self._files[name] = open(os.path.join(self.path, name), "wb")
+
+    def record(self, simulation):
+        """Append the current frame of a simulation."""
+        grid = simulation.grid
+        if self.first_step is None:
+            self.first_step = simulation.current_step
+            self._open(grid)
+        codes, resistance = _lattices(grid)
+        files = self._files
+        if self.frames % self.keyframe_interval == 0:
+            files[KEYFRAME_CODES_FILE].write(codes.tobytes())
+            files[KEYFRAME_RESISTANCE_FILE].write(resistance.tobytes())
+        else:
+            sites = np.flatnonzero((codes != self._codes) | (resistance != self._resistance))
+            files[DIFF_SITES_FILE].write(sites.astype(SITE_DTYPE).tobytes())
+            files[DIFF_CODES_FILE].write(codes[sites].tobytes())
+            files[DIFF_RESISTANCE_FILE].write(resistance[sites].tobytes())
+            self._diff_end += len(sites)
+        # Diffs of frame n are diff_sites[diff_ends[n - 1]:diff_ends[n]] (empty for keyframes).
+        files[DIFF_ENDS_FILE].write(np.array([self._diff_end], dtype=END_DTYPE).tobytes())
+        self._codes, self._resistance = codes, resistance
+        self.frames += 1
+        if self.frames % self.keyframe_interval == 0:
+            self.flush()
+
+    __call__ = record
+
+    def flush(self):
+        """Write buffered data and update the frame count readers see."""
+        for f in self._files.values():
+            f.flush()
+        meta = {
+            "rows": self.shape[0] if self.shape else 0,
+            "cols": self.shape[1] if self.shape else 0,
+            "keyframe_interval": self.keyframe_interval,
+            "first_step": self.first_step,
+            "frames": self.frames,
+        }
+        tmp_path = os.path.join(self.path, META_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(self.path, META_FILE))
+
+    def close(self):
+        """Flush and close the trajectory files."""
+        self.flush()
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TrajectoryReader:
+    """
+    Reconstruct frames of a trajectory written by TrajectoryWriter.
+
+    The files are memory-mapped; a frame is rebuilt from the nearest preceding keyframe
+    by applying at most `keyframe_interval - 1` diffs.
+    """
+    def __init__(self, path: str):
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.path = path
+        self.rows: int = meta["rows"]
+        self.cols: int = meta["cols"]
+        self.keyframe_interval: int = meta["keyframe_interval"]
+        self.first_step: int = meta["first_step"]
+        self.frames: int = meta["frames"]
+        size = self.rows * self.cols
+        num_keyframes = -(-self.frames // self.keyframe_interval)
+        self._keyframe_codes = self._map(KEYFRAME_CODES_FILE, CODE_DTYPE, (num_keyframes, size))
+        self._keyframe_resistance = self._map(KEYFRAME_RESISTANCE_FILE, RESISTANCE_DTYPE, (num_keyframes, size))
+        self._diff_ends = self._map(DIFF_ENDS_FILE, END_DTYPE, (self.frames,))
+        num_diffs = int(self._diff_ends[-1]) if self.frames else 0
+        self._diff_sites = self._map(DIFF_SITES_FILE, SITE_DTYPE, (num_diffs,))
+        self._diff_codes = self._map(DIFF_CODES_FILE, CODE_DTYPE, (num_diffs,))
+        self._diff_resistance = self._map(DIFF_RESISTANCE_FILE, RESISTANCE_DTYPE, (num_diffs,))
+
+    def _map(self, name: str, dtype: np.dtype, shape: tuple) -> NDArray:
+        if 0 in shape:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(os.path.join(self.path, name), dtype=dtype, mode="r", shape=shape)
+
+    def __len__(self) -> int:
+        return self.frames
+
+    @property
+    def steps(self) -> range:
+        """Simulation steps of the recorded frames."""
+        return range(self.first_step, self.first_step + self.frames)
+
+    def _apply_diff(self, frame: int, codes: NDArray, resistance: NDArray):
+        start, end = self._diff_ends[frame - 1], self._diff_ends[frame]
+        sites = self._diff_sites[start:end]
+        codes[sites] = self._diff_codes[start:end]
+        resistance[sites] = self._diff_resistance[start:end]
+
+    def frame(self, step: int) -> tuple[NDArray, NDArray]:
+        """Return the (codes, resistance) lattices of a simulation step, shaped (rows, cols)."""
+        frame = step - self.first_step
+        if not 0 <= frame < self.frames:
+            raise ValueError(f"Step {step} is not in the trajectory.")
+        keyframe = frame // self.keyframe_interval
+        codes = np.array(self._keyframe_codes[keyframe])
+        resistance = np.array(self._keyframe_resistance[keyframe])
+        for n in range(keyframe * self.keyframe_interval + 1, frame + 1):
+            self._apply_diff(n, codes, resistance)
+        return codes.reshape(self.rows, self.cols), resistance.reshape(self.rows, self.cols)
+
+    def __iter__(self):
+        """Yield (step, codes, resistance) for every frame in order, one diff per frame."""
+        codes = resistance = None
+        for frame in range(self.frames):
+            if frame % self.keyframe_interval == 0:
+                keyframe = frame // self.keyframe_interval
+                codes = np.array(self._keyframe_codes[keyframe])
+                resistance = np.array(self._keyframe_resistance[keyframe])
+            else:
+                self._apply_diff(frame, codes, resistance)
+            yield self.first_step + frame, codes.reshape(self.rows, self.cols), resistance.reshape(self.rows, self.cols)
+
+    def occupancy(self, step: int) -> NDArray:
+        """Return the boolean occupancy of a simulation step."""
+        return self.frame(step)[0] != EMPTY
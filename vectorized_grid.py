@@ -0,0 +1,552 @@
+"""vectorized_grid.py"""
+import numpy as np
+from numpy.typing import NDArray
+from cells import (
+    Cell, RegularTumorCell, StemTumorCell, ImmuneCell, cell_code,
+    EMPTY, GENERIC, REGULAR_TUMOR, STEM_TUMOR, IMMUNE_NK, IMMUNE_CTL,
+)
+from rng import SimulationRNG
+from profiling import phase
+
+# Moore neighborhood in the same order as Grid.neighbors / Grid.empty_neighbors.
+NEIGHBOR_OFFSETS = np.array(
+    [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if (dx, dy) != (0, 0)]
+)
+_CODE_CLASSES = {
+    GENERIC: Cell,
+    REGULAR_TUMOR: RegularTumorCell,
+    STEM_TUMOR: StemTumorCell,
+    IMMUNE_NK: ImmuneCell,
+    IMMUNE_CTL: ImmuneCell,
+}
+
+
+def chamfer_distance(mask: NDArray) -> NDArray:
+    """
+    Return the (1, sqrt(2)) chamfer distance from every site to the nearest True site of `mask`.
+
+    Two row scans (top-down and bottom-up) propagate distances from the previous row,
+    and each row is relaxed horizontally with running minima, so the cost is O(rows)
+    NumPy operations. Sites are infinitely far away if the mask is empty.
+    """
+    rows, cols = mask.shape
+    dist = np.where(mask, 0.0, np.inf)
+    idx = np.arange(cols, dtype=float)
+    diag = np.sqrt(2)
+
+    def relax_row(row):
+        row[:] = np.minimum.accumulate(row - idx) + idx
+        row[:] = np.minimum.accumulate((row + idx)[::-1])[::-1] - idx
+
+    for order in (range(rows), range(rows - 1, -1, -1)):
+        prev = None
+        for i in order:
+            row = dist[i]
+            if prev is not None:
+                up = dist[prev]
+                np.minimum(row, up + 1, out=row)
+                np.minimum(row[1:], up[:-1] + diag, out=row[1:])
+                np.minimum(row[:-1], up[1:] + diag, out=row[:-1])
+            relax_row(row)
+            prev = i
+    return dist
+
+
+class VectorizedGrid:
+    """
+    Grid storing cell state as NumPy arrays over the lattice (structure of arrays).
+
+    Implements the rules of `Grid` and the cell classes with batched array operations:
+    all tumor cells act simultaneously, then all immune cells, and conflicts for the same
+    empty site are resolved in random order. Custom (named) cells are treated as
+    ordinary immune cells of their type.
+    """
+    STATE_FIELDS = (
+        "code", "p_remaining", "chemotherapy_resistance", "proliferation_decrease_coef",
+        "age", "lifespan", "attacks_done", "max_attacks",
+        "death_chance_of_attack", "chance_of_succesfull_attack",
+    )
+    # Per-site array type of every state field.
+    FIELD_DTYPES = {
+        "code": np.uint8,
+        "p_remaining": np.int16,
+        "chemotherapy_resistance": np.float64,
+        "proliferation_decrease_coef": np.float64,
+        "age": np.int32,
+        "lifespan": np.int32,
+        "attacks_done": np.int32,
+        "max_attacks": np.int32,
+        "death_chance_of_attack": np.float64,
+        "chance_of_succesfull_attack": np.float64,
+    }
+    # Neighborhood of a site as offsets along every lattice axis.
+    NEIGHBORS = NEIGHBOR_OFFSETS
+    PLACEMENT_ROUNDS = 3
+
+    def __init__(self, rows: int, cols: int, rng: SimulationRNG = None):
+        """
+        Initialize an empty grid.
+
+        Args:
+            rows (int): Number of rows.
+            cols (int): Number of columns.
+            rng (SimulationRNG): Random stream of the grid, its `generator` draws all arrays.
+        """
+        self.rows: int = rows
+        self.cols: int = cols
+        self.shape: tuple[int, ...] = self._lattice_shape()
+        size = int(np.prod(self.shape))
+        self.code: NDArray = self._new_field("code", size)
+        self.p_remaining: NDArray = self._new_field("p_remaining", size)
+        self.chemotherapy_resistance: NDArray = self._new_field("chemotherapy_resistance", size)
+        self.proliferation_decrease_coef: NDArray = self._new_field("proliferation_decrease_coef", size)
+        self.age: NDArray = self._new_field("age", size)
+        self.lifespan: NDArray = self._new_field("lifespan", size)
+        self.attacks_done: NDArray = self._new_field("attacks_done", size)
+        self.max_attacks: NDArray = self._new_field("max_attacks", size)
+        self.death_chance_of_attack: NDArray = self._new_field("death_chance_of_attack", size)
+        self.chance_of_succesfull_attack: NDArray = self._new_field("chance_of_succesfull_attack", size)
+        self.kill_count = 0
+        self.failure_count = 0
+        self.last_kill_count = 0
+        self.last_failure_count = 0
+        self.immune_spawn = 0.003
+        self.immune_spawn_decrease = 0.03
+        self.recruitment_enabled = False
+        # StepProfiler recording the cost of every step, None when profiling is off.
+        self.profiler = None
+        self.rng: SimulationRNG = rng if rng is not None else SimulationRNG()
+
+        strides = np.cumprod((self.shape[1:] + (1,))[::-1])[::-1]
+        self._neighbor_offsets: NDArray = self.NEIGHBORS @ strides
+        border = np.zeros(self.shape, dtype=bool)
+        for axis in range(len(self.shape)):
+            border[(slice(None),) * axis + (0,)] = True
+            border[(slice(None),) * axis + (-1,)] = True
+        self._border_sites: NDArray = np.flatnonzero(border)
+
+    def _lattice_shape(self) -> tuple[int, ...]:
+        """Return the shape of the lattice, (rows, cols) for this grid."""
+        return self.rows, self.cols
+
+    def _new_field(self, field: str, size: int) -> NDArray:
+        """Return the zeroed per-site array of a state field."""
+        return np.zeros(size, dtype=self.FIELD_DTYPES[field])
+
+    def _acting_sites(self, mask: NDArray) -> NDArray:
+        """Return the sites of `mask` whose cells act in the current update, all of them on this grid."""
+        return np.flatnonzero(mask)
+
+    def _updated_sites(self, mask: NDArray) -> NDArray:
+        """Return the sites of `mask` the current update may have changed, all of them on this grid."""
+        return np.flatnonzero(mask)
+
+    def _code_counts(self) -> NDArray:
+        """Return the number of sites holding every cell code."""
+        return np.bincount(self.code, minlength=len(_CODE_CLASSES) + 1)
+
+    @property
+    def grid(self) -> NDArray:
+        """Boolean occupancy of the lattice, shaped (rows, cols)."""
+        return (self.code != EMPTY).reshape(self.shape)
+
+    @property
+    def codes(self) -> NDArray:
+        """Cell type codes of the lattice, shaped (rows, cols)."""
+        return self.code.reshape(self.shape)
+
+    @property
+    def resistance(self) -> NDArray:
+        """Chemotherapy resistance of the cell at every site (0 at empty sites), shaped (rows, cols)."""
+        return np.where(self.code != EMPTY, self.chemotherapy_resistance, 0.0).reshape(self.shape)
+
+    @property
+    def num_cells(self) -> int:
+        """Return the number of cells in the grid."""
+        return int(np.count_nonzero(self.code))
+
+    def _index(self, position) -> int:
+        if len(position) != len(self.shape):
+            raise ValueError(f"Cell position must have {len(self.shape)} coordinates.")
+        index = 0
+        for coordinate, size in zip(position, self.shape):
+            if not 0 <= coordinate < size:
+                raise ValueError("Cell position out of bounds.")
+            index = index * size + coordinate
+        return index
+
+    def add_cell(self, cell):
+        """Add a cell object to the grid, copying its state into the arrays."""
+        i = self._index(cell.position)
+        self.code[i] = cell_code(cell)
+        self.chemotherapy_resistance[i] = cell.chemotherapy_resistance
+        self.proliferation_decrease_coef[i] = cell.proliferation_decrease_coef
+        self.p_remaining[i] = getattr(cell, "p_remaining", 0)
+        if isinstance(cell, ImmuneCell):
+            self.age[i] = cell.age
+            self.lifespan[i] = cell.lifespan
+            self.attacks_done[i] = cell.attacks_done
+            self.max_attacks[i] = cell.max_attacks
+            self.death_chance_of_attack[i] = cell.death_chance_of_attack
+            self.chance_of_succesfull_attack[i] = cell.chance_of_succesfull_attack
+
+    def remove_cell_at(self, position):
+        """Remove a cell at a specific position."""
+        self.code[self._index(position)] = EMPTY
+
+    def empty_grid(self):
+        """Empty the grid."""
+        self.code.fill(EMPTY)
+
+    def count_cells(self, cell_types) -> int:
+        """Count the number of cells of the given class (or tuple of classes) in the grid."""
+        if not isinstance(cell_types, tuple):
+            cell_types = (cell_types,)
+        counts = self._code_counts()
+        return int(sum(
+            counts[code] for code, cls in _CODE_CLASSES.items()
+            if any(issubclass(cls, cell_type) for cell_type in cell_types)
+        ))
+
+    def population_counts(self) -> dict:
+        """Return the number of cells of every type in the grid."""
+        counts = self._code_counts()
+        return {
+            "regular_tumor": int(counts[REGULAR_TUMOR]),
+            "stem_tumor": int(counts[STEM_TUMOR]),
+            "immune_type0": int(counts[IMMUNE_NK]),
+            "immune_type1": int(counts[IMMUNE_CTL]),
+            "generic": int(counts[GENERIC]),
+        }
+
+    def custom_counts(self) -> dict[str, int]:
+        """Return the number of custom cells by their name (not tracked by this engine)."""
+        return {}
+
+    @property
+    def tumor_distance(self) -> NDArray:
+        """Chamfer distance from every site to the nearest tumor cell, shaped (rows, cols)."""
+        tumor = (self.code == REGULAR_TUMOR) | (self.code == STEM_TUMOR)
+        return chamfer_distance(tumor.reshape(self.rows, self.cols))
+
+    def _neighbor_sites(self, sites: NDArray):
+        """Return (neighbors, valid) arrays of shape (len(sites), len(NEIGHBORS)) for flat site indices."""
+        valid = np.ones((len(sites), len(self.NEIGHBORS)), dtype=bool)
+        for coordinate, size, offsets in zip(np.unravel_index(sites, self.shape), self.shape, self.NEIGHBORS.T):
+            moved = coordinate[:, None] + offsets
+            valid &= (moved >= 0) & (moved < size)
+        neighbors = np.where(valid, sites[:, None] + self._neighbor_offsets, 0)
+        return neighbors, valid
+
+    def _random_choice(self, candidates: NDArray) -> NDArray:
+        """Pick a random True column per row of `candidates`, -1 for rows without any."""
+        keys = self.rng.generator.random(candidates.shape)
+        keys[~candidates] = -1.0
+        choice = keys.argmax(axis=1)
+        return np.where(candidates.any(axis=1), choice, -1)
+
+    def _claim_empty_neighbors(self, sources: NDArray, preferred=None) -> NDArray:
+        """
+        Assign to every source an empty neighboring site, each site to at most one source.
+
+        A source picks a random empty neighbor, or the column returned by
+        `preferred(pending, free)` if given (used by immune chemotaxis). Conflicts are resolved in random order; losers retry
+        with the remaining empty neighbors for a few rounds. Returns target sites, -1 where
+        no site could be claimed.
+        """
+        targets = np.full(len(sources), -1, dtype=np.int64)
+        if len(sources) == 0:
+            return targets
+        neighbors, valid = self._neighbor_sites(sources)
+        claimed = np.zeros(self.code.shape, dtype=bool)
+        pending = np.arange(len(sources))
+        for _ in range(self.PLACEMENT_ROUNDS):
+            nbrs = neighbors[pending]
+            free = valid[pending] & (self.code[nbrs] == EMPTY) & ~claimed[nbrs]
+            if preferred is None:
+                choice = self._random_choice(free)
+            else:
+                choice = preferred(pending, free)
+            has_choice = choice >= 0
+            pending = pending[has_choice]
+            if len(pending) == 0:
+                break
+            wanted = nbrs[has_choice, choice[has_choice]]
+            order = self.rng.generator.permutation(len(pending))
+            _, first = np.unique(wanted[order], return_index=True)
+            winners = order[first]
+            targets[pending[winners]] = wanted[winners]
+            claimed[wanted[winners]] = True
+            lost = np.ones(len(pending), dtype=bool)
+            lost[winners] = False
+            pending = pending[lost]
+            if len(pending) == 0:
+                break
+        return targets
+
+    def _copy_state(self, dst: NDArray, src: NDArray):
+        for field in self.STATE_FIELDS:
+            array = getattr(self, field)
+            array[dst] = array[src]
+
+    def _new_immune_cells(self, sites: NDArray, codes: NDArray):
+        """Initialize fresh immune cells at the given sites."""
+        n = len(sites)
+        self.code[sites] = codes
+        self.p_remaining[sites] = 0
+        self.chemotherapy_resistance[sites] = self.rng.generator.random(n) ** 2
+        self.proliferation_decrease_coef[sites] = 0.0
+        self.age[sites] = 0
+        self.lifespan[sites] = self.rng.generator.integers(10, 31, n)
+        self.attacks_done[sites] = 0
+        self.max_attacks[sites] = ImmuneCell.DEFAULT_MAX_ATTACKS
+        self.death_chance_of_attack[sites] = ImmuneCell.DEFAULT_DEATH_CHANCE
+        self.chance_of_succesfull_attack[sites] = ImmuneCell.DEFAULT_SUCCESS_CHANCE
+
+    def _class_constant(self, codes: NDArray, getter) -> NDArray:
+        """Map cell codes to a per-class constant given by `getter(cell_class)`."""
+        table = np.zeros(len(_CODE_CLASSES) + 1)
+        for code, cls in _CODE_CLASSES.items():
+            table[code] = getter(cls)
+        return table[codes]
+
+    def _tumor_fates(self, sites: NDArray):
+        """
+        Decide what the tumor and generic cells at `sites` do this step.
+
+        Returns:
+            Boolean arrays (dies, divides, migrates) over `sites`; dying includes
+            regular tumor cells that would divide without divisions left.
+        """
+        codes = self.code[sites]
+        apoptosis_rate = self._class_constant(codes, lambda cls: cls.RATES['apoptosis'])
+        proliferation_rate = self._class_constant(codes, lambda cls: cls.RATES['proliferation'])
+        migration_rate = self._class_constant(codes, lambda cls: cls.RATES['migration'])
+
+        u = self.rng.generator.random((3, len(sites)))
+        apoptosis = u[0] <= apoptosis_rate
+        proliferation = ~apoptosis & (
+            u[1] <= proliferation_rate * (1 - self.proliferation_decrease_coef[sites]))
+        migration = ~apoptosis & ~proliferation & (u[2] <= migration_rate)
+        exhausted = proliferation & (codes == REGULAR_TUMOR) & (self.p_remaining[sites] == 0)
+        proliferation &= ~exhausted
+        return apoptosis | exhausted, proliferation, migration
+
+    def _tumor_actions(self):
+        """Apoptosis, proliferation and migration of tumor and generic cells."""
+        sites = self._acting_sites((self.code >= GENERIC) & (self.code <= STEM_TUMOR))
+        if len(sites) == 0:
+            return
+        dies, proliferation, migration = self._tumor_fates(sites)
+
+        self.code[sites[dies]] = EMPTY
+
+        movers = sites[proliferation | migration]
+        dividing = proliferation[proliferation | migration]
+        targets = self._claim_empty_neighbors(movers)
+        placed = targets >= 0
+
+        migrants, migrant_targets = movers[placed & ~dividing], targets[placed & ~dividing]
+        self._copy_state(migrant_targets, migrants)
+        self.code[migrants] = EMPTY
+
+        parents, children = movers[placed & dividing], targets[placed & dividing]
+        parent_codes = self.code[parents]
+        n = len(parents)
+        symmetrical = self.rng.generator.random(n) <= StemTumorCell.RATES.get('symmetrical_division', 0.0)
+        child_codes = np.where(
+            parent_codes == STEM_TUMOR,
+            np.where(symmetrical, STEM_TUMOR, REGULAR_TUMOR),
+            parent_codes,
+        )
+        rtc_parents = parent_codes == REGULAR_TUMOR
+        self.p_remaining[parents[rtc_parents]] -= 1
+        self.code[children] = child_codes
+        self.p_remaining[children] = np.where(
+            rtc_parents, self.p_remaining[parents],
+            np.where(child_codes == REGULAR_TUMOR, RegularTumorCell.MAX_DIVISIONS, 0),
+        )
+        self.proliferation_decrease_coef[children] = self.proliferation_decrease_coef[parents]
+        generic = parent_codes == GENERIC
+        self.chemotherapy_resistance[children] = np.where(
+            generic, self.chemotherapy_resistance[parents], self.rng.generator.random(n) ** 2)
+        self.age[children] = 0
+        self.attacks_done[children] = 0
+
+    def _immune_proliferation(self, sites: NDArray):
+        """Immune cells at `sites` proliferate after a successful kill."""
+        sites = sites[self.rng.generator.random(len(sites)) <= ImmuneCell.RATES['proliferation']]
+        targets = self._claim_empty_neighbors(sites)
+        placed = targets >= 0
+        self._new_immune_cells(targets[placed], self.code[sites[placed]])
+
+    def _immune_attacks(self, sites: NDArray):
+        """
+        Attacks of the immune cells at `sites` on their tumor neighbors; killed cells are removed.
+
+        Returns:
+            Boolean arrays (engaged, killed, dead) over `sites`: cells next to a tumor
+            cell, cells that killed one and cells that died attacking.
+        """
+        tumor = (self.code == REGULAR_TUMOR) | (self.code == STEM_TUMOR)
+        immune = self.code >= IMMUNE_NK
+        neighbors, valid = self._neighbor_sites(sites)
+        tumor_neighbors = valid & tumor[neighbors]
+        n_pt = tumor_neighbors.sum(axis=1)
+        n_i = (valid & immune[neighbors]).sum(axis=1)
+        engaged = n_pt > 0
+        codes = self.code[sites]
+
+        # NK cells attack one random tumor neighbor, CTL cells attack neighbors in order.
+        target_col = np.full(len(sites), -1)
+        nk = engaged & (codes == IMMUNE_NK)
+        target_col[nk] = self._random_choice(tumor_neighbors[nk])
+        active = engaged.copy()
+        killed_by = np.zeros(len(sites), dtype=bool)
+        dead = np.zeros(len(sites), dtype=bool)
+        kills = []
+        ctl = engaged & (codes == IMMUNE_CTL)
+        ctl_cols = np.cumsum(tumor_neighbors, axis=1)
+        for k in range(1, len(self.NEIGHBORS) + 1):
+            # k-th tumor neighbor of every CTL cell that is still attacking.
+            ctl_round = active & ctl & (n_pt >= k)
+            target_col[ctl_round] = (ctl_cols[ctl_round] >= k).argmax(axis=1)
+            attacking = active & (target_col >= 0) & (nk | ctl_round)
+            if not attacking.any():
+                break
+            attackers = sites[attacking]
+            targets = neighbors[attacking, target_col[attacking]]
+            self.attacks_done[attackers] += 1
+            chance = self.chance_of_succesfull_attack[attackers] * (n_i[attacking] / n_pt[attacking])
+            chance *= np.where(self.code[targets] == STEM_TUMOR, 0.2, 1.0)
+            chance *= np.where(codes[attacking] == IMMUNE_NK, 0.8, 1.2)
+            chance *= tumor[targets]
+            success = self.rng.generator.random(len(attackers)) <= np.minimum(chance, 1.0)
+
+            killed_targets = targets[success]
+            kills.append(killed_targets)
+            tumor[killed_targets] = False
+            self.kill_count += int(success.sum())
+            self.failure_count += int((~success).sum())
+
+            idx = np.flatnonzero(attacking)
+            killed_by[idx[success]] = True
+            failure_death = np.where(
+                n_i[attacking] == 0, 1.0,
+                np.minimum(self.death_chance_of_attack[attackers]
+                           * n_pt[attacking] / np.maximum(n_i[attacking], 1), 1.0))
+            exhausted = self.attacks_done[attackers] >= self.max_attacks[attackers]
+            fail_dies = ~success & (
+                (self.rng.generator.random(len(attackers)) <= failure_death)
+                | (exhausted & (codes[attacking] == IMMUNE_CTL)))
+            success_dies = success & ((codes[attacking] == IMMUNE_NK) | exhausted)
+            dead[idx[fail_dies | success_dies]] = True
+            active[idx] = False
+            active[idx[~success & ~fail_dies & (codes[attacking] == IMMUNE_CTL)]] = True
+            nk[idx] = False
+        if kills:
+            self.code[np.concatenate(kills)] = EMPTY
+        return engaged, killed_by, dead
+
+    def _immune_actions(self):
+        """Attacks of immune cells next to tumor cells, chemotaxis of the others."""
+        sites = self._acting_sites(self.code >= IMMUNE_NK)
+        if len(sites) == 0:
+            return
+        self.age[sites] += 1
+        engaged, killed_by, dead = self._immune_attacks(sites)
+
+        self._immune_proliferation(sites[killed_by])
+        self.code[sites[dead]] = EMPTY
+
+        self._immune_migration(sites[~engaged])
+
+        alive = self._updated_sites(self.code >= IMMUNE_NK)
+        self.code[alive[self.age[alive] == self.lifespan[alive]]] = EMPTY
+
+    def _immune_migration(self, sites: NDArray):
+        """Immune cells move to the empty neighbor closest to the nearest tumor cell."""
+        if len(sites) == 0:
+            return
+        distance = self.tumor_distance.ravel()
+        neighbors, _ = self._neighbor_sites(sites)
+
+        def closest(pending, free):
+            dist = np.where(free, distance[neighbors[pending]], np.inf)
+            choice = dist.argmin(axis=1)
+            return np.where(np.isfinite(dist[np.arange(len(pending)), choice]), choice, -1)
+
+        targets = self._claim_empty_neighbors(sites, preferred=closest)
+        placed = targets >= 0
+        sources, targets = sites[placed], targets[placed]
+        self._copy_state(targets, sources)
+        self.code[sources] = EMPTY
+
+    def _spawn_border_immune_cells(self):
+        border = self._border_sites
+        spawn = (self.code[border] == EMPTY) & (self.rng.generator.random(len(border)) < self.immune_spawn)
+        sites = border[spawn]
+        codes = np.where(self.rng.generator.random(len(sites)) < 0.3, IMMUNE_CTL, IMMUNE_NK)
+        self._new_immune_cells(sites, codes)
+
+    def _recruit_immune_cells(self):
+        """Recruit immune cells at random empty sites, as immune_utils.recruit_immune_cells does."""
+        counts = self._code_counts()
+        n_t = counts[REGULAR_TUMOR] + counts[STEM_TUMOR]
+        if n_t == 0:
+            return
+        newborns = int((self.kill_count - self.failure_count) * (counts[REGULAR_TUMOR] / n_t))
+        if newborns <= 0:
+            return
+        empty = self._acting_sites(self.code == EMPTY)
+        sites = self.rng.generator.choice(empty, size=min(newborns, len(empty)), replace=False)
+        codes = np.where(self.rng.generator.random(len(sites)) < 0.5, IMMUNE_CTL, IMMUNE_NK)
+        self._new_immune_cells(sites, codes)
+
+    def make_action(self):
+        """Make action for every cell in the grid."""
+        profiler = self.profiler
+        with phase(profiler, "tumor_actions"):
+            self._tumor_actions()
+        with phase(profiler, "immune_actions"):
+            self._immune_actions()
+        with phase(profiler, "border_spawn"):
+            self._spawn_border_immune_cells()
+        if self.recruitment_enabled:
+            with phase(profiler, "recruitment"):
+                self._recruit_immune_cells()
+        if profiler is not None:
+            profiler.steps += 1
+        self.last_kill_count = self.kill_count
+        self.last_failure_count = self.failure_count
+        self.kill_count = 0
+        self.failure_count = 0
+
+    def apply_chemotherapy(self):
+        """Apply chemotherapy to all cells in the grid."""
+        self.immune_spawn *= (1 - self.immune_spawn_decrease)
+        sites = np.flatnonzero(self.code)
+        codes = self.code[sites]
+        resistance = self.chemotherapy_resistance[sites]
+        decrease = self._class_constant(codes, lambda cls: cls.PROLIFERATION_DECREASE)
+        death_chance = self._class_constant(codes, lambda cls: cls.DEATH_CHEMOTHERAPY_CHANCE)
+        self.proliferation_decrease_coef[sites] *= (1 - decrease) * (1 - resistance)
+        dies = self.rng.generator.random(len(sites)) <= death_chance * (1 - resistance)
+        self.code[sites[dies]] = EMPTY
+
+    def apply_immunotherapy(self):
+        """Apply immunotherapy to all immune cells in the grid."""
+        self.immune_spawn *= 3
+        sites = np.flatnonzero(self.code >= IMMUNE_NK)
+        self.max_attacks[sites] += 2
+        self.lifespan[sites] += 10
+        self.death_chance_of_attack[sites] *= 0.8
+        self.chance_of_succesfull_attack[sites] *= 3
+
+    def reset_all_immune_cells(self):
+        """Reset parameters of all immune cells in the grid."""
+        self.immune_spawn /= 3
+        sites = np.flatnonzero(self.code >= IMMUNE_NK)
+        self.max_attacks[sites] = ImmuneCell.DEFAULT_MAX_ATTACKS
+        self.death_chance_of_attack[sites] = ImmuneCell.DEFAULT_DEATH_CHANCE
+        self.chance_of_succesfull_attack[sites] = ImmuneCell.DEFAULT_SUCCESS_CHANCE
@@ -0,0 +1,125 @@
+"""vectorized_grid3d.py"""
+import math
+import numpy as np
+from numpy.typing import NDArray
+from cells import RegularTumorCell, REGULAR_TUMOR, STEM_TUMOR
+from rng import SimulationRNG
+from vectorized_grid import VectorizedGrid
+
+# 26-neighborhood as (dz, dx, dy) offsets, in lexicographic order.
+NEIGHBOR_OFFSETS_3D = np.array(
+    [(dz, dx, dy) for dz in (-1, 0, 1) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if (dz, dx, dy) != (0, 0, 0)]
+)
+
+
+def _sweep(dist: NDArray):
+    """Relax every slice of `dist` (along axis 0) from its 9 neighbors in the previous slice, both ways."""
+    edge, corner = math.sqrt(2), math.sqrt(3)
+    rows, cols = dist.shape[1:]
+    padded = np.full((rows + 2, cols + 2), np.inf, dtype=dist.dtype)
+    near = np.empty((rows + 2, cols), dtype=dist.dtype)
+    best = np.empty((rows, cols), dtype=dist.dtype)
+    candidate = np.empty((rows, cols), dtype=dist.dtype)
+    for order in (range(1, dist.shape[0]), range(dist.shape[0] - 2, -1, -1)):
+        step = 1 if order.step > 0 else -1
+        for i in order:
+            padded[1:-1, 1:-1] = dist[i - step]
+            # Nearest of the two column neighbors, then the four edge and four corner neighbors.
+            np.minimum(padded[:, :-2], padded[:, 2:], out=near)
+            np.minimum(near[:-2], near[2:], out=best)
+            np.add(best, corner, out=best)
+            np.minimum(padded[:-2, 1:-1], padded[2:, 1:-1], out=candidate)
+            np.minimum(candidate, near[1:-1], out=candidate)
+            np.add(candidate, edge, out=candidate)
+            np.minimum(best, candidate, out=best)
+            np.add(padded[1:-1, 1:-1], 1, out=candidate)
+            np.minimum(best, candidate, out=best)
+            np.minimum(dist[i], best, out=dist[i])
+
+
+def chamfer_distance_3d(mask: NDArray, dtype=np.float32) -> NDArray:
+    """
+    Return the (1, sqrt(2), sqrt(3)) chamfer distance from every site to the nearest True site of `mask`.
+
+    For every axis and direction the volume is swept slice by slice, each slice taking
+    the distance through its 9 neighbors in the previous slice. A shortest path to a
+    site advances one step along its longest axis at every move, so the six sweeps give
+    the exact chamfer distance with O(size of an axis) NumPy operations per sweep.
+    Sites are infinitely far away if the mask is empty.
+    """
+    dist = np.where(mask, 0.0, np.inf).astype(dtype)
+    for axis in range(3):
+        # Sweep a contiguous copy with the axis first, slices of a strided view are slow.
+        view = np.ascontiguousarray(np.moveaxis(dist, axis, 0))
+        _sweep(view)
+        np.moveaxis(dist, axis, 0)[...] = view
+    return dist
+
+
+class VectorizedGrid3D(VectorizedGrid):
+    """
+    VectorizedGrid on a (depth, rows, cols) lattice of 26-neighborhoods.
+
+    Cells follow the same rules as on the 2D lattice; positions are (z, x, y) tuples,
+    immune cells appear on the six faces of the box and migrate along the 3D chamfer
+    distance to the tumor. State is kept in compact (32-bit float, 16-bit integer)
+    arrays, about 27 bytes per site, so a 256^3 lattice takes about 450 MB.
+    `codes[z]` is the 2D slice at depth z.
+    """
+    FIELD_DTYPES = {
+        "code": np.uint8,
+        "p_remaining": np.int16,
+        "chemotherapy_resistance": np.float32,
+        "proliferation_decrease_coef": np.float32,
+        "age": np.int16,
+        "lifespan": np.int16,
+        "attacks_done": np.int16,
+        "max_attacks": np.int16,
+        "death_chance_of_attack": np.float32,
+        "chance_of_succesfull_attack": np.float32,
+    }
+    NEIGHBORS = NEIGHBOR_OFFSETS_3D
+
+    def __init__(self, rows: int, cols: int, depth: int = None, rng: SimulationRNG = None):
+        """
+        Initialize an empty grid.
+
+        Args:
+            rows (int): Number of rows.
+            cols (int): Number of columns.
+            depth (int): Number of slices, equal to rows if not given.
+            rng (SimulationRNG): Random stream of the grid, its `generator` draws all arrays.
+        """
+        self.depth: int = rows if depth is None else depth
+        super().__init__(rows, cols, rng)
+
+    def _lattice_shape(self) -> tuple[int, ...]:
+        """Return the shape of the lattice, (depth, rows, cols)."""
+        return self.depth, self.rows, self.cols
+
+    @property
+    def tumor_distance(self) -> NDArray:
+        """Chamfer distance from every site to the nearest tumor cell, shaped (depth, rows, cols)."""
+        tumor = (self.code == REGULAR_TUMOR) | (self.code == STEM_TUMOR)
+        return chamfer_distance_3d(tumor.reshape(self.shape))
+
+    def initialize_spheroid(self, radius: int, center: tuple[int, int, int] = None):
+        """
+        Fill a ball of tumor cells, half regular and half stem cells on average.
+
+        Args:
+            radius (int): Radius of the ball.
+            center (tuple): (z, x, y) center, the center of the lattice if None.
+        """
+        center = tuple(size // 2 for size in self.shape) if center is None else center
+        ranges = [np.arange(max(c - radius, 0), min(c + radius + 1, size)) for c, size in zip(center, self.shape)]
+        z, x, y = np.meshgrid(*ranges, indexing="ij")
+        inside = (z - center[0]) ** 2 + (x - center[1]) ** 2 + (y - center[2]) ** 2 <= radius ** 2
+        sites = np.ravel_multi_index((z[inside], x[inside], y[inside]), self.shape)
+        n = len(sites)
+        codes = np.where(self.rng.generator.random(n) < 0.5, REGULAR_TUMOR, STEM_TUMOR)
+        for field in self.STATE_FIELDS:
+            getattr(self, field)[sites] = 0
+        self.code[sites] = codes
+        self.p_remaining[sites] = np.where(codes == REGULAR_TUMOR, RegularTumorCell.MAX_DIVISIONS, 0)
+        self.chemotherapy_resistance[sites] = self.rng.generator.random(n) ** 2
@@ -2,23 +2,26 @@
 import sys
 
 from PyQt5.QtWidgets import (
-    QApplication, QGraphicsScene, QGraphicsView, QGraphicsRectItem, 
+    QApplication, QGraphicsScene, QGraphicsView, QGraphicsPixmapItem, QGraphicsPathItem, QToolTip,
     QMainWindow, QLabel, QVBoxLayout, QWidget, QPushButton, QHBoxLayout,
     QGroupBox, QSlider, QSpinBox, QFormLayout, QFrame, QSizePolicy,
     QMessageBox, QFileDialog, QInputDialog, QDoubleSpinBox, QCheckBox,
     QGridLayout
 )
 from PyQt5.QtCore import Qt, QTimer
-from PyQt5.QtGui import QColor, QBrush, QPen, QFont
+from PyQt5.QtGui import QColor, QBrush, QPen, QFont, QPixmap
 import json
 from cells import Cell
 from cells import Cell, RegularTumorCell, StemTumorCell, ImmuneCell
-from grid import Grid
-import numpy as np
+from simulation import Simulation, DEFAULT_PARAMETERS, apply_parameters
 from cell_editor import CellEditor
+from renderer import GridRenderer, grid_lines_path
+from simulation_worker import SimulationWorker, Snapshot
 
 
 class TumorGrowthWindow(QMainWindow):
+    FRAME_RATE = 30
+
     def __init__(self, grid_size=50, num_steps=100, update_interval=150):
         super().__init__()
         self.setWindowTitle("Tumor Growth Simulation")
@@ -86,6 +89,9 @@ class TumorGrowthWindow(QMainWindow):
         self.current_step = 0
         self.update_interval = update_interval
         self.running = True
+        # Steps the simulation on its own thread, the timer below only draws its snapshots.
+        self.worker = SimulationWorker(num_steps=num_steps, step_interval=update_interval / 1000,
+                                       frame_interval=1 / self.FRAME_RATE)
 
         self.edit_mode = None
         
@@ -97,7 +103,10 @@ class TumorGrowthWindow(QMainWindow):
         
 
         
-        self.cell_size = min(600 // grid_size, 20)
+        self.cell_size = min(600 / grid_size, 20)
+        self.renderer = GridRenderer()
+        self.pixmap_item = None
+        self.grid_lines_item = None
 
         main_layout = QHBoxLayout()
         
@@ -149,7 +158,7 @@ class TumorGrowthWindow(QMainWindow):
 
         grid_size_layout = QFormLayout()
         self.grid_size_spinbox = QSpinBox()
-        self.grid_size_spinbox.setRange(10, 200)
+        self.grid_size_spinbox.setRange(10, 1000)
         self.grid_size_spinbox.setValue(grid_size)
         self.grid_size_spinbox.setSingleStep(5)
         grid_size_layout.addRow("Grid Size:", self.grid_size_spinbox)
@@ -162,6 +171,8 @@ class TumorGrowthWindow(QMainWindow):
         self.speed_slider.setValue(update_interval)
         self.speed_slider.setInvertedAppearance(True)  # Lower value = faster speed
         speed_layout.addRow("Speed:", self.speed_slider)
+        self.fast_checkbox = QCheckBox("As fast as possible")
+        speed_layout.addRow(self.fast_checkbox)
         options_layout.addLayout(speed_layout)
         
         # Initial counts control
@@ -216,6 +227,14 @@ class TumorGrowthWindow(QMainWindow):
         self.btn_remove.clicked.connect(lambda: self.set_edit_mode("remove"))
         controls_layout.addWidget(self.btn_remove)
 
+        self.profile_checkbox = QCheckBox("Profile steps")
+        self.profile_checkbox.toggled.connect(self.toggle_profiling)
+        controls_layout.addWidget(self.profile_checkbox)
+
+        self.btn_show_profile = QPushButton("Show Profile")
+        self.btn_show_profile.clicked.connect(self.show_profile)
+        controls_layout.addWidget(self.btn_show_profile)
+
         controls_group.setLayout(controls_layout)
         left_panel.addWidget(controls_group)
 
@@ -232,6 +251,7 @@ class TumorGrowthWindow(QMainWindow):
         self.view.setFrameStyle(QFrame.NoFrame)
         self.view.setMouseTracking(True)
         self.view.mousePressEvent = self.handle_click
+        self.view.mouseMoveEvent = self.handle_hover
 
         right_panel.addWidget(self.view)
 
@@ -461,12 +481,6 @@ class TumorGrowthWindow(QMainWindow):
         chemo_group.setLayout(chemo_layout)
         global_params_layout.addWidget(chemo_group, 1, 1)
 
-        self.immunotherapy_active = False
-        self.immunotherapy_start_step = 0
-        self.immunotherapy_duration = 50
-        self.immunotherapy_end_step = 0
-        self.immunotherapy_iteration_counter = 0
-
 
 ################################ Immunotherapy ##############################################################
         immuno_group = QGroupBox("Імунна терапія")
@@ -510,24 +524,33 @@ class TumorGrowthWindow(QMainWindow):
         self.create_visualization()
         self.grid_size_spinbox.valueChanged.connect(self.update_grid_size)
         self.speed_slider.valueChanged.connect(self.update_speed)
+        self.fast_checkbox.toggled.connect(self.update_speed)
+        for widget in (self.chemo_every_n_checkbox, self.immuno_every_n_checkbox):
+            widget.toggled.connect(self.update_therapy_settings)
+        for widget in (self.chemo_interval_spinbox, self.immuno_interval_spinbox, self.immuno_duration_spinbox):
+            widget.valueChanged.connect(self.update_therapy_settings)
         self.initial_tumor_radius.valueChanged.connect(self.update_initial_settings)
         self.initial_immune_count.valueChanged.connect(self.update_initial_settings)
         self.timer = QTimer()
-        self.timer.timeout.connect(self.update_simulation)
-        self.timer.start(self.update_interval)
+        self.timer.timeout.connect(self.render_frame)
+        self.timer.start(int(1000 / self.FRAME_RATE))
+        self.worker.set_running(self.running)
+        self.worker.start()
         self.resize(1300, 700)
 
     def init_grid(self, size):
         """Initialize the grid and cell visualization"""
 
         self.grid_size = size
-        self.cell_size = min(600 // size, 20)
-
-        self.grid = Grid(size, size)
-        center = size // 2
-        self.initialize_tumor(center, center)
+        self.cell_size = min(600 / size, 20)
 
-        self.cell_items = [[None for _ in range(size)] for _ in range(size)]
+        with self.worker.lock:
+            self.simulation = Simulation(size, initial_tumor_radius=self.initial_tumor_radius.value())
+            self.grid = self.simulation.grid
+            self.update_therapy_settings()
+            if self.profile_checkbox.isChecked():
+                self.simulation.enable_profiling()
+            self.worker.set_simulation(self.simulation)
 
     def update_grid_size(self):
         """Handle grid size change"""
@@ -541,46 +564,64 @@ class TumorGrowthWindow(QMainWindow):
             self.status_label.setText(f"Step: 0, Cells: {self.grid.num_cells}")
 
     def create_visualization(self):
-        """Create the visual representation of the grid"""
-        for i in range(self.grid_size):
-            for j in range(self.grid_size):
-                rect = QGraphicsRectItem(j * self.cell_size, i * self.cell_size, self.cell_size, self.cell_size)
-                rect.setAcceptHoverEvents(True)
-                cell = self.grid.cells.get((i, j))
-                if cell:
-                    color = self.get_cell_color(cell)
-                else:
-                    color = QColor("#FFFFFF")
-                rect.setBrush(QBrush(color))
-                # rect.setPen(QPen(QColor("#333333"), 0.5))
-                rect.setPen(QPen(QColor("#333333"), self.grid_line_width))
-                self.scene.addItem(rect)
-                self.cell_items[i][j] = rect
+        """Create the visual representation of the grid: one scaled pixmap and a grid line overlay"""
+        self.pixmap_item = QGraphicsPixmapItem()
+        self.pixmap_item.setScale(self.cell_size)
+        self.pixmap_item.setTransformationMode(Qt.FastTransformation)
+        self.scene.addItem(self.pixmap_item)
+
+        self.grid_lines_item = QGraphicsPathItem(grid_lines_path(self.grid_size, self.grid_size, self.cell_size))
+        self.grid_lines_item.setCacheMode(QGraphicsPathItem.DeviceCoordinateCache)
+        self.scene.addItem(self.grid_lines_item)
+        self.update_grid_lines()
+        self.scene.setSceneRect(0, 0, self.grid_size * self.cell_size, self.grid_size * self.cell_size)
+        self.pixmap_item.setPixmap(QPixmap.fromImage(self.renderer.render(self.grid)))
+
+    def update_grid_lines(self):
+        """Apply the line thickness to the grid line overlay, hidden if lines would cover the cells"""
+        if self.grid_lines_item is None:
+            return
+        self.grid_lines_item.setPen(QPen(QColor("#333333"), self.grid_line_width))
+        self.grid_lines_item.setVisible(self.grid_line_width > 0 and self.cell_size >= 3)
 
     def update_speed(self):
-        """Update the simulation speed"""
+        """Update the simulation speed; as fast as possible runs many steps per drawn frame"""
         self.update_interval = self.speed_slider.value()
-        self.timer.setInterval(self.update_interval)
-
-    def get_cell_color(self, cell):
-        """Get the color for a cell based on its type or JSON-defined color"""
-        if hasattr(cell, "color"):
-            return QColor(*cell.color)
-        
-        if isinstance(cell, RegularTumorCell):
-            return QColor("#FF5733")
-        elif isinstance(cell, StemTumorCell):
-            return QColor("#C70039")
-        elif isinstance(cell, ImmuneCell):
-            if cell.cell_type == 0:
-                return QColor("#33FF57")
-            elif cell.cell_type == 1:
-                return QColor("#33C1FF")
+        self.speed_slider.setEnabled(not self.fast_checkbox.isChecked())
+        self.worker.step_interval = 0 if self.fast_checkbox.isChecked() else self.update_interval / 1000
+
+    def toggle_profiling(self, enabled):
+        """Start or stop recording the time of every step phase and cell class"""
+        with self.worker.lock:
+            if enabled:
+                self.simulation.enable_profiling()
             else:
-                return QColor("#00FFFF")
-        else:
-            return QColor("#000000")
+                self.simulation.disable_profiling()
+
+    def show_profile(self):
+        """Show the step profile recorded since profiling was enabled"""
+        with self.worker.lock:
+            profiler = self.simulation.grid.profiler
+            text = profiler.format() if profiler is not None else "Profiling is off."
+        msg = QMessageBox(self)
+        msg.setWindowTitle("Step Profile")
+        msg.setStyleSheet("QLabel { color: black; font-family: monospace; }")
+        msg.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        msg.setText(text)
+        msg.exec_()
 
+    def update_therapy_settings(self):
+        """Pass the automatic therapy settings to the running simulation"""
+        if not hasattr(self, "simulation"):
+            return
+        with self.worker.lock:
+            self.simulation.chemo_interval = (
+                self.chemo_interval_spinbox.value() if self.chemo_every_n_checkbox.isChecked() else None
+            )
+            self.simulation.immuno_interval = (
+                self.immuno_interval_spinbox.value() if self.immuno_every_n_checkbox.isChecked() else None
+            )
+            self.simulation.immunotherapy_duration = self.immuno_duration_spinbox.value()
 
     def set_edit_mode(self, mode):
         if mode == "add":
@@ -639,6 +680,7 @@ class TumorGrowthWindow(QMainWindow):
     def toggle_simulation(self):
         """Pause or resume the simulation"""
         self.running = not self.running
+        self.worker.set_running(self.running)
         self.btn_toggle.setText("Resume" if not self.running else "Pause")
         self.btn_toggle.setStyleSheet("background-color: #007ACC;" if self.running else "background-color: #CC7A00;")
 
@@ -650,9 +692,10 @@ class TumorGrowthWindow(QMainWindow):
     def update_line_thickness(self):
         """Оновити товщину меж клітинок."""
         self.grid_line_width = self.line_width_slider.value() / 10.0
-        self.update_view()
+        self.update_grid_lines()
 
     def regenerate(self):
+        self.worker.set_running(False)
         self.scene.clear()
         # очистити стару
 
@@ -664,7 +707,6 @@ class TumorGrowthWindow(QMainWindow):
         self.create_visualization()
         self.current_step = 0
         self.update_view()
-        self.update_cell_counts()
         self.status_label.setText(f"Step: 0, Cells: {self.grid.num_cells}")
 
         self.running = False
@@ -672,11 +714,9 @@ class TumorGrowthWindow(QMainWindow):
         self.btn_toggle.setStyleSheet("background-color: #CC7A00;")
 
     def handle_click(self, event):
-        pos = self.view.mapToScene(event.pos())
-        row = int(pos.y() // self.cell_size)
-        col = int(pos.x() // self.cell_size)
-
-        if 0 <= row < self.grid_size and 0 <= col < self.grid_size:
+        position = self.site_at(event.pos())
+        if position is not None:
+            row, col = position
             if event.button() == Qt.RightButton:
                 self.show_cell_info((row, col))
             elif self.edit_mode == "add":
@@ -687,20 +727,21 @@ class TumorGrowthWindow(QMainWindow):
                     cell_type, ok = QInputDialog.getItem(self, "Select Cell Type", "Choose cell type to add:", all_options, 0, False)
                     if ok:
                         pos = (row, col)
+                        rng = self.grid.rng
                         cell = None
                         if cell_type == "Generic":
-                            cell = Cell(pos)
+                            cell = Cell(pos, rng=rng)
                         elif cell_type == "Regular Tumor":
-                            cell = RegularTumorCell(pos)
+                            cell = RegularTumorCell(pos, rng=rng)
                         elif cell_type == "Stem Tumor":
-                            cell = StemTumorCell(pos)
+                            cell = StemTumorCell(pos, rng=rng)
                         elif cell_type == "Immune (Type 0)":
-                            cell = ImmuneCell(pos, cell_type=0)
+                            cell = ImmuneCell(pos, cell_type=0, rng=rng)
                         elif cell_type == "Immune (Type 1)":
-                            cell = ImmuneCell(pos, cell_type=1)
+                            cell = ImmuneCell(pos, cell_type=1, rng=rng)
                         elif cell_type in custom_options:
                             template = self.custom_cell_templates[cell_type]
-                            cell = ImmuneCell(pos, cell_type=template["cell_type"])
+                            cell = ImmuneCell(pos, cell_type=template["cell_type"], rng=rng)
                             cell.name = cell_type
                             cell.color = template["color"]
                             rates = template.get("rates", {})
@@ -710,164 +751,96 @@ class TumorGrowthWindow(QMainWindow):
                                 "migration": rates.get("migration", 0.1),
                             }
                     if cell:
-                        self.grid.add_cell(cell)
+                        with self.worker.lock:
+                            if not self.grid.grid[row, col]:
+                                self.grid.add_cell(cell)
                         self.update_view()
             elif self.edit_mode == "remove":
                 if self.grid.grid[row, col]:
-                    self.grid.remove_cell_at((row, col))
+                    with self.worker.lock:
+                        self.grid.remove_cell_at((row, col))
                     self.update_view()
 
-    def initialize_tumor(self, center_x, center_y, initial_radius=3, num_NK_cells=10, num_CTL_cells=10):
-        """Initialize tumor cells in a circular pattern at the center."""
-        for i in range(self.grid.rows):
-            for j in range(self.grid.cols):
-                distance = np.sqrt((i - center_x) ** 2 + (j - center_y) ** 2)
-                if distance <= initial_radius:
-                    rand = np.random.random()
-                    if rand < 0.5:
-                        self.grid.add_cell(RegularTumorCell((i, j)))
-                    else:
-                        self.grid.add_cell(StemTumorCell((i, j)))
-
-        # corners = [(0, 0), (0, self.grid_size - 1), (self.grid_size - 1, 0), (self.grid_size - 1, self.grid_size - 1)]
-        # edges = [(0, y) for y in range(1, self.grid_size - 1)] + \
-        #         [(self.grid_size - 1, y) for y in range(1, self.grid_size - 1)] + \
-        #         [(x, 0) for x in range(1, self.grid_size - 1)] + \
-        #         [(x, self.grid_size - 1) for x in range(1, self.grid_size - 1)]
-        # all_positions = corners + edges
-        # num_positions = len(all_positions)
-
-        # nk_per_position = num_NK_cells // num_positions
-        # ctl_per_position = num_CTL_cells // num_positions
-        # nk_remainder = num_NK_cells % num_positions
-        # ctl_remainder = num_CTL_cells % num_positions
-
-        # positions = []
-        # for i, pos in enumerate(all_positions):
-        #     for _ in range(nk_per_position + (1 if i < nk_remainder else 0)):
-        #         positions.append((pos, 0))  # 0 для NK-клітин
-        #     for _ in range(ctl_per_position + (1 if i < ctl_remainder else 0)):
-        #         positions.append((pos, 1))  # 1 для CTL-клітин
-
-        # random.shuffle(positions)
-
-        # for pos, cell_type in positions:
-        #     if not self.grid.grid[pos[0], pos[1]]:
-        #         self.grid.add_cell(ImmuneCell(pos, cell_type))
-
-
-    def update_simulation(self):
-        if self.chemo_every_n_checkbox.isChecked():
-            interval = self.chemo_interval_spinbox.value()
-            if self.current_step % interval == 0:
-                self.grid.apply_chemotherapy()
-
-        if not self.running or self.current_step >= self.num_steps:
-            return
-        if self.immuno_every_n_checkbox.isChecked():
-            interval = self.immuno_interval_spinbox.value()
-            if self.immunotherapy_iteration_counter % interval == 0:
-                self.start_immunotherapy()
-
-        if self.immunotherapy_active:
-            # self.grid.apply_immunotherapy() 
-            self.immunotherapy_iteration_counter += 1
-            if self.immunotherapy_iteration_counter >= self.immunotherapy_duration :
-                self.immunotherapy_active = False
-                
-                self.grid.reset_all_immune_cells()
-
-        self.grid.make_action()
-        self.current_step += 1
-        self.update_view()
-        self.update_cell_counts()
-        self.status_label.setText(f"Step: {self.current_step}, Cells: {self.grid.num_cells}")
+    def render_frame(self):
+        """Draw the latest snapshot published by the simulation thread, if there is a new one"""
+        snapshot = self.worker.take_snapshot()
+        if snapshot is not None:
+            self.show_snapshot(snapshot)
+
+    def show_snapshot(self, snapshot: Snapshot):
+        """Draw a snapshot: grid image, cell counts and status"""
+        if self.pixmap_item is not None:
+            self.pixmap_item.setPixmap(QPixmap.fromImage(self.renderer.render_codes(snapshot.codes, snapshot.colors)))
+        self.update_cell_counts(snapshot.counts, snapshot.custom_counts)
+        self.current_step = snapshot.step
+        self.status_label.setText(f"Step: {snapshot.step}, Cells: {snapshot.num_cells}")
 
     def apply_chemo_once(self):
         """Apply chemotherapy manually."""
-        self.grid.apply_chemotherapy()
+        with self.worker.lock:
+            self.simulation.apply_chemotherapy()
         self.update_view()
         # QMessageBox.information(self, "Хіміотерапія", "Хіміотерапію застосовано.")
 
 
-    def update_cell_counts(self):
-        """Update cell count labels with current counts"""
-        custom_counts = {}
-
-        # Count each cell type
-        regular_tumor = 0
-        stem_tumor = 0
-        immune_type0 = 0
-        immune_type1 = 0
-        generic = 0
-
-        for cell in self.grid.cells.values():
-            if isinstance(cell, RegularTumorCell):
-                regular_tumor += 1
-            elif isinstance(cell, StemTumorCell):
-                stem_tumor += 1
-            elif isinstance(cell, ImmuneCell):
-                if cell.cell_type == 0:
-                    immune_type0 += 1
-                elif cell.cell_type == 1:
-                    immune_type1 += 1
-            else:
-                generic += 1
-
-            
-            if hasattr(cell, "name"):
-                name = cell.name
-                custom_counts[name] = custom_counts.get(name, 0) + 1
+    def update_cell_counts(self, counts: dict, custom_counts: dict):
+        """Update cell count labels with the given counts"""
+        self.regular_tumor_count.setText(str(counts["regular_tumor"]))
+        self.stem_tumor_count.setText(str(counts["stem_tumor"]))
+        self.immune_type0_count.setText(str(counts["immune_type0"]))
+        self.immune_type1_count.setText(str(counts["immune_type1"]))
+        # self.generic_count.setText(str(counts["generic"]))
 
         for name, count in custom_counts.items():
             if name not in self.custom_cell_labels:
                 label = QLabel("0")
+                template = self.custom_cell_templates.get(name)
+                if template:
+                    color = template["color"]
+                    label.setStyleSheet(f"color: rgb({color[0]}, {color[1]}, {color[2]});")
                 self.custom_cell_labels[name] = label
                 self.counts_layout.addRow(f"{name}:", label)
             self.custom_cell_labels[name].setText(str(count))
-        self.regular_tumor_count.setText(str(regular_tumor))
-        self.stem_tumor_count.setText(str(stem_tumor))
-        self.immune_type0_count.setText(str(immune_type0))
-        self.immune_type1_count.setText(str(immune_type1))
-        # self.generic_count.setText(str(generic))
-
-        for name, count in custom_counts.items():
-            if name not in self.custom_cell_labels:
-                label = QLabel("0")
-                self.custom_cell_labels[name] = label
-                self.counts_layout.addRow(f"{name}:", label)
-
-            label = self.custom_cell_labels[name]
-            label.setText(str(count))
-
-            # оновлюй колір
-            for cell in self.grid.cells.values():
-                if hasattr(cell, "name") and cell.name == name and hasattr(cell, "color"):
-                    color = cell.color
-                    label.setStyleSheet(f"color: rgb({color[0]}, {color[1]}, {color[2]});")
-                    break
+        for name, label in self.custom_cell_labels.items():
+            if name not in custom_counts:
+                label.setText("0")
 
 
     def update_view(self):
-        for i in range(self.grid_size):
-            for j in range(self.grid_size):
-                if 0<=i < len(self.cell_items) and 0<= j < len(self.cell_items[i]) and self.cell_items[i][j] is not None:
-                    cell = self.grid.cells.get((i, j))
-                    if cell:
-                        color = self.get_cell_color(cell)
-                        tooltip = ""
-                        if hasattr(cell, "rates") and isinstance(cell.rates, dict):
-                            tooltip = (
-                                f"A: {cell.rates.get('apoptosis', 0):.2f}, "
-                                f"P: {cell.rates.get('proliferation', 0):.2f}, "
-                                f"M: {cell.rates.get('migration', 0):.2f}"
-                            )
-                        self.cell_items[i][j].setToolTip(tooltip)
-                    else:
-                        color = QColor("#FFFFFF")
-                    self.cell_items[i][j].setBrush(QBrush(color))
-                    self.cell_items[i][j].setPen(QPen(QColor("#333333"), self.grid_line_width))
-        self.update_cell_counts()
+        """Redraw the grid image and the cell counts from the current state of the simulation"""
+        with self.worker.lock:
+            snapshot = Snapshot.capture(self.simulation)
+        self.show_snapshot(snapshot)
+
+    def site_at(self, view_pos):
+        """Return the (row, col) of the site under a position in view coordinates, None outside the grid"""
+        pos = self.view.mapToScene(view_pos)
+        row = int(pos.y() // self.cell_size)
+        col = int(pos.x() // self.cell_size)
+        if 0 <= row < self.grid_size and 0 <= col < self.grid_size:
+            return row, col
+        return None
+
+    def handle_hover(self, event):
+        """Show the rates of a custom cell under the mouse"""
+        position = self.site_at(event.pos())
+        rates = None
+        if position:
+            # The worker thread moves and replaces cells while it steps the simulation.
+            with self.worker.lock:
+                cell = self.grid.cells.get(position)
+                if cell is not None and isinstance(getattr(cell, "rates", None), dict):
+                    rates = dict(cell.rates)
+        if rates is not None:
+            tooltip = (
+                f"A: {rates.get('apoptosis', 0):.2f}, "
+                f"P: {rates.get('proliferation', 0):.2f}, "
+                f"M: {rates.get('migration', 0):.2f}"
+            )
+            QToolTip.showText(event.globalPos(), tooltip, self.view)
+        else:
+            QToolTip.hideText()
+        QGraphicsView.mouseMoveEvent(self.view, event)
 
     def load_ai_cell(self):
         """Load a cell from a JSON file and save its template for future placement"""
@@ -903,12 +876,14 @@ class TumorGrowthWindow(QMainWindow):
 
 
     def show_cell_info(self, position):
-        cell = self.grid.cells.get(position)
+        with self.worker.lock:
+            cell = self.grid.cells.get(position)
+            attributes = dict(cell.__dict__) if cell else {}
         if not cell:
             QMessageBox.information(self, "Cell Info", "No cell at this position.")
             return
-        info_lines = [f"Position: {cell.position}", f"Class: {cell.__class__.__name__}"]
-        for key, value in cell.__dict__.items():
+        info_lines = [f"Position: {attributes['position']}", f"Class: {cell.__class__.__name__}"]
+        for key, value in attributes.items():
             info_lines.append(f"{key}: {value}")
         cls = cell.__class__
         class_attrs = ['RATES', 'PROLIFERATION_DECREASE', 'DEATH_CHEMOTHERAPY_CHANCE', 'MAX_DIVISIONS']
@@ -926,26 +901,9 @@ class TumorGrowthWindow(QMainWindow):
 
     def initialize_default_parameters(self):
         """Set default parameters for all cell types"""
-        # Default values
-        rtc_apop = 0.05
-        rtc_prolif = 0.25
-        rtc_mig = 0.05
-        rtc_max_divisions = 5
-        rtc_prolif_decrease = 0.3
-        rtc_chemo_death_chance = 0.15
-
-        stc_apop = 0.0
-        stc_prolif = 0.25
-        stc_mig = 0.05
-        stc_sym_division_rate = 0.1
-        stc_prolif_decrease = 0.2
-        stc_chemo_death_chance = 0.12
-
-        immune_apop = 0.08
-        immune_prolif = 0.15
-        immune_mig = 0.3
-        immune_prolif_decrease = 0.16
-        immune_chemo_death_chance = 0.1
+        rtc = DEFAULT_PARAMETERS["regular_tumor"]
+        stc = DEFAULT_PARAMETERS["stem_tumor"]
+        immune = DEFAULT_PARAMETERS["immune"]
 
         # Block signals for individual controls
         spinboxes = [
@@ -962,58 +920,34 @@ class TumorGrowthWindow(QMainWindow):
             spinbox.blockSignals(True)
 
         # Regular Tumor Cell UI elements
-        self.rtc_apoptosis.setValue(rtc_apop)
-        self.rtc_proliferation.setValue(rtc_prolif)
-        self.rtc_migration.setValue(rtc_mig)
-        self.rtc_max_divisions.setValue(rtc_max_divisions)
-        self.rtc_prolif_decrease.setValue(rtc_prolif_decrease)
-        self.rtc_chemo_chance.setValue(rtc_chemo_death_chance)
+        self.rtc_apoptosis.setValue(rtc["apoptosis_rate"])
+        self.rtc_proliferation.setValue(rtc["proliferation_rate"])
+        self.rtc_migration.setValue(rtc["migration_rate"])
+        self.rtc_max_divisions.setValue(rtc["max_divisions"])
+        self.rtc_prolif_decrease.setValue(rtc["proliferation_decrease_coef"])
+        self.rtc_chemo_chance.setValue(rtc["death_chemotherapy_chance"])
 
         # Stem Tumor Cell UI elements
-        self.stc_apoptosis.setValue(stc_apop)
-        self.stc_proliferation.setValue(stc_prolif)
-        self.stc_migration.setValue(stc_mig)
-        self.stc_sym_division.setValue(stc_sym_division_rate)
-        self.stc_prolif_decrease.setValue(stc_prolif_decrease)
-        self.stc_chemo_chance.setValue(stc_chemo_death_chance)
+        self.stc_apoptosis.setValue(stc["apoptosis_rate"])
+        self.stc_proliferation.setValue(stc["proliferation_rate"])
+        self.stc_migration.setValue(stc["migration_rate"])
+        self.stc_sym_division.setValue(stc["symmetrical_division_rate"])
+        self.stc_prolif_decrease.setValue(stc["proliferation_decrease_coef"])
+        self.stc_chemo_chance.setValue(stc["death_chemotherapy_chance"])
 
         # Immune Cell UI elements
-        self.im_apoptosis.setValue(immune_apop)
-        self.im_proliferation.setValue(immune_prolif)
-        self.im_migration.setValue(immune_mig)
-        self.im_prolif_decrease.setValue(immune_prolif_decrease)
-        self.im_chemo_chance.setValue(immune_chemo_death_chance)
+        self.im_apoptosis.setValue(immune["apoptosis_rate"])
+        self.im_proliferation.setValue(immune["proliferation_rate"])
+        self.im_migration.setValue(immune["migration_rate"])
+        self.im_prolif_decrease.setValue(immune["proliferation_decrease_coef"])
+        self.im_chemo_chance.setValue(immune["death_chemotherapy_chance"])
 
         for spinbox in spinboxes:
             spinbox.blockSignals(False)
 
         self.blockSignals(False)
         # Apply to cell classes
-        RegularTumorCell.set_constants(
-            apoptosis_rate=rtc_apop,
-            proliferation_rate=rtc_prolif,
-            migration_rate=rtc_mig,
-            max_divisions=rtc_max_divisions,
-            proliferation_decrease_coef=rtc_prolif_decrease,
-            death_chemotherapy_chance=rtc_chemo_death_chance
-        )
-
-        StemTumorCell.set_constants(
-            apoptosis_rate=stc_apop,
-            proliferation_rate=stc_prolif,
-            migration_rate=stc_mig,
-            symmetrical_division_rate=stc_sym_division_rate,
-            proliferation_decrease_coef=stc_prolif_decrease,
-            death_chemotherapy_chance=stc_chemo_death_chance
-        )
-
-        ImmuneCell.set_constants(
-            apoptosis_rate=immune_apop,
-            proliferation_rate=immune_prolif,
-            migration_rate=immune_mig,
-            proliferation_decrease_coef=immune_prolif_decrease,
-            death_chemotherapy_chance=immune_chemo_death_chance
-        )
+        apply_parameters(DEFAULT_PARAMETERS)
 
     def apply_cell_parameters(self):
         """Apply parameters to the all cell type"""
@@ -1101,41 +1035,44 @@ class TumorGrowthWindow(QMainWindow):
             return
 
 
-        # Apply parameters to each cell type
-        RegularTumorCell.set_constants(
-            apoptosis_rate=rtc_apop,
-            proliferation_rate=rtc_prolif,
-            migration_rate=rtc_mig,
-            max_divisions=rtc_max_divisions,
-            proliferation_decrease_coef=rtc_prolif_decrease,
-            death_chemotherapy_chance=rtc_chemo_chance
-        )
-
-        StemTumorCell.set_constants(
-            apoptosis_rate=stc_apop,
-            proliferation_rate=stc_prolif,
-            migration_rate=stc_mig,
-            symmetrical_division_rate=stc_sym_division,
-            proliferation_decrease_coef=stc_prolif_decrease,
-            death_chemotherapy_chance=stc_chemo_chance
-        )
-
-        ImmuneCell.set_constants(
-            apoptosis_rate=i_apop,
-            proliferation_rate=i_prolif,
-            migration_rate=i_mig,
-            proliferation_decrease_coef=i_prolif_decrease,
-            death_chemotherapy_chance=i_chemo_chance
-        )
+        # Apply parameters to each cell type, between steps of the simulation thread
+        with self.worker.lock:
+            RegularTumorCell.set_constants(
+                apoptosis_rate=rtc_apop,
+                proliferation_rate=rtc_prolif,
+                migration_rate=rtc_mig,
+                max_divisions=rtc_max_divisions,
+                proliferation_decrease_coef=rtc_prolif_decrease,
+                death_chemotherapy_chance=rtc_chemo_chance
+            )
+
+            StemTumorCell.set_constants(
+                apoptosis_rate=stc_apop,
+                proliferation_rate=stc_prolif,
+                migration_rate=stc_mig,
+                symmetrical_division_rate=stc_sym_division,
+                proliferation_decrease_coef=stc_prolif_decrease,
+                death_chemotherapy_chance=stc_chemo_chance
+            )
+
+            ImmuneCell.set_constants(
+                apoptosis_rate=i_apop,
+                proliferation_rate=i_prolif,
+                migration_rate=i_mig,
+                proliferation_decrease_coef=i_prolif_decrease,
+                death_chemotherapy_chance=i_chemo_chance
+            )
+
+    def closeEvent(self, event):
+        """Stop the simulation thread with the window"""
+        self.timer.stop()
+        self.worker.stop()
+        super().closeEvent(event)
 
     def start_immunotherapy(self):
         """Start immunotherapy for a specific duration."""
-        self.immunotherapy_active = True
-        self.immunotherapy_start_step = self.current_step
-        self.immunotherapy_duration = self.immuno_duration_spinbox.value()
-        self.immunotherapy_end_step = self.immunotherapy_start_step + self.immunotherapy_duration
-        self.immunotherapy_iteration_counter = 0  # Скидання лічильника
-        self.grid.apply_immunotherapy()
+        with self.worker.lock:
+            self.simulation.start_immunotherapy(self.immuno_duration_spinbox.value())
         self.update_view()
         # QMessageBox.information(self, "Імунна терапія", "Терапію розпочато!")
 